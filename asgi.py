@@ -0,0 +1,7 @@
+from example_app.asgi import application
+
+
+if __name__ == "__main__":
+    import uvicorn  # 可选依赖，pip install uvicorn
+
+    uvicorn.run(application)
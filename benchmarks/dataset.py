@@ -0,0 +1,125 @@
+"""seeded synthetic dataset for User, Role, user_role and Article
+
+    python -m benchmarks.dataset /tmp/bench.db --users 100000 --articles 1000000
+
+the same seed and sizes always produce the same rows.
+"""
+import argparse
+import datetime
+import random
+import time
+
+from sqlalchemy import create_engine
+
+from example_app.extensions import db
+from example_app.models import Article, Role, User, user_role
+
+TAGS = ["python", "flask", "graphql", "sqlalchemy", "sqlite", "web", "api", "orm"]
+WORDS = ["fast", "slow", "query", "cache", "index", "page", "node", "batch", "join", "plan"]
+START = datetime.datetime(2020, 1, 1)
+CHUNK = 10000
+
+
+def _chunks(total, build):
+    """build rows of [start, end) lazily, 1M articles are not kept in memory"""
+    for start in range(0, total, CHUNK):
+        yield build(start, min(start + CHUNK, total))
+
+
+def generate(engine, users=1000, roles=50, articles=10000, max_roles=3, seed=0):
+    """create tables and insert rows
+
+    Arguments:
+        engine {Engine} -- empty database
+        users {int} -- number of users
+        roles {int} -- number of roles
+        articles {int} -- number of articles, authors are random users
+        max_roles {int} -- each user has 1 to max_roles roles
+        seed {int} -- random seed
+
+    Returns:
+        dict -- sizes of the dataset
+    """
+    rng = random.Random(seed)
+    db.metadata.create_all(engine)
+    with engine.connect() as connection:
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("PRAGMA journal_mode=MEMORY")
+        with connection.begin():
+            connection.execute(
+                Role.__table__.insert(),
+                [{"id": i, "name": "role-%d" % i} for i in range(1, roles + 1)],
+            )
+            for rows in _chunks(
+                users,
+                lambda start, end: [
+                    {"id": i, "name": "user-%d" % i, "password": "pwd-%d" % i}
+                    for i in range(start + 1, end + 1)
+                ],
+            ):
+                connection.execute(User.__table__.insert(), rows)
+            links = 0
+            for start in range(0, users, CHUNK):
+                rows = []
+                for user_id in range(start + 1, min(start + CHUNK, users) + 1):
+                    count = rng.randint(1, min(max_roles, roles))
+                    for role_id in rng.sample(range(1, roles + 1), count):
+                        rows.append({"user_id": user_id, "role_id": role_id})
+                connection.execute(user_role.insert(), rows)
+                links += len(rows)
+
+            def build_articles(start, end):
+                rows = []
+                for i in range(start + 1, end + 1):
+                    created = START + datetime.timedelta(seconds=i * 60)
+                    rows.append(
+                        {
+                            "id": i,
+                            "title": "%s %s %d" % (rng.choice(WORDS), rng.choice(WORDS), i),
+                            "description": "description of article %d" % i,
+                            "author_id": rng.randint(1, users),
+                            "tags": ",".join(rng.sample(TAGS, 2)),
+                            "text": " ".join(rng.choice(WORDS) for _ in range(40)),
+                            "create_time": created,
+                            "update_time": created + datetime.timedelta(seconds=rng.randint(0, 86400)),
+                        }
+                    )
+                return rows
+
+            for rows in _chunks(articles, build_articles):
+                connection.execute(Article.__table__.insert(), rows)
+        connection.execute("ANALYZE")
+    return {"users": users, "roles": roles, "user_role": links, "articles": articles, "seed": seed}
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--articles", type=int, default=10000)
+    parser.add_argument("--max-roles", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generate_from_args(engine, args):
+    return generate(
+        engine,
+        users=args.users,
+        roles=args.roles,
+        articles=args.articles,
+        max_roles=args.max_roles,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="sqlite file, must not exist")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    start = time.time()
+    sizes = generate_from_args(create_engine("sqlite:///" + args.path), args)
+    print("%s generated in %.1fs: %s" % (args.path, time.time() - start, sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""benchmark: json backends, compression and streaming of /graphql responses
+
+    python -m benchmarks.encoder --articles 50000
+    python -m benchmarks.encoder --database /tmp/bench.db --sizes 100 1000 10000
+
+the result of `articleList` pages is encoded with every json backend (stdlib json, orjson
+when installed) and compressed with gzip and br (when brotli is installed), latency is the
+best of 3 runs. the peak python memory of encoding the whole body is compared with a
+streamed encoding (iterencode in chunks) with tracemalloc.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import sqlalchemy
+
+from example_app.app import app, backend
+from example_app.extensions import db
+from example_app.scheme import schema
+from example_app.utils.encoder import ResponseEncoder, compressor, json_backends, orjson
+
+from .dataset import add_arguments, generate_from_args
+
+QUERY = "{ articleList(first: %d) { edges { node { id dbId title description tags text createTime updateTime } } } }"
+
+
+def result_of(query):
+    result = schema.execute(query, context_value={})
+    db.session.remove()
+    if result.errors:
+        raise result.errors[0]
+    return {"data": result.data}
+
+
+def best(function, number):
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1000
+
+
+def peak(function):
+    tracemalloc.start()
+    function()
+    _, size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / 1024.0 / 1024.0
+
+
+def compress(encoding, body, level):
+    compress, flush = compressor(encoding, level)
+    return compress(body) + flush()
+
+
+def drain(chunks):
+    for _ in chunks:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--database", help="use a generated dataset instead of generating one")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--number", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="encoder-bench-")
+    path = os.path.join(directory, "bench.db")
+    try:
+        if args.database:
+            shutil.copyfile(args.database, path)
+        else:
+            start = time.time()
+            engine = sqlalchemy.create_engine("sqlite:///" + path)
+            sizes = generate_from_args(engine, args)
+            engine.dispose()
+            print("dataset %s generated in %.1fs" % (sizes, time.time() - start))
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+        backend.result_cache = None
+        names = [name for name in json_backends if name != "orjson" or orjson is not None]
+        encoders = dict((name, ResponseEncoder(backend=name)) for name in names)
+        with app.app_context():
+            for size in args.sizes:
+                result = result_of(QUERY % size)
+                body = encoders[names[0]].dumps(result)
+                print("\n%d rows, %.1f KB" % (size, len(body) / 1024.0))
+                for name, encoder in encoders.items():
+                    print(
+                        "  %-8s encode %9.2f ms   streamed %9.2f ms"
+                        % (
+                            name,
+                            best(lambda: encoder.dumps(result), args.number),
+                            best(lambda: drain(encoder.chunked(encoder.iterencode(result))), args.number),
+                        )
+                    )
+                encoder = encoders[names[-1]]
+                for encoding in encoder.encodings:
+                    level = encoder.levels[encoding]
+                    compressed = compress(encoding, body, level)
+                    print(
+                        "  %-8s level %d %9.2f ms %9.1f KB %6.1f%%"
+                        % (
+                            encoding,
+                            level,
+                            best(lambda: compress(encoding, body, level), args.number),
+                            len(compressed) / 1024.0,
+                            len(compressed) * 100.0 / len(body),
+                        )
+                    )
+                print(
+                    "  peak memory whole body %.2f MB, streamed %.2f MB"
+                    % (
+                        peak(lambda: encoder.dumps(result)),
+                        peak(lambda: drain(encoder.chunked(encoder.iterencode(result)))),
+                    )
+                )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
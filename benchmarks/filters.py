@@ -0,0 +1,90 @@
+"""micro benchmark: compiled filter plans vs building conditions per filter
+
+    python -m benchmarks.filters [iterations]
+"""
+import sys
+import timeit
+
+from sqlalchemy import or_, not_
+
+from example_app.app import app
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.utils.query import filter_query
+
+FILTERS = [
+    {"key": "author_id", "op": ">", "val": 2},
+    [{"key": "title", "op": "starts", "val": "t3"}, {"key": "tags", "op": "in", "val": ["a", "b"]}],
+    {"key": "description", "op": "contains", "val": "x"},
+]
+
+
+def legacy_conditions(conditions, _filter, model):
+    """conditions of one filter before compiled plans"""
+    c = getattr(model, _filter.get("key"))
+    v = _filter.get("val")
+    op = _filter.get("op")
+    if not c or not op or not v:
+        pass
+    if op == "==":
+        conditions.append(c == v)
+    if op == "!=":
+        conditions.append(c != v)
+    if op == "<=":
+        conditions.append(c <= v)
+    if op == ">=":
+        conditions.append(c >= v)
+    if op == ">":
+        conditions.append(c > v)
+    if op == "<":
+        conditions.append(c < v)
+    if op == "starts":
+        conditions.append(c.ilike(v + "%"))
+    if op == "ends":
+        conditions.append(c.ilike("%" + v))
+    if op == "contains":
+        conditions.append(c.contains(v))
+    if op == "in":
+        conditions.append(c.in_(v))
+    if op == "notin":
+        conditions.append(not_(c.in_(v)))
+    return conditions
+
+
+def legacy_filter_query(query, model, filters):
+    """filter_query before compiled plans"""
+    for _filter in filters:
+        conditions = []
+        if isinstance(_filter, (list,)):
+            for __filter in _filter:
+                conditions = legacy_conditions(conditions, __filter, model)
+            query = query.filter(or_(*conditions))
+        if isinstance(_filter, (dict,)):
+            conditions = legacy_conditions(conditions, _filter, model)
+            query = query.filter(*conditions)
+    return query
+
+
+def bench(name, fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3))
+    print("%-28s %10.1f us/op" % (name, seconds / number * 1e6))
+
+
+def main(number=2000):
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(name="u", password="p"))
+        db.session.add(Article(title="t3", text="x", author_id=3))
+        db.session.commit()
+
+        bench("legacy build", lambda: legacy_filter_query(Article.query, Article, FILTERS), number)
+        bench("compiled build", lambda: filter_query(Article.query, Article, FILTERS), number)
+        bench("legacy build+execute", lambda: legacy_filter_query(Article.query, Article, FILTERS).all(), number // 4)
+        bench("compiled build+execute", lambda: filter_query(Article.query, Article, FILTERS).all(), number // 4)
+        relation = [{"key": "roles.name", "op": "==", "val": "admin"}]
+        bench("compiled relationship path", lambda: filter_query(User.query, User, relation).all(), number // 4)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,102 @@
+"""benchmark: read only rows vs ORM instances for big list pages
+
+    python -m benchmarks.rows --articles 200000
+    python -m benchmarks.rows --database /tmp/bench.db --sizes 100 1000 10000
+
+every page of `articleList` is executed with GRAPHQL_ROW_PATH off (ORM instances) and
+on (`__slots__` records of rows.py), latency is the best of 3 runs, peak python memory
+is measured in a separate run with tracemalloc. the result cache is disabled.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import sqlalchemy
+
+from example_app.app import app, backend
+from example_app.extensions import db
+from example_app.scheme import schema
+
+from .dataset import add_arguments, generate_from_args
+
+QUERIES = [
+    ("columns", "{ articleList(first: %d) { edges { node { id title updateTime } } } }"),
+    ("all columns", "{ articleList(first: %d) { edges { node { id dbId title description tags text authorId createTime updateTime } } } }"),
+    ("offset page", "{ articleList(limit: %d, offset: 100) { edges { node { id title } } } }"),
+]
+
+
+def execute(query):
+    result = schema.execute(query, context_value={})
+    db.session.remove()
+    if result.errors:
+        raise result.errors[0]
+    return result
+
+
+def measure(query, number):
+    seconds = min(timeit.repeat(lambda: execute(query), number=number, repeat=3)) / number
+    tracemalloc.start()
+    execute(query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds * 1000, peak / 1024.0 / 1024.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--database", help="use a generated dataset instead of generating one")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--number", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="rows-bench-")
+    path = os.path.join(directory, "bench.db")
+    try:
+        if args.database:
+            shutil.copyfile(args.database, path)
+        else:
+            start = time.time()
+            engine = sqlalchemy.create_engine("sqlite:///" + path)
+            sizes = generate_from_args(engine, args)
+            engine.dispose()
+            print("dataset %s generated in %.1fs" % (sizes, time.time() - start))
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+        backend.result_cache = None
+        with app.app_context():
+            print(
+                "%-12s %6s %12s %12s %8s %10s %10s %8s"
+                % ("query", "rows", "orm", "rows", "speedup", "orm mem", "rows mem", "saved")
+            )
+            for name, query in QUERIES:
+                for size in args.sizes:
+                    results = []
+                    for row_path in (False, True):
+                        app.config["GRAPHQL_ROW_PATH"] = row_path
+                        results.append(measure(query % size, args.number))
+                    (orm_ms, orm_mb), (rows_ms, rows_mb) = results
+                    print(
+                        "%-12s %6d %9.2f ms %9.2f ms %7.2fx %7.2f MB %7.2f MB %7.0f%%"
+                        % (
+                            name,
+                            size,
+                            orm_ms,
+                            rows_ms,
+                            orm_ms / rows_ms,
+                            orm_mb,
+                            rows_mb,
+                            (1 - rows_mb / orm_mb) * 100,
+                        )
+                    )
+            app.config["GRAPHQL_ROW_PATH"] = True
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
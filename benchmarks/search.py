@@ -0,0 +1,111 @@
+"""benchmark: full text index vs LIKE filters on Article
+
+    python -m benchmarks.search --articles 200000
+    python -m benchmarks.search --database /tmp/bench.db
+
+every case runs the LIKE filter (`contains`) and the fts5 filter (`search`) as a page of
+20 rows and as a count, and `articleSearch` ranked by bm25. LIKE matches substrings,
+the index matches words, so counts can differ for partial words.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+import sqlalchemy
+
+from example_app.app import app
+from example_app.extensions import db
+from example_app.models import Article
+from example_app.scheme import schema
+from example_app.utils.query import exact_count, filter_query
+from example_app.utils.search import search_indexes
+
+from .dataset import add_arguments, generate_from_args
+
+# name, column, words
+CASES = [
+    ("common word", "text", "cache"),
+    ("two words", "text", "cache index"),
+    ("rare title", "title", "%(rare)d"),
+    ("missing word", "text", "nosuchword"),
+]
+
+
+def like_filters(column, words):
+    return [{"key": column, "op": "contains", "val": word} for word in words.split()]
+
+
+def search_filters(column, words):
+    return [{"key": column, "op": "search", "val": words}]
+
+
+def bench(number, fn):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3))
+    return seconds / number * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--database", help="use a generated dataset instead of generating one")
+    parser.add_argument("--number", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="search-bench-")
+    path = os.path.join(directory, "bench.db")
+    try:
+        if args.database:
+            shutil.copyfile(args.database, path)
+        else:
+            start = time.time()
+            engine = sqlalchemy.create_engine("sqlite:///" + path)
+            sizes = generate_from_args(engine, args)
+            engine.dispose()
+            print("dataset %s generated in %.1fs" % (sizes, time.time() - start))
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+        with app.app_context():
+            start = time.time()
+            with db.engine.begin() as connection:
+                # 旧数据集没有索引
+                search_indexes[Article].rebuild(connection)
+            print("index rebuilt in %.1fs" % (time.time() - start))
+            rare = db.session.query(sqlalchemy.func.max(Article.id)).scalar() // 2
+            print("%-14s %-6s %12s %12s %10s %10s" % ("case", "column", "like page", "fts page", "like n", "fts n"))
+            for name, column, words in CASES:
+                words = words % {"rare": rare}
+                like = filter_query(Article.query, Article, like_filters(column, words))
+                search = filter_query(Article.query, Article, search_filters(column, words))
+                like_page = bench(args.number, lambda: like.limit(20).all())
+                search_page = bench(args.number, lambda: search.limit(20).all())
+                like_count = bench(args.number, lambda: exact_count(like, Article))
+                search_count = bench(args.number, lambda: exact_count(search, Article))
+                print(
+                    "%-14s %-6s %9.2f ms %9.2f ms %10d %10d   count %.2f ms / %.2f ms"
+                    % (
+                        name,
+                        column,
+                        like_page,
+                        search_page,
+                        exact_count(like, Article),
+                        exact_count(search, Article),
+                        like_count,
+                        search_count,
+                    )
+                )
+                db.session.remove()
+            query = "{ articleSearch(query: $q, limit: 20) { edges { node { id title } } } }"
+            query = "query ($q: String!) " + query
+            for name, _, words in CASES:
+                words = words % {"rare": rare}
+                ms = bench(args.number, lambda: schema.execute(query, variables={"q": words}, context_value={}))
+                db.session.remove()
+                print("articleSearch %-14s %9.2f ms" % (name, ms))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""startup benchmark: schema construction time for many models
+
+    python -m benchmarks.startup --models 10 100 300
+
+each size runs in a fresh process: synthetic models (columns, a foreign key and a
+relationship to the previous model) are defined, then Query, Mutation, Schema are built
+and prewarmed, then the first query is executed.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import types
+
+
+def define_models(count):
+    from example_app.extensions import db
+
+    module = types.ModuleType("bench_models")
+    previous = None
+    for i in range(count):
+        name = "Bench%d" % i
+        attrs = {
+            "__tablename__": "bench_%d" % i,
+            "id": db.Column(db.Integer, primary_key=True),
+            "name": db.Column(db.String(50), nullable=False),
+            "count": db.Column(db.Integer),
+            "score": db.Column(db.Float),
+            "created": db.Column(db.DateTime),
+        }
+        if previous is not None:
+            attrs["parent_id"] = db.Column(db.Integer, db.ForeignKey("%s.id" % previous.__tablename__))
+            attrs["parent"] = db.relationship(previous.__name__)
+        model = type(name, (db.Model,), attrs)
+        setattr(module, name, model)
+        previous = model
+    return module
+
+
+def child(count):
+    timings = {}
+    start = time.perf_counter()
+    import graphene
+    from example_app.utils import MutationObjectType, QueryObjectType
+    from example_app.utils.snapshot import prewarm
+
+    timings["import_ms"] = time.perf_counter() - start
+
+    stage = time.perf_counter()
+    module = define_models(count)
+    timings["models_ms"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    Query = type("Query", (QueryObjectType,), {"Meta": type("Meta", (), {"model_mudule": module})})
+    timings["query_type_ms"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    Mutation = type("Mutation", (MutationObjectType,), {"Meta": type("Meta", (), {"model_mudule": module})})
+    timings["mutation_type_ms"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    schema = graphene.Schema(query=Query, mutation=Mutation)
+    timings["schema_ms"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    prewarm(schema)
+    timings["prewarm_ms"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    result = schema.execute("{ __schema { types { name } } }")
+    timings["first_query_ms"] = time.perf_counter() - stage
+    timings["total_ms"] = time.perf_counter() - start
+    assert not result.errors, result.errors
+    return dict((key, round(value * 1000, 1)) for key, value in timings.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--output", help="write results as json")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child is not None:
+        print(json.dumps(child(args.child)))
+        return
+    results = []
+    columns = None
+    for count in args.models:
+        output = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.startup", "--child", str(count)]
+        )
+        timings = json.loads(output.decode("utf8").strip().splitlines()[-1])
+        if columns is None:
+            columns = list(timings)
+            print("%-8s" % "models" + "".join("%17s" % c for c in columns))
+        print("%-8d" % count + "".join("%17.1f" % timings[c] for c in columns))
+        results.append(dict(timings, models=count))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""graphql benchmark suite: a fixed catalog of operations on a seeded dataset
+
+    python -m benchmarks.suite --users 100000 --articles 1000000 --output results.json
+    python -m benchmarks.suite --database /tmp/bench.db --compare results.json
+
+every operation runs through `schema.execute` and through `/graphql` with the flask
+test client, latency percentiles, sql statements per operation and peak python memory
+are reported and written as json.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import sqlalchemy
+from graphql_relay import to_global_id
+from sqlalchemy import event
+
+from example_app.app import app, backend
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.scheme import schema
+from example_app.utils import SQLAlchemyObjectTypes
+from example_app.utils.cache import invalidation_hooks
+from example_app.utils.result_cache import LRUBackend, ResultCache
+
+from .dataset import add_arguments, generate_from_args
+
+ARTICLE_INPUT = '{title: "bench %(n)d", text: "bench text", authorId: "%(author)s"}'
+
+
+def global_id(model, _id):
+    return to_global_id(SQLAlchemyObjectTypes().get(model)._meta.name, _id)
+
+
+# name, query, variables(rng, sizes)
+CATALOG = [
+    (
+        "users_page",
+        "{ userList(first: 20) { edges { cursor node { id name } } pageInfo { hasNextPage } } }",
+        None,
+    ),
+    (
+        "articles_keyset_sorted",
+        "{ articleList(first: 50, sort: [CREATE_TIME_DESC]) { edges { node { id title createTime } } } }",
+        None,
+    ),
+    (
+        "articles_offset_deep",
+        "query ($offset: Int) { articleList(offset: $offset, limit: 20) { edges { node { id title } } } }",
+        lambda rng, sizes: {"offset": rng.randint(0, max(sizes["articles"] - 20, 0))},
+    ),
+    (
+        "articles_with_author",
+        "{ articleList(first: 50) { edges { node { title author { name } } } } }",
+        None,
+    ),
+    (
+        "users_roles_users",
+        "{ userList(first: 20) { edges { node { name roles { edges { node { name "
+        "users(first: 5) { edges { node { name } } } } } } } } } }",
+        None,
+    ),
+    (
+        "articles_filtered_count",
+        "query ($filters: GenericScalar) { articleList(first: 20, filters: $filters) "
+        "{ totalCount edges { node { id title tags } } } }",
+        lambda rng, sizes: {
+            "filters": [{"key": "tags", "op": "contains", "val": rng.choice(["python", "flask", "orm"])}]
+        },
+    ),
+    (
+        "users_by_role_path",
+        "query ($filters: GenericScalar) { userList(first: 20, filters: $filters) "
+        "{ edges { node { id name } } } }",
+        lambda rng, sizes: {
+            "filters": [{"key": "roles.name", "op": "==", "val": "role-%d" % rng.randint(1, sizes["roles"])}]
+        },
+    ),
+    (
+        "user_node",
+        "query ($id: ID!) { user(id: $id) { name roles { edges { node { name } } } } }",
+        lambda rng, sizes: {"id": global_id(User, rng.randint(1, sizes["users"]))},
+    ),
+    (
+        "generic_node",
+        "query ($id: ID!) { node(id: $id) { id ... on ArticleOutputType { title author { name } } } }",
+        lambda rng, sizes: {"id": global_id(Article, rng.randint(1, sizes["articles"]))},
+    ),
+    (
+        "create_role",
+        'mutation ($name: String) { createRole(input: {name: $name}) { ok output { id } } }',
+        lambda rng, sizes: {"name": "bench-%d" % rng.randint(0, 1 << 30)},
+    ),
+    (
+        "update_article",
+        "mutation ($id: ID!, $title: String!, $author: ID!) { updateArticle(id: $id, "
+        'input: {title: $title, text: "bench text", authorId: $author}) { ok } }',
+        lambda rng, sizes: {
+            "id": global_id(Article, rng.randint(1, sizes["articles"])),
+            "title": "bench %d" % rng.randint(0, 1 << 30),
+            "author": global_id(User, rng.randint(1, sizes["users"])),
+        },
+    ),
+    (
+        "bulk_create_articles",
+        None,
+        lambda rng, sizes: {
+            "query": "mutation { createArticles(inputs: [%s]) { ok } }"
+            % ", ".join(
+                ARTICLE_INPUT % {"n": n, "author": global_id(User, rng.randint(1, sizes["users"]))}
+                for n in range(20)
+            )
+        },
+    ),
+    (
+        "bulk_update_articles",
+        None,
+        lambda rng, sizes: {
+            "query": "mutation { updateArticles(inputs: [%s]) { ok } }"
+            % ", ".join(
+                '{id: "%s", input: %s}'
+                % (
+                    global_id(Article, rng.randint(1, sizes["articles"])),
+                    ARTICLE_INPUT % {"n": n, "author": global_id(User, rng.randint(1, sizes["users"]))},
+                )
+                for n in range(20)
+            )
+        },
+    ),
+]
+
+
+def percentile(values, percent):
+    """nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    index = max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def operation_request(query, variables, rng, sizes):
+    variables = variables(rng, sizes) if variables is not None else {}
+    if query is None:
+        # 整个查询是生成的，批量操作的输入列表不放在变量里
+        return variables.pop("query"), variables
+    return query, variables
+
+
+class SchemaTransport(object):
+    name = "schema"
+
+    def __call__(self, query, variables):
+        result = schema.execute(query, variables=variables, context_value={})
+        db.session.remove()
+        return [str(e) for e in result.errors or []]
+
+
+class HttpTransport(object):
+    name = "http"
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def __call__(self, query, variables):
+        response = self.client.post("/graphql", json={"query": query, "variables": variables})
+        body = response.get_json()
+        return [e.get("message") for e in body.get("errors") or []]
+
+
+def run_operation(transport, name, query, variables, sizes, args, counter):
+    rng = random.Random("%s:%s:%d" % (name, transport.name, args.seed))
+    requests = [
+        operation_request(query, variables, rng, sizes) for _ in range(args.warmup + args.iterations)
+    ]
+    errors = []
+    for request in requests[: args.warmup]:
+        errors.extend(transport(*request))
+    timings = []
+    statements = []
+    for request in requests[args.warmup :]:
+        counter[0] = 0
+        start = time.perf_counter()
+        errors.extend(transport(*request))
+        timings.append((time.perf_counter() - start) * 1000)
+        statements.append(counter[0])
+    # 内存单独跑，tracemalloc 会拖慢计时
+    tracemalloc.start()
+    for request in requests[args.warmup : args.warmup + args.memory_iterations]:
+        transport(*request)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    statements.sort()
+    return {
+        "name": name,
+        "transport": transport.name,
+        "iterations": len(timings),
+        "min_ms": round(timings[0], 3),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p90_ms": round(percentile(timings, 90), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "max_ms": round(timings[-1], 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "sql_statements": percentile(statements, 50),
+        "sql_statements_max": statements[-1],
+        "peak_memory_kb": round(peak / 1024.0, 1),
+        "errors": sorted(set(errors))[:5],
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["transport"]): r for r in json.load(f)["results"]}
+    print("\n%-26s %-7s %12s %12s %8s %10s" % ("operation", "via", "p50 base", "p50 now", "change", "sql"))
+    for result in results:
+        base = baseline.get((result["name"], result["transport"]))
+        if base is None:
+            continue
+        change = (result["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0
+        print(
+            "%-26s %-7s %12.3f %12.3f %+7.1f%% %4s -> %-4s"
+            % (
+                result["name"],
+                result["transport"],
+                base["p50_ms"],
+                result["p50_ms"],
+                change,
+                base["sql_statements"],
+                result["sql_statements"],
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--database", help="use a copy of a generated dataset instead of generating one")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--memory-iterations", type=int, default=3)
+    parser.add_argument("--only", action="append", help="operation name, can be repeated")
+    parser.add_argument("--transport", choices=["schema", "http"], action="append")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="results json of a previous run")
+    parser.add_argument("--result-cache", action="store_true", help="turn the result cache of /graphql on")
+    args = parser.parse_args(argv)
+    if not args.result_cache:
+        # 重复的请求会命中结果缓存，只测缓存本身时才打开
+        backend.result_cache = None
+    elif backend.result_cache is None:
+        # 单进程，进程内缓存就够了
+        backend.result_cache = ResultCache(LRUBackend(max_bytes=app.config["GRAPHQL_RESULT_CACHE_BYTES"]))
+        invalidation_hooks.append(backend.result_cache.invalidate)
+    # 每个请求一行的追踪日志会淹没结果
+    logging.getLogger("example_app.graphql").setLevel(logging.ERROR)
+
+    directory = tempfile.mkdtemp(prefix="graphql-bench-")
+    path = os.path.join(directory, "bench.db")
+    try:
+        if args.database:
+            # 变更操作会写库，用副本
+            shutil.copyfile(args.database, path)
+            engine = sqlalchemy.create_engine("sqlite:///" + path)
+            with engine.connect() as connection:
+                sizes = {
+                    "users": connection.execute("SELECT max(id) FROM user").scalar(),
+                    "roles": connection.execute("SELECT max(id) FROM role").scalar(),
+                    "articles": connection.execute("SELECT max(id) FROM article").scalar(),
+                    "seed": args.seed,
+                }
+            engine.dispose()
+        else:
+            start = time.time()
+            engine = sqlalchemy.create_engine("sqlite:///" + path)
+            sizes = generate_from_args(engine, args)
+            engine.dispose()
+            print("dataset %s generated in %.1fs" % (sizes, time.time() - start))
+
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+        counter = [0]
+        results = []
+        with app.app_context():
+
+            def count(*args):
+                counter[0] += 1
+
+            event.listen(db.engine, "before_cursor_execute", count)
+            transports = [t() for t in (SchemaTransport, HttpTransport) if t.name in (args.transport or [t.name])]
+            print(
+                "%-26s %-7s %9s %9s %9s %6s %10s"
+                % ("operation", "via", "p50 ms", "p90 ms", "p99 ms", "sql", "peak kb")
+            )
+            for name, query, variables in CATALOG:
+                if args.only and name not in args.only:
+                    continue
+                for transport in transports:
+                    result = run_operation(transport, name, query, variables, sizes, args, counter)
+                    results.append(result)
+                    print(
+                        "%-26s %-7s %9.3f %9.3f %9.3f %6s %10.1f%s"
+                        % (
+                            name,
+                            transport.name,
+                            result["p50_ms"],
+                            result["p90_ms"],
+                            result["p99_ms"],
+                            result["sql_statements"],
+                            result["peak_memory_kb"],
+                            "  errors: %s" % result["errors"] if result["errors"] else "",
+                        )
+                    )
+            event.remove(db.engine, "before_cursor_execute", count)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "dataset": sizes,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    print("results written to %s" % args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
-from flask import Flask
+import json
+import os
+import time
+
+import click
+from flask import Flask, jsonify, request, stream_with_context
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from example_app.extensions import *
+from example_app.utils.backend import CachedDocumentBackend, read_documents
+from example_app.utils.cost import QueryCostAnalyzer
+from example_app.utils.encoder import ResponseEncoder
+from example_app.utils.cache import invalidation_hooks
+from example_app.utils.changes import prune_tombstones
+from example_app.utils.export import ExportError, export_limit, export_stream
+from example_app.utils.filters import filter_columns
+from example_app.utils.indexes import advise, index_usage, indexed_columns, write_migration
+from example_app.utils.instrument import Instrumentation
+from example_app.utils.result_cache import LRUBackend, ResultCache, SharedBackend
+from example_app.utils.search import search_indexes
+from example_app.utils.snapshot import prewarm, read_snapshot, write_snapshot
+from example_app.utils.transaction import unit_of_work_middleware
+from example_app.utils.types import module_models
+from example_app.utils.view import CustomGraphQLView
+from . import models
 from .scheme import schema
-from flask_graphql import GraphQLView
 
 app = Flask(__name__)
 
@@ -11,14 +31,252 @@ app.config.update(
     {
         "SQLALCHEMY_DATABASE_URI": "sqlite:////data/example.db",
         "SQLALCHEMY_TRACK_MODIFICATIONS": True,
-        "DEBUG": True,
+        # 只读副本，查询走副本，变更走主库，逗号分隔
+        "SQLALCHEMY_REPLICA_URIS": [
+            uri for uri in os.environ.get("SQLALCHEMY_REPLICA_URIS", "").split(",") if uri
+        ],
+        # 变更后这么多秒内该客户端的查询仍走主库
+        "SQLALCHEMY_READ_YOUR_WRITES": 5,
+        "SQLALCHEMY_ENGINE_OPTIONS": {
+            "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5)),
+            "max_overflow": int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 10)),
+            "pool_timeout": 30,
+            "pool_recycle": 3600,
+        },
+        # 解析和校验后的查询缓存
+        "GRAPHQL_DOCUMENT_CACHE_ENTRIES": 1000,
+        "GRAPHQL_DOCUMENT_CACHE_BYTES": 10 * 1024 * 1024,
+        # 查询深度和代价上限
+        "GRAPHQL_MAX_DEPTH": 10,
+        "GRAPHQL_MAX_COST": 10000,
+        "GRAPHQL_DEFAULT_LIST_SIZE": 100,
+        # 请求追踪，带 X-GraphQL-Debug 头时返回到 extensions
+        "GRAPHQL_TRACE_HEADER": "X-GraphQL-Debug",
+        "GRAPHQL_TRACE_N_PLUS_ONE": 5,
+        "GRAPHQL_TRACE_SLOWEST": 5,
+        # 查询结果缓存，变更提交后按表失效；设置 redis 地址时多进程共享
+        # None 为只在设置了 redis 地址时开启：进程内缓存的失效只在本进程生效，
+        # 多进程 (serve.py) 时其他进程在 GRAPHQL_RESULT_CACHE_TTL 内仍返回旧结果
+        "GRAPHQL_RESULT_CACHE": None,
+        "GRAPHQL_RESULT_CACHE_TTL": 60,
+        "GRAPHQL_RESULT_CACHE_BYTES": 64 * 1024 * 1024,
+        "GRAPHQL_RESULT_CACHE_REDIS_URL": os.environ.get("GRAPHQL_RESULT_CACHE_REDIS_URL"),
+        # <model>Changes 的 watermark 比数据库时间晚这么多秒，未提交的事务不会被跳过
+        "GRAPHQL_CHANGES_LAG": 2,
+        # 删除记录 (tombstone) 保留的秒数，flask graphql-prune-tombstones 清理更早的，None 为一直保留
+        "GRAPHQL_TOMBSTONE_RETENTION": 30 * 24 * 3600,
+        # 只查询字段列的列表直接读行，不创建模型实例
+        "GRAPHQL_ROW_PATH": True,
+        # filters 只能用有索引的字段 (索引、主键、唯一约束的第一个字段)，models.py 里 allow_filters 的模型除外
+        "GRAPHQL_FILTER_INDEXED_ONLY": os.environ.get("GRAPHQL_FILTER_INDEXED_ONLY", "") in ("1", "true"),
+        # /graphql/export 每次最多导出的行数，每次读取的行数，每次写出的字节数
+        "GRAPHQL_EXPORT_MAX_ROWS": 1000000,
+        "GRAPHQL_EXPORT_YIELD_PER": 1000,
+        "GRAPHQL_EXPORT_CHUNK_BYTES": 64 * 1024,
+        # 一个请求里的变更在一个事务里，每个字段一个 savepoint，请求结束时提交一次
+        "GRAPHQL_UNIT_OF_WORK": os.environ.get("GRAPHQL_UNIT_OF_WORK", "") in ("1", "true"),
+        # serve.py 的进程数 (0 为 cpu 核数)、每个进程的线程数、平滑重启时等待请求完成的秒数
+        # 每个进程有自己的连接池，连接数最多 进程数 * (SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW)
+        "GRAPHQL_WORKERS": int(os.environ.get("GRAPHQL_WORKERS", os.environ.get("WEB_CONCURRENCY", 0))),
+        "GRAPHQL_WORKER_THREADS": int(os.environ.get("GRAPHQL_WORKER_THREADS", 1)),
+        "GRAPHQL_GRACEFUL_TIMEOUT": int(os.environ.get("GRAPHQL_GRACEFUL_TIMEOUT", 30)),
+        # 启动时 (fork 之前) 解析和校验的查询，json 列表、{sha256: query} 或 .graphql 文件
+        "GRAPHQL_PREWARM_DOCUMENTS": os.environ.get("GRAPHQL_PREWARM_DOCUMENTS"),
+        # asgi.py 的线程池大小，根字段和 DataLoader 批量查询在线程池里并发执行
+        "GRAPHQL_ASYNC_WORKERS": int(os.environ.get("GRAPHQL_ASYNC_WORKERS", 10)),
+        # 响应的 json 库，orjson 或 json，默认装了 orjson 就用 orjson
+        "GRAPHQL_JSON_BACKEND": os.environ.get("GRAPHQL_JSON_BACKEND") or None,
+        # 响应至少这么多字节时按 Accept-Encoding 压缩 (br 或 gzip)，None 不压缩
+        "GRAPHQL_COMPRESS_MIN_BYTES": 1024,
+        # 查询代价至少这么大时分块流式编码响应，每块的字节数，None 不分块
+        "GRAPHQL_STREAM_MIN_COST": None,
+        "GRAPHQL_STREAM_CHUNK_BYTES": 64 * 1024,
+        # flask graphql-schema 生成的 schema 快照，启动时检查是否过期
+        "GRAPHQL_SCHEMA_SNAPSHOT": os.environ.get("GRAPHQL_SCHEMA_SNAPSHOT"),
     }
 )
 db.init_app(app)
 
 migrate.init_app(app, db)
-# 视图
-app.add_url_rule(
-    "/graphql", view_func=GraphQLView.as_view("graphql", schema=schema, graphiql=True)
+instrumentation = Instrumentation(app)
+snapshot_path = app.config["GRAPHQL_SCHEMA_SNAPSHOT"]
+prewarm(schema, read_snapshot(snapshot_path) if snapshot_path and os.path.exists(snapshot_path) else None)
+if app.config["GRAPHQL_FILTER_INDEXED_ONLY"]:
+    for _, model in module_models(models):
+        filter_columns.setdefault(model, indexed_columns(model))
+result_cache = None
+if app.config["GRAPHQL_RESULT_CACHE"] or (
+    app.config["GRAPHQL_RESULT_CACHE"] is None and app.config["GRAPHQL_RESULT_CACHE_REDIS_URL"]
+):
+    if app.config["GRAPHQL_RESULT_CACHE_REDIS_URL"]:
+        import redis  # 可选依赖，只有共享缓存需要
+
+        result_backend = SharedBackend(redis.Redis.from_url(app.config["GRAPHQL_RESULT_CACHE_REDIS_URL"]))
+    else:
+        result_backend = LRUBackend(max_bytes=app.config["GRAPHQL_RESULT_CACHE_BYTES"])
+    result_cache = ResultCache(result_backend, ttl=app.config["GRAPHQL_RESULT_CACHE_TTL"])
+    invalidation_hooks.append(result_cache.invalidate)
+backend = CachedDocumentBackend(
+    max_entries=app.config["GRAPHQL_DOCUMENT_CACHE_ENTRIES"],
+    max_bytes=app.config["GRAPHQL_DOCUMENT_CACHE_BYTES"],
+    cost_analyzer=QueryCostAnalyzer(
+        max_depth=app.config["GRAPHQL_MAX_DEPTH"],
+        max_cost=app.config["GRAPHQL_MAX_COST"],
+        default_list_size=app.config["GRAPHQL_DEFAULT_LIST_SIZE"],
+    ),
+    result_cache=result_cache,
+)
+if app.config["GRAPHQL_PREWARM_DOCUMENTS"]:
+    backend.prewarm(schema, read_documents(app.config["GRAPHQL_PREWARM_DOCUMENTS"]))
+encoder = ResponseEncoder(
+    backend=app.config["GRAPHQL_JSON_BACKEND"],
+    compress_min_bytes=app.config["GRAPHQL_COMPRESS_MIN_BYTES"],
+    stream_min_cost=app.config["GRAPHQL_STREAM_MIN_COST"],
+    chunk_bytes=app.config["GRAPHQL_STREAM_CHUNK_BYTES"],
 )
+# 视图，asgi.py 的异步入口用同样的参数
+graphql_view_options = dict(
+    schema=schema,
+    graphiql=True,
+    backend=backend,
+    instrumentation=instrumentation,
+    encoder=encoder,
+    # 列表里靠后的在外层，先路由到主库再开 savepoint
+    middleware=[unit_of_work_middleware, db.routing_middleware],
+)
+app.add_url_rule("/graphql", view_func=CustomGraphQLView.as_view("graphql", **graphql_view_options))
+
+
+@app.route("/graphql/stats")
+def graphql_stats():
+    return jsonify(
+        {
+            "document_cache": backend.stats(),
+            "result_cache": result_cache.stats() if result_cache is not None else None,
+            "index_usage": index_usage.shapes(top=100),
+        }
+    )
+
+
+@app.route("/graphql/export/<name>", methods=["GET", "POST"])
+def graphql_export(name):
+    """stream rows of a model as ndjson or csv, arguments in query string or json body
+
+    fields -- comma separated or list, default all columns
+    filters -- filters document (json string in query string)
+    format -- ndjson (default) or csv
+    limit -- non negative, at most GRAPHQL_EXPORT_MAX_ROWS
+    """
+    model = dict((n.lower(), m) for n, m in module_models(models)).get(name.lower())
+    if model is None:
+        return jsonify({"errors": [{"message": "没有模型 %s" % name}]}), 404
+    params = request.get_json(silent=True) or request.args
+    try:
+        fields = params.get("fields") or []
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(",") if f.strip()]
+        filters = params.get("filters")
+        if isinstance(filters, str):
+            filters = json.loads(filters)
+        limit = export_limit(params.get("limit"), app.config["GRAPHQL_EXPORT_MAX_ROWS"])
+        db.session.info["read_only"] = not db.sticky()
+        content_type, lines = export_stream(
+            model.query,
+            model,
+            fields=fields,
+            filters=filters,
+            format=params.get("format", "ndjson"),
+            limit=limit,
+            yield_per=app.config["GRAPHQL_EXPORT_YIELD_PER"],
+        )
+    except (ExportError, ValueError) as e:
+        return jsonify({"errors": [{"message": str(e)}]}), 400
+    extension = "csv" if content_type == "text/csv" else "ndjson"
+    return encoder.stream_response(
+        stream_with_context(encoder.chunked(lines, app.config["GRAPHQL_EXPORT_CHUNK_BYTES"])),
+        accept_encodings=request.accept_encodings,
+        content_type=content_type + "; charset=utf-8",
+        headers={"Content-Disposition": "attachment; filename=%s.%s" % (model.__table__.name, extension)},
+    )
+
+
+@app.cli.command("graphql-schema")
+@click.argument("path", default="schema.json")
+def graphql_schema(path):
+    """write schema snapshot (SDL and type map) to PATH"""
+    snapshot = write_snapshot(schema, path)
+    click.echo("%s: %d types, hash %s" % (path, len(snapshot["types"]), snapshot["hash"]))
+
+
+@app.cli.command("graphql-prune-tombstones")
+@click.option("--older-than", type=int, help="seconds, default GRAPHQL_TOMBSTONE_RETENTION")
+def graphql_prune_tombstones(older_than):
+    """delete tombstones of <model>Changes older than the retention"""
+    if older_than is None:
+        older_than = app.config.get("GRAPHQL_TOMBSTONE_RETENTION")
+    if older_than is None:
+        raise click.ClickException("GRAPHQL_TOMBSTONE_RETENTION 为 None，删除记录一直保留")
+    count = prune_tombstones(db.session, older_than)
+    db.session.commit()
+    click.echo("%d tombstones older than %d seconds deleted" % (count, older_than))
+
+
+@app.cli.command("search-index")
+@click.option("--model", multiple=True, help="model name, default all models with an index")
+def search_index(model):
+    """create full text indexes and index the existing rows"""
+    for index in search_indexes.values():
+        if model and index.model.__name__ not in model:
+            continue
+        start = time.time()
+        with db.engine.begin() as connection:
+            count = index.rebuild(connection)
+        click.echo("%s: %d rows in %.1fs" % (index.name, count, time.time() - start))
+
+
+def _plan(plan):
+    return "; ".join(plan) if plan is not None else "(explain query plan 只支持 sqlite)"
+
+
+@app.cli.command("graphql-indexes")
+@click.option("--usage", help="json of /graphql/stats (file or url), default usage of this process")
+@click.option("--top", default=20, help="most frequent shapes")
+@click.option("--min-count", default=1, help="skip shapes used fewer times")
+@click.option("--verify/--no-verify", default=True, help="create every index in a rolled back transaction (sqlite)")
+@click.option("--migration", is_flag=True, help="write the indexes as a migration")
+@click.option("-m", "--message", default="graphql indexes", help="message of the migration")
+def graphql_indexes(usage, top, min_count, verify, migration, message):
+    """propose indexes for filters and sort of list fields from their usage"""
+    model_list = [model for _, model in module_models(models)]
+    if usage:
+        if usage.startswith(("http://", "https://")):
+            from urllib.request import urlopen
 
+            with urlopen(usage) as response:
+                data = json.loads(response.read().decode("utf8"))
+        else:
+            with open(usage) as f:
+                data = json.load(f)
+        index_usage.load(data["index_usage"] if isinstance(data, dict) else data, model_list)
+    shapes = index_usage.shapes(top=top)
+    if not shapes:
+        raise click.ClickException("没有使用记录，用 --usage 指定 /graphql/stats")
+    proposals = []
+    for advice in advise(db.session, shapes, model_list, min_count=min_count, verify=verify):
+        click.echo(
+            "%s filters=%s sort=%s count=%d"
+            % (advice.model.__name__, json.dumps(advice.filters), advice.sort, advice.count)
+        )
+        click.echo("  plan: %s" % _plan(advice.plan))
+        for proposal, after in advice.proposals:
+            click.echo("  index %s (%s)" % (proposal.name, ", ".join(proposal.expressions())))
+            if after is not None:
+                click.echo("    plan: %s" % _plan(after))
+            click.echo("    model: %s" % proposal.model_index())
+            if proposal not in proposals:
+                proposals.append(proposal)
+    if migration and proposals:
+        if not os.path.isdir(migrate.directory):
+            raise click.ClickException("没有 %s，先运行 flask db init" % migrate.directory)
+        script = write_migration(migrate, proposals, message)
+        click.echo("migration %s: %s" % (script.revision, script.path))
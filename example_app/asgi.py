@@ -0,0 +1,118 @@
+"""ASGI application, `/graphql` executed on an asyncio event loop (see utils/aio.py)
+
+    uvicorn asgi:application
+
+the same schema, backend, instrumentation and middleware as the flask view, other
+paths (`/graphql/stats`, `/graphql/export`) are served by the WSGI app (run.py).
+"""
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from example_app.app import app, graphql_view_options
+from example_app.utils.aio import AsyncRequest
+from example_app.utils.view import CustomGraphQLView
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ of an ASGI http scope, for the flask request"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name == "CONTENT_LENGTH":
+            # 用读到的 body 长度
+            continue
+        key = name if name == "CONTENT_TYPE" else "HTTP_" + name
+        value = value.decode("latin1")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        body.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(body)
+
+
+async def send_response(send, status, headers, body):
+    """body is bytes or an iterator of bytes (streamed response), one message per chunk"""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers],
+        }
+    )
+    if isinstance(body, bytes):
+        return await send({"type": "http.response.body", "body": body})
+    for chunk in body:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class GraphQLApplication(object):
+    def __init__(self, app, view, path="/graphql", workers=None):
+        self.app = app
+        self.view = view
+        self.path = path
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="graphql")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http" or scope["path"].rstrip("/") != self.path:
+            body = b'{"errors":[{"message":"not found"}]}'
+            return await send_response(send, 404, [("Content-Type", "application/json")], body)
+        body = await read_body(receive)
+        request = AsyncRequest(self.app, wsgi_environ(scope, body), self.pool)
+        try:
+            response = await self.view.dispatch_async(request)
+            with request.contexts():
+                # after_request，比如读自己写入的 cookie
+                response = self.app.process_response(self.app.make_response(response))
+        finally:
+            await request.close()
+        body = response.iter_encoded() if response.is_streamed else response.get_data()
+        try:
+            await send_response(send, response.status_code, response.headers.to_wsgi_list(), body)
+        finally:
+            response.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = GraphQLApplication(
+    app,
+    CustomGraphQLView(**graphql_view_options),
+    workers=app.config["GRAPHQL_ASYNC_WORKERS"],
+)
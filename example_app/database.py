@@ -0,0 +1,233 @@
+"""flask-sqlalchemy with read replicas and sqlite tuning
+
+    SQLALCHEMY_REPLICA_URIS = ["sqlite:///file:/data/example.db?mode=ro&uri=true"]
+
+graphql queries read from a replica, mutations and flushes use the primary
+(SQLALCHEMY_DATABASE_URI). after a mutation the client reads from the primary for
+SQLALCHEMY_READ_YOUR_WRITES seconds (a cookie), so it sees its own writes.
+without replicas everything uses the primary.
+
+sessions are scoped by thread (the flask default), or by `session_scope` when it is set:
+an async request (utils/aio.py) gives each branch running in a worker thread its own.
+
+engines are fork safe: `dispose_engines` before and after fork (serve.py), and a
+connection opened by another process is never checked out, it is replaced.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import _app_ctx_stack, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, orm
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = "__replica_%d__"
+PRIMARY_COOKIE = "graphql_primary_until"
+
+# 不为 None 时按它区分 session，否则按线程
+session_scope = ContextVar("session_scope", default=None)
+
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # 负数单位是 KiB
+    "busy_timeout": 5000,
+}
+
+
+class RoutingSession(SignallingSession):
+    """session with `info["read_only"]`, read only sessions query a replica"""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.info.get("read_only") and not self._flushing:
+            persist_selectable = getattr(mapper, "persist_selectable", None)
+            if getattr(persist_selectable, "info", {}).get("bind_key") is None:
+                engine = self.db.replica_engine(self.app)
+                if engine is not None:
+                    return engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingMiddleware(object):
+    """graphene middleware, route the session by operation type at root fields"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def route(self, operation):
+        """route the current session by operation type
+
+        Returns:
+            bool -- read only
+        """
+        if operation == "mutation":
+            self.db.session.info["read_only"] = False
+            self.db.mark_write()
+        else:
+            self.db.session.info["read_only"] = not self.db.sticky()
+        return self.db.session.info["read_only"]
+
+    def resolve(self, next, root, info, **args):
+        if len(info.path) == 1:
+            self.route(info.operation.operation)
+        return next(root, info, **args)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        super(RoutingSQLAlchemy, self).__init__(*args, **kwargs)
+        self.routing_middleware = RoutingMiddleware(self)
+        self._replicas = {}
+        self._replica_lock = threading.Lock()
+        self._pragmas = None
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+        app.config.setdefault("SQLALCHEMY_READ_YOUR_WRITES", 5)
+        app.config.setdefault("SQLALCHEMY_SQLITE_PRAGMAS", DEFAULT_SQLITE_PRAGMAS)
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        for i, uri in enumerate(app.config["SQLALCHEMY_REPLICA_URIS"]):
+            binds[REPLICA_BIND % i] = uri
+        app.config["SQLALCHEMY_BINDS"] = binds or None
+        super(RoutingSQLAlchemy, self).init_app(app)
+        app.after_request(self._set_primary_cookie)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_scoped_session(self, options=None):
+        options = dict(options or {})
+        ident = options.pop("scopefunc", _app_ctx_stack.__ident_func__)
+        options["scopefunc"] = lambda: session_scope.get() or ident()
+        return super(RoutingSQLAlchemy, self).create_scoped_session(options)
+
+    def remove_session(self, scope):
+        """close the session of a `session_scope`"""
+        token = session_scope.set(scope)
+        try:
+            self.session.remove()
+        finally:
+            session_scope.reset(token)
+
+    def replica_engine(self, app):
+        """next replica engine (round robin), None without replicas"""
+        count = len(app.config["SQLALCHEMY_REPLICA_URIS"])
+        if not count:
+            return None
+        with self._replica_lock:
+            if app not in self._replicas:
+                self._replicas[app] = itertools.cycle(range(count))
+            index = next(self._replicas[app])
+        return self.get_engine(app, bind=REPLICA_BIND % index)
+
+    def dispose_engines(self, app):
+        """close the pooled connections of the primary, binds and replicas"""
+        for bind in [None] + list(app.config.get("SQLALCHEMY_BINDS") or {}):
+            self.get_engine(app, bind=bind).dispose()
+
+    def mark_write(self):
+        if has_request_context():
+            g.primary_until = time.time() + self.get_app().config["SQLALCHEMY_READ_YOUR_WRITES"]
+
+    def sticky(self):
+        """read from primary, this client wrote within SQLALCHEMY_READ_YOUR_WRITES seconds"""
+        if not has_request_context():
+            return False
+        if g.get("primary_until"):
+            return True
+        try:
+            return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _set_primary_cookie(self, response):
+        primary_until = g.get("primary_until")
+        if primary_until:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "%.3f" % primary_until,
+                max_age=int(self.get_app().config["SQLALCHEMY_READ_YOUR_WRITES"]) + 1,
+                httponly=True,
+            )
+        return response
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        database = sa_url.database
+        super(RoutingSQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        self._pragmas = None
+        if not sa_url.drivername.startswith("sqlite"):
+            return
+        if database and database.startswith("file:"):
+            # uri=true 的文件名，例如只读副本 file:/data/example.db?mode=ro，不能拼 root_path
+            sa_url.database = database
+        if options.get("poolclass") is NullPool and app.config["SQLALCHEMY_ENGINE_OPTIONS"].get("pool_size"):
+            # 文件数据库配置了 pool_size 时用连接池，连接的 pragma 只执行一次
+            options["poolclass"] = QueuePool
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+        self._pragmas = dict(app.config["SQLALCHEMY_SQLITE_PRAGMAS"])
+        if options.get("poolclass") is StaticPool:
+            self._pragmas.pop("journal_mode", None)
+
+    def create_engine(self, sa_url, engine_opts):
+        # apply_driver_hacks 和 create_engine 都在 get_engine 的锁里依次调用
+        if engine_opts.get("poolclass") in (NullPool, StaticPool):
+            for key in ("pool_size", "max_overflow", "pool_timeout"):
+                engine_opts.pop(key, None)
+        engine = super(RoutingSQLAlchemy, self).create_engine(sa_url, engine_opts)
+        event.listen(engine, "connect", _record_pid)
+        event.listen(engine, "checkout", _check_pid)
+        if self._pragmas is not None:
+            event.listen(engine, "connect", _sqlite_pragmas(self._pragmas))
+            event.listen(engine, "begin", _sqlite_begin)
+        return engine
+
+
+def _record_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+def _check_pid(dbapi_connection, connection_record, connection_proxy):
+    """a connection inherited by fork is not used, the pool opens a new one"""
+    if connection_record.info.get("pid") != os.getpid():
+        # 不关闭，连接仍属于父进程
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            "connection record belongs to pid %s, attempting to check out in pid %s"
+            % (connection_record.info.get("pid"), os.getpid())
+        )
+
+
+def _sqlite_pragmas(pragmas):
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            try:
+                cursor.execute("PRAGMA %s=%s" % (name, value))
+            except Exception as e:
+                # 只读副本不能切换 journal_mode
+                logger.debug("PRAGMA %s=%s failed: %s", name, value, e)
+        cursor.close()
+        # 事务由 _sqlite_begin 开始，pysqlite 不再自己 BEGIN/COMMIT
+        dbapi_connection.isolation_level = None
+
+    return connect
+
+
+def _sqlite_begin(connection):
+    """BEGIN when sqlalchemy begins, so SAVEPOINT is always inside the transaction
+
+    pysqlite begins only before writes, a SAVEPOINT before that is the outermost one
+    and its RELEASE commits
+    """
+    connection.connection.execute("BEGIN")
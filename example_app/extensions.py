@@ -1,6 +1,7 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
-db = SQLAlchemy()
+from example_app.database import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 
@@ -1,4 +1,5 @@
 from example_app.extensions import db
+from example_app.utils.search import search_index
 
 from sqlalchemy import func
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -43,3 +44,9 @@ class Article(db.Model):
         db.DateTime, default=func.now(), onupdate=func.now(), doc=u"更新时间"
     )
 
+    # articleChanges 按 (update_time, id) 取变化的行
+    __table_args__ = (db.Index("ix_article_update_time_id", "update_time", "id"),)
+
+
+# 全文索引，filters 的 search/match 和 articleSearch 用
+search_index(Article, "title", "description", "tags", "text", weights=[10.0, 5.0, 5.0, 1.0])
@@ -2,11 +2,14 @@ from example_app.utils import (
     SQLAlchemyMutation,
     SQLAlchemyInputObjectType,
     input_to_dictionary,
+    assign_many_to_many,
+    get_instance,
+    commit_mutation,
+    rollback_mutation,
 )
-from example_app.models import User, Role
+from example_app.models import User
 from example_app.extensions import db
 import graphene
-from graphql_relay.node.node import from_global_id
 
 
 class UserInputType(SQLAlchemyInputObjectType):
@@ -33,13 +36,15 @@ class UserCreateMutation(SQLAlchemyMutation):
         user = User()
         user.name = data.get("name", "defautltname")
         user.password = data.get("password")
-
-        for _id in data.get("roles", []):
-            rid = from_global_id(_id)[1]
-            user.roles = [Role.query.get(rid) for i in data.get("roles")]
         db.session.add(user)
-        db.session.commit()
-        user = User.query.get(user.id)
+
+        missing = assign_many_to_many(db.session, user, "roles", data.get("roles") or [])
+        if missing:
+            rollback_mutation(info)
+            return cls(output=None, ok=False, message="关联数据不存在: %s" % ", ".join(missing))
+        error = commit_mutation(info, [User])
+        if error is not None:
+            return cls(output=None, ok=False, message=error)
         return cls(output=user, ok=True, message="操作成功")
 
 
@@ -58,14 +63,19 @@ class UserUpdateMutation(SQLAlchemyMutation):
         kwargs = input_to_dictionary(kwargs)
         data = kwargs.get("input")
         print(data)
-        user = User.query.get(kwargs.get("id"))
+        user = get_instance(info.context, User, kwargs.get("id"))
+        if not user:
+            return cls(output=None, ok=False, message="要操作的数据不存在")
         user.name = data.get("name", "defautltname")
         user.password = data.get("password")
 
-        for _id in data.get("roles"):
-            rid = from_global_id(_id)[1]
-            user.roles = [Role.query.get(rid) for i in data.get("roles")]
+        if data.get("roles") is not None:
+            missing = assign_many_to_many(db.session, user, "roles", data["roles"])
+            if missing:
+                rollback_mutation(info)
+                return cls(output=None, ok=False, message="关联数据不存在: %s" % ", ".join(missing))
         db.session.add(user)
-        db.session.commit()
-        user = User.query.get(user.id)
+        error = commit_mutation(info, [User])
+        if error is not None:
+            return cls(output=None, ok=False, message=error)
         return cls(output=user, ok=True, message="操作成功")
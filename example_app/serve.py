@@ -0,0 +1,79 @@
+"""multi-process serving with gunicorn (optional dependency, pip install gunicorn)
+
+    python serve.py
+    GRAPHQL_WORKERS=8 GRAPHQL_WORKER_THREADS=4 HOST=0.0.0.0 PORT=5000 python serve.py
+
+the app is imported once by the master: the schema is built and prewarmed, the documents
+of GRAPHQL_PREWARM_DOCUMENTS are parsed and validated, then the workers are forked and
+share all of it. engines are disposed before every fork and again in the worker, so no
+pooled connection is shared between processes.
+
+reload without dropping requests:
+
+    kill -HUP <master>     new workers forked from the same preloaded app, old ones finish
+                           their requests (same code and app config, like a rolling restart)
+    kill -USR2 <master>    a new master that imports the app again (new code and config),
+                           then kill -QUIT <old master>
+"""
+import logging
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from example_app.app import app, result_cache
+from example_app.extensions import db
+from example_app.utils.result_cache import LRUBackend
+
+logger = logging.getLogger(__name__)
+
+
+class GraphQLServer(BaseApplication):
+    def __init__(self, application, options=None):
+        self.application = application
+        self.options = options or {}
+        super(GraphQLServer, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def server_options(app):
+    """gunicorn settings from app config"""
+
+    def dispose(server, worker):
+        with app.app_context():
+            db.dispose_engines(app)
+
+    return {
+        "bind": "%s:%s" % (os.environ.get("HOST", "127.0.0.1"), os.environ.get("PORT", 5000)),
+        "workers": app.config["GRAPHQL_WORKERS"] or multiprocessing.cpu_count(),
+        "threads": app.config["GRAPHQL_WORKER_THREADS"],
+        "graceful_timeout": app.config["GRAPHQL_GRACEFUL_TIMEOUT"],
+        "preload_app": True,
+        # master 里的连接不带进 worker，worker 里重建连接池
+        "pre_fork": dispose,
+        "post_fork": dispose,
+    }
+
+
+def check_result_cache(workers):
+    """the local result cache is not invalidated by mutations of other workers"""
+    if workers > 1 and result_cache is not None and isinstance(result_cache.backend, LRUBackend):
+        logger.warning(
+            "GRAPHQL_RESULT_CACHE 是进程内缓存，%d 个进程之间不会互相失效，"
+            "变更后其他进程在 %d 秒内可能返回旧结果，设置 GRAPHQL_RESULT_CACHE_REDIS_URL 共享缓存",
+            workers,
+            result_cache.ttl,
+        )
+
+
+def main():
+    options = server_options(app)
+    check_result_cache(options["workers"])
+    GraphQLServer(app, options).run()
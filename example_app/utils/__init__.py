@@ -3,5 +3,9 @@ from .mutation import (
     SQLAlchemyMutation,
     SQLAlchemyInputObjectType,
     input_to_dictionary,
+    assign_many_to_many,
 )
+from .cache import invalidate_model
+from .loader import get_instance
+from .transaction import commit_mutation, rollback_mutation
 from .query import QueryObjectType,SQLAlchemyObjectTypes
@@ -0,0 +1,139 @@
+"""aggregate fields, one GROUP BY query per field
+
+    articleAggregate(filters: [...], groupBy: [AUTHOR_ID]) {
+        group { authorId }
+        count
+        max { updateTime }
+    }
+
+    -> SELECT author_id, count(*), max(update_time) FROM article WHERE ... GROUP BY author_id
+
+only the aggregates in the selection set are computed. `sum`/`avg` are over numeric
+columns, `min`/`max` over numeric and date columns, primary and foreign keys are not summed.
+"""
+from collections import OrderedDict
+
+import graphene
+import sqlalchemy
+from graphene.types.generic import GenericScalar
+from graphene.utils.str_converters import to_snake_case
+from graphene_sqlalchemy.utils import get_query
+from sqlalchemy import func
+
+from .filters import compile_filters
+from .planner import field_selection
+from .types import model_attr_fields
+
+NUMERIC = (sqlalchemy.types.Integer, sqlalchemy.types.Float, sqlalchemy.types.Numeric)
+DATES = (sqlalchemy.types.Date, sqlalchemy.types.DateTime, sqlalchemy.types.Time)
+
+
+def aggregate_columns(model):
+    """
+    Returns:
+        (list, list, list) -- column keys to group by, to sum/avg, to min/max
+    """
+    group, numeric, comparable = [], [], []
+    for key, column in sqlalchemy.inspect(model).columns.items():
+        if not column.primary_key:
+            group.append(key)
+        if isinstance(column.type, NUMERIC):
+            comparable.append(key)
+            if not column.primary_key and not column.foreign_keys:
+                numeric.append(key)
+        elif isinstance(column.type, DATES):
+            comparable.append(key)
+    return group, numeric, comparable
+
+
+def _nullable(field_type):
+    return field_type.of_type if isinstance(field_type, graphene.NonNull) else field_type
+
+
+def _column_type(name, model, keys, field_type=None):
+    """object type with a nullable field per column, types of the output type by default"""
+    fields = model_attr_fields(model)
+    attrs = OrderedDict()
+    for key in keys:
+        column_type = field_type
+        if column_type is None:
+            column_type = _nullable(fields[key].type) if key in fields else GenericScalar
+            if key == sqlalchemy.inspect(model).primary_key[0].key:
+                # 这里是数据库 id，不是 global id
+                column_type = graphene.Int
+        attrs[key] = graphene.Field(column_type)
+    return type(name, (graphene.ObjectType,), attrs)
+
+
+class AggregateField(graphene.Field):
+    def __init__(self, model, aggregate_type, group_enum):
+        self.model = model
+        super(AggregateField, self).__init__(
+            graphene.List(graphene.NonNull(aggregate_type)),
+            filters=GenericScalar(),
+            group_by=graphene.List(graphene.NonNull(group_enum)),
+            limit=graphene.Int(),
+            resolver=self.resolve_aggregate,
+        )
+
+    def resolve_aggregate(self, root, info, filters=None, group_by=None, limit=None):
+        if limit is not None and limit < 0:
+            # sqlite 的 LIMIT -1 是不限制
+            raise ValueError("分页参数 limit 不能为负数: %d" % limit)
+        model = self.model
+        selection = field_selection(info)
+        group_keys = [getattr(g, "value", g) for g in group_by or []]
+        group_columns = [getattr(model, key) for key in group_keys]
+        columns = [c.label("group__%s" % key) for key, c in zip(group_keys, group_columns)]
+        if "count" in selection:
+            columns.append(func.count().label("count"))
+        for name in ("sum", "avg", "min", "max"):
+            for field in selection.get(name, {}):
+                key = to_snake_case(field)
+                columns.append(getattr(func, name)(getattr(model, key)).label("%s__%s" % (name, key)))
+        if not columns:
+            return []
+        # 只有 count(*) 时没有列能带出 FROM，要显式指定
+        query = get_query(model, info.context).select_from(model)
+        if filters:
+            if isinstance(filters, dict):
+                filters = [filters]
+            query = compile_filters(model, filters).apply(query, filters)
+        query = query.with_entities(*columns)
+        if group_columns:
+            query = query.group_by(*group_columns).order_by(*group_columns)
+        if limit is not None:
+            query = query.limit(limit)
+        return [_aggregate_row(row) for row in query]
+
+
+def _aggregate_row(row):
+    """row of labels `count`, `group__key`, `max__key` ... to nested dict"""
+    result = {"group": {}, "sum": {}, "avg": {}, "min": {}, "max": {}}
+    for label, value in zip(row.keys(), row):
+        if "__" in label:
+            name, key = label.split("__", 1)
+            result[name][key] = value
+        else:
+            result[label] = value
+    return result
+
+
+def model_aggregate(model):
+    """`<model>Aggregate` field"""
+    group, numeric, comparable = aggregate_columns(model)
+    prefix = model.__name__ + "Aggregate"
+    group_enum = graphene.Enum(prefix + "Column", [(key.upper(), key) for key in group])
+    attrs = OrderedDict()
+    attrs["group"] = graphene.Field(_column_type(prefix + "Group", model, group))
+    attrs["count"] = graphene.Int()
+    if numeric:
+        numeric_type = _column_type(prefix + "Numeric", model, numeric, graphene.Float)
+        attrs["sum"] = graphene.Field(numeric_type)
+        attrs["avg"] = graphene.Field(numeric_type)
+    if comparable:
+        comparable_type = _column_type(prefix + "Comparable", model, comparable)
+        attrs["min"] = graphene.Field(comparable_type)
+        attrs["max"] = graphene.Field(comparable_type)
+    aggregate_type = type(prefix, (graphene.ObjectType,), attrs)
+    return AggregateField(model, aggregate_type, group_enum)
@@ -0,0 +1,155 @@
+"""asyncio execution of the schema, for the ASGI entry point (asgi.py)
+
+    request = AsyncRequest(app, environ, pool)
+    response = await view.dispatch_async(request)
+    await request.close()
+
+sqlalchemy 1.3 has no asyncio session, blocking work runs in a thread pool while the
+event loop waits for it: every root field and every DataLoader batch is a task of the
+pool, sibling root fields and independent batches run at the same time. each task has its
+own session (`session_scope`) and the flask contexts of the request, other resolvers run
+on the loop. resolvers are the same as the sync view, DataLoaders call `in_thread`.
+"""
+import asyncio
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+
+from flask import _app_ctx_stack, _request_ctx_stack
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from promise import Promise, is_thenable
+
+from example_app.database import session_scope
+from example_app.extensions import db
+
+# 正在异步执行的请求，线程池的任务里为 None
+current_request = ContextVar("async_request", default=None)
+_scopes = itertools.count()
+
+
+def in_thread(fn, *args):
+    """fn(*args) as a promise, in the pool when an async request is executing"""
+    request = current_request.get()
+    if request is None:
+        return Promise.resolve(fn(*args))
+    return Promise.resolve(request.offload(fn, *args))
+
+
+class AsyncRequest(object):
+    """flask contexts, sessions and thread pool of one request on the event loop"""
+
+    def __init__(self, app, environ, pool, loop=None):
+        self.app = app
+        self.app_context = app.app_context()
+        self.request_context = app.request_context(environ)
+        # RequestContext.push 里做的，这里不调用 push
+        interface = app.session_interface
+        self.request_context.session = interface.open_session(
+            app, self.request_context.request
+        ) or interface.make_null_session(app)
+        self.pool = pool
+        self.loop = loop or asyncio.get_event_loop()
+        self.read_only = None
+        self.scopes = []
+        self.scope = self.new_scope()
+
+    def new_scope(self):
+        scope = "async-%d" % next(_scopes)
+        self.scopes.append(scope)
+        return scope
+
+    @contextmanager
+    def active(self):
+        """this is the request of the current context (the asgi task)"""
+        request_token = current_request.set(self)
+        scope_token = session_scope.set(self.scope)
+        try:
+            yield
+        finally:
+            session_scope.reset(scope_token)
+            current_request.reset(request_token)
+
+    @contextmanager
+    def contexts(self):
+        """flask contexts of the request, pushed in this thread
+
+        flask 1.x keeps contexts by thread and the loop thread serves many requests,
+        so they are pushed only around synchronous code, without teardown
+        """
+        _app_ctx_stack.push(self.app_context)
+        _request_ctx_stack.push(self.request_context)
+        try:
+            yield
+        finally:
+            _request_ctx_stack.pop()
+            _app_ctx_stack.pop()
+
+    def route(self, operation):
+        """route the sessions of the request by operation type, once per root field"""
+        with self.contexts():
+            read_only = db.routing_middleware.route(operation)
+        self.read_only = read_only if self.read_only is None else self.read_only and read_only
+
+    def offload(self, fn, *args, **kwargs):
+        """fn in the pool with its own session, returns an asyncio future"""
+        return self.offload_in(self.new_scope(), fn, *args, **kwargs)
+
+    def offload_in(self, scope, fn, *args, **kwargs):
+        """fn in the pool with the session of scope"""
+        context = copy_context()
+        call = partial(context.run, self._run, scope, fn, args, kwargs)
+        return self.loop.run_in_executor(self.pool, call)
+
+    def _run(self, scope, fn, args, kwargs):
+        session_scope.set(scope)
+        current_request.set(None)
+        with self.contexts():
+            if self.read_only is not None:
+                db.session.info["read_only"] = self.read_only
+            result = fn(*args, **kwargs)
+            if is_thenable(result):
+                # promise 的队列和 DataLoader 都按线程，在这个线程里完成
+                result = Promise.resolve(result).get()
+            session = db.session()
+            if session.info.get("read_only"):
+                # 连接还给连接池，已加载的对象不过期，之后的字段在 loop 上读取
+                session.expire_on_commit = False
+                session.commit()
+        return result
+
+    def close(self):
+        """remove the sessions and tear down the contexts, returns an asyncio future"""
+
+        def close():
+            with self.contexts():
+                for scope in self.scopes:
+                    db.remove_session(scope)
+                self.app.do_teardown_request()
+                self.app.do_teardown_appcontext()
+
+        return self.loop.run_in_executor(self.pool, close)
+
+
+class AsyncExecutor(AsyncioExecutor):
+    """root fields run in the pool at the same time (mutations one after another),
+    other resolvers on the loop with the request contexts pushed"""
+
+    def __init__(self, request):
+        super(AsyncExecutor, self).__init__(request.loop)
+        self.request = request
+
+    def execute(self, fn, *args, **kwargs):
+        info = args[1]
+        if len(info.path) == 1:
+            operation = info.operation.operation
+            self.request.route(operation)
+            if operation == "mutation":
+                # 变更字段依次执行，用请求的 session，可以在同一个事务里 (transaction.py)
+                future = self.request.offload_in(self.request.scope, fn, *args, **kwargs)
+            else:
+                future = self.request.offload(fn, *args, **kwargs)
+            self.futures.append(future)
+            return Promise.resolve(future)
+        with self.request.contexts():
+            return super(AsyncExecutor, self).execute(fn, *args, **kwargs)
@@ -0,0 +1,190 @@
+"""graphql backend, parsed and validated documents are cached
+
+    backend = CachedDocumentBackend(max_entries=1000, max_bytes=10 * 1024 * 1024)
+    GraphQLView.as_view("graphql", schema=schema, backend=backend)
+
+with cost_analyzer, operations over depth or cost are rejected before execution,
+the cost is added to response `extensions`.
+
+with result_cache, results of query operations are cached (see result_cache.py).
+
+documents are keyed by sha256 of the query, the same hash Automatic Persisted Queries use.
+`prewarm` adds the documents of a manifest before the first request (before fork).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import execute, ExecutionResult
+from graphql.language.base import parse
+from graphql.validation import validate
+from promise import is_thenable
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf8")).hexdigest()
+
+
+class ExtendedExecutionResult(ExecutionResult):
+    """ExecutionResult, to_dict with `extensions`"""
+
+    __slots__ = ()
+
+    def to_dict(self, format_error=None, dict_class=OrderedDict):
+        response = super(ExtendedExecutionResult, self).to_dict(format_error, dict_class)
+        if self.extensions:
+            response["extensions"] = self.extensions
+        return response
+
+
+def execute_validated(
+    schema, document_ast, errors, cost_analyzer, result_cache, cache_plan, *args, **kwargs
+):
+    """execute without validate, validation errors are cached with the document"""
+    if errors:
+        return ExecutionResult(errors=errors, invalid=True)
+    kwargs.pop("validate", None)
+    extensions = {}
+    if cost_analyzer is not None:
+        extensions["cost"], error = cost_analyzer.check(
+            schema, document_ast, kwargs.get("operation_name"), kwargs.get("variables")
+        )
+        if error is not None:
+            return ExtendedExecutionResult(errors=[error], invalid=True, extensions=extensions)
+    if result_cache is not None:
+        result = result_cache.execute(
+            cache_plan,
+            lambda document: execute(schema, document, *args, **kwargs),
+            kwargs.get("operation_name"),
+            kwargs.get("variables"),
+        )
+    else:
+        result = execute(schema, document_ast, *args, **kwargs)
+
+    def extend(result):
+        return ExtendedExecutionResult(
+            data=result.data, errors=result.errors, invalid=result.invalid, extensions=extensions
+        )
+
+    # return_promise=True (async executor) 时是 promise
+    return result.then(extend) if is_thenable(result) else extend(result)
+
+
+class CachedDocumentBackend(GraphQLBackend):
+    """LRU of parsed and validated documents, bounded by entries and query bytes"""
+
+    def __init__(
+        self,
+        max_entries=1000,
+        max_bytes=10 * 1024 * 1024,
+        executor=None,
+        cost_analyzer=None,
+        result_cache=None,
+    ):
+        self.max_entries = max_entries
+        self.cost_analyzer = cost_analyzer
+        self.result_cache = result_cache
+        self.max_bytes = max_bytes
+        self.execute_params = {"executor": executor} if executor else {}
+        self._documents = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """cached document by query hash or None"""
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is None:
+                return None
+            self._documents.move_to_end(key)
+            return entry[0]
+
+    def clear(self):
+        """drop cached documents, they keep the result_cache they were built with"""
+        with self._lock:
+            self._documents.clear()
+            self._bytes = 0
+
+    def document_from_string(self, schema, document_string):
+        key = query_hash(document_string)
+        document = self.get(key)
+        if document is not None and document.schema is schema:
+            self.hits += 1
+            return document
+        self.misses += 1
+        return self.build(schema, document_string, key)
+
+    def build(self, schema, document_string, key):
+        """parse, validate and cache document_string"""
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(
+                execute_validated,
+                schema,
+                document_ast,
+                errors,
+                self.cost_analyzer,
+                self.result_cache,
+                self.result_cache.plan(schema, document_ast) if self.result_cache else None,
+                **self.execute_params
+            ),
+        )
+        self.put(key, document, len(document_string.encode("utf8")))
+        return document
+
+    def prewarm(self, schema, documents):
+        """parse and validate documents (query strings), not counted as misses
+
+        Returns:
+            int -- documents cached
+        """
+        count = 0
+        for document_string in documents:
+            key = query_hash(document_string)
+            if self.get(key) is None:
+                self.build(schema, document_string, key)
+                count += 1
+        return count
+
+    def put(self, key, document, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._documents:
+                self._bytes -= self._documents.pop(key)[1]
+            self._documents[key] = (document, size)
+            self._bytes += size
+            while len(self._documents) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._documents.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._documents),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": float(self.hits) / total if total else 0.0,
+        }
+
+
+def read_documents(path):
+    """query strings of a manifest: json list, json object {sha256: query} or one .graphql document"""
+    with open(path) as f:
+        if not path.endswith(".json"):
+            return [f.read()]
+        documents = json.load(f)
+    return list(documents.values()) if isinstance(documents, dict) else documents
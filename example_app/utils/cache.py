@@ -0,0 +1,80 @@
+import json
+import time
+import threading
+
+
+def normalize_key(value):
+    """stable string for dict/list values, like filters"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class TTLCache(object):
+    """short time cache, entries are grouped by table so commits can drop them
+
+        cache.set("article", key, 10)
+        cache.get("article", key)
+        cache.invalidate("article")
+    """
+
+    def __init__(self, ttl=10, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, table, key):
+        with self._lock:
+            entry = self._tables.get(table, {}).get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._tables[table][key]
+                return None
+            return value
+
+    def set(self, table, key, value):
+        with self._lock:
+            entries = self._tables.setdefault(table, {})
+            if len(entries) >= self.maxsize:
+                entries.clear()
+            entries[key] = (time.time() + self.ttl, value)
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._tables.pop(table, None)
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+
+# totalCount 缓存
+count_cache = TTLCache(ttl=10)
+
+
+# 表数据变化时调用，参数是表名，例如结果缓存的 invalidate
+invalidation_hooks = []
+
+
+def model_tables(*models):
+    """tables of models and the secondary tables of their many to many relationships"""
+    tables = []
+    for model in models:
+        tables.append(model.__table__.name)
+        for relationship in model.__mapper__.relationships:
+            if relationship.secondary is not None and relationship.secondary.name not in tables:
+                tables.append(relationship.secondary.name)
+    return tables
+
+
+def invalidate_tables(*tables):
+    count_cache.invalidate(*tables)
+    for hook in invalidation_hooks:
+        hook(*tables)
+
+
+def invalidate_model(*models):
+    """drop cached data of models, call it after commit"""
+    invalidate_tables(*model_tables(*models))
@@ -0,0 +1,167 @@
+"""incremental sync by update timestamp
+
+    articleChanges(since: "2020-01-01T00:00:00", first: 100) {
+        nodes { id title }
+        deleted
+        watermark
+        hasMore
+    }
+
+models with a DateTime column with `onupdate` (like Article.update_time) get the field.
+`nodes` are rows changed after `since`, `deleted` are global ids of rows deleted by the
+delete mutations after `since` (tombstones), the client passes `watermark` as `since` next
+time. without `since` all rows are returned (paged by `hasMore`).
+
+the watermark stays GRAPHQL_CHANGES_LAG seconds behind the database clock, rows written by
+transactions still running, or in the same second, are not skipped.
+
+tombstones are kept GRAPHQL_TOMBSTONE_RETENTION seconds, `flask graphql-prune-tombstones`
+deletes older ones (run it from cron). a `since` older than the retention is rejected, the
+client may have missed deletes and syncs again without `since`.
+"""
+import datetime
+
+import graphene
+import sqlalchemy
+from flask import current_app
+from graphene_sqlalchemy.utils import get_query
+from graphql_relay import to_global_id
+from sqlalchemy import func
+
+from example_app.extensions import db
+from .planner import field_selection, plan_query
+from .types import SQLAlchemyObjectTypes
+
+tombstone = db.Table(
+    "tombstone",
+    db.metadata,
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("table_name", db.String(64), nullable=False),
+    db.Column("row_id", db.Integer, nullable=False),
+    db.Column("deleted_at", db.DateTime, nullable=False, default=func.now()),
+    db.Index("ix_tombstone_table_name_deleted_at", "table_name", "deleted_at"),
+)
+
+
+def change_column(model):
+    """DateTime column updated on every update, None when model has none"""
+    for column in sqlalchemy.inspect(model).columns:
+        if isinstance(column.type, sqlalchemy.types.DateTime) and column.onupdate is not None:
+            return column
+    return None
+
+
+def record_deletes(session, model, ids):
+    """add tombstones of deleted rows, in the transaction of the delete"""
+    if not ids or change_column(model) is None:
+        return
+    session.execute(
+        tombstone.insert(), [{"table_name": model.__table__.name, "row_id": _id} for _id in ids]
+    )
+
+
+def prune_tombstones(session, retention):
+    """delete tombstones older than retention seconds, table by table to use the index
+
+    Returns:
+        int -- number of deleted tombstones
+    """
+    until = session.query(func.now()).scalar() - datetime.timedelta(seconds=retention)
+    count = 0
+    for name, in session.query(tombstone.c.table_name).distinct().all():
+        result = session.execute(
+            tombstone.delete()
+            .where(tombstone.c.table_name == name)
+            .where(tombstone.c.deleted_at < until)
+        )
+        count += result.rowcount
+    return count
+
+
+def changed_rows(query, column, pk, since, until, first):
+    """rows changed in (since, until] ordered by (column, pk), at most first
+
+    a page never ends inside a timestamp, rows of the same timestamp are on one page
+
+    Returns:
+        (list, datetime, bool) -- rows, watermark, more rows after watermark
+    """
+    if since is not None:
+        query = query.filter(column > since)
+    query = query.filter(column <= until).order_by(column, pk)
+    rows = query.limit(first + 1).all()
+    if len(rows) <= first:
+        return rows, until, False
+    last = getattr(rows[first - 1], column.key)
+    page = [row for row in rows[:first] if getattr(row, column.key) < last]
+    if getattr(rows[first], column.key) != last:
+        return rows[:first], last, True
+    if not page:
+        # 整页都是同一个时间，since 之后到 last 只有这个时间的行
+        # sqlite 的 CURRENT_TIMESTAMP 没有微秒，不能用 == 比较
+        return query.filter(column <= last).all(), last, True
+    return page, getattr(page[-1], column.key), True
+
+
+class ChangesField(graphene.Field):
+    def __init__(self, model, changes_type):
+        self.model = model
+        super(ChangesField, self).__init__(
+            changes_type,
+            since=graphene.DateTime(description="上次的 watermark，不传返回全部"),
+            first=graphene.Int(default_value=100),
+            resolver=self.resolve_changes,
+        )
+
+    def resolve_changes(self, root, info, since=None, first=100):
+        model = self.model
+        column = change_column(model)
+        pk = sqlalchemy.inspect(model).primary_key[0]
+        session = db.session
+        lag = current_app.config.get("GRAPHQL_CHANGES_LAG", 2)
+        now = session.query(func.now()).scalar()
+        until = now - datetime.timedelta(seconds=lag)
+        if since is not None and since.tzinfo is not None:
+            # 数据库里是不带时区的 UTC
+            since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        retention = current_app.config.get("GRAPHQL_TOMBSTONE_RETENTION")
+        if since is not None and retention is not None and since < now - datetime.timedelta(seconds=retention):
+            # 之后的删除记录可能已经清理
+            raise ValueError("since 早于删除记录的保留期限 %d 秒，不传 since 重新同步" % retention)
+        if since is not None and since >= until:
+            return dict(nodes=[], deleted=[], watermark=since, has_more=False)
+        query = plan_query(
+            get_query(model, info.context),
+            model,
+            field_selection(info).get("nodes", {}),
+            [column.key],
+        )
+        rows, watermark, has_more = changed_rows(query, column, pk, since, until, max(first, 1))
+        deleted = []
+        if since is not None:
+            name = SQLAlchemyObjectTypes().get(model)._meta.name
+            deleted = [
+                to_global_id(name, row_id)
+                for row_id, in session.query(tombstone.c.row_id)
+                .filter(tombstone.c.table_name == model.__table__.name)
+                .filter(tombstone.c.deleted_at > since, tombstone.c.deleted_at <= watermark)
+                .order_by(tombstone.c.deleted_at, tombstone.c.id)
+            ]
+        return dict(nodes=rows, deleted=deleted, watermark=watermark, has_more=has_more)
+
+
+def model_changes(model):
+    """`<model>Changes` field, None when model has no update timestamp"""
+    if change_column(model) is None:
+        return None
+    changes_type = type(
+        model.__name__ + "Changes",
+        (graphene.ObjectType,),
+        {
+            "nodes": graphene.List(graphene.NonNull(lambda: SQLAlchemyObjectTypes().get(model))),
+            "deleted": graphene.List(graphene.NonNull(graphene.ID), description="删除的 global id"),
+            "watermark": graphene.DateTime(description="下次请求的 since"),
+            "has_more": graphene.Boolean(description="watermark 之后还有数据，立即再请求"),
+        },
+    )
+    return ChangesField(model, changes_type)
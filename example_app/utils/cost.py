@@ -0,0 +1,188 @@
+"""static query cost, computed before execution
+
+    cost of a field:
+        scalar        0
+        object        1 + cost of children
+        connection    1 + page size * (1 + cost of node children)
+        list          1 + fan out * cost of children
+
+    page size is `first`/`last`/`limit` (or its default in the schema, negative values are
+    rejected), default_list_size
+    when not given at root, default_fanout for nested relationships without page size.
+    lists with a size cost like connections, 1 + size * (1 + cost of children): the
+    number of `ids` (`nodes(ids:)`), their own page size (`modelAggregate(limit:)`) or the
+    page size of their object (`<model>Changes(first:) { nodes }`).
+    depth counts object fields, `edges`/`node` of connections are not counted.
+"""
+from graphql.error import GraphQLError
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLObjectType, GraphQLInterfaceType
+from graphql.type.definition import get_named_type, get_nullable_type
+
+PAGE_ARGUMENTS = ("first", "last", "limit")
+
+
+class QueryCostError(GraphQLError):
+    """operation over depth or cost limit"""
+
+
+def is_connection(graphql_type):
+    return (
+        isinstance(graphql_type, GraphQLObjectType)
+        and "edges" in graphql_type.fields
+        and "pageInfo" in graphql_type.fields
+    )
+
+
+class QueryCostAnalyzer(object):
+    def __init__(self, max_depth=10, max_cost=10000, default_list_size=100, default_fanout=10):
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.default_list_size = default_list_size
+        self.default_fanout = default_fanout
+
+    def analyze(self, schema, document_ast, operation_name=None, variables=None):
+        """
+        Returns:
+            (cost, depth)
+        """
+        operation = None
+        fragments = {}
+        for definition in document_ast.definitions:
+            if isinstance(definition, ast.FragmentDefinition):
+                fragments[definition.name.value] = definition
+            elif isinstance(definition, ast.OperationDefinition):
+                if operation_name is None or (
+                    definition.name and definition.name.value == operation_name
+                ):
+                    operation = operation or definition
+        if operation is None:
+            return 0, 0
+        if operation.operation == "mutation":
+            root_type = schema.get_mutation_type()
+        elif operation.operation == "subscription":
+            root_type = schema.get_subscription_type()
+        else:
+            root_type = schema.get_query_type()
+        variables = dict(variables or {})
+        for definition in operation.variable_definitions or []:
+            name = definition.variable.name.value
+            if name not in variables and definition.default_value is not None:
+                variables[name] = self._value(definition.default_value, {})
+        context = (schema, fragments, variables)
+        return self._selection_cost(context, operation.selection_set, root_type, None, True)
+
+    def check(self, schema, document_ast, operation_name=None, variables=None):
+        """
+        Returns:
+            (dict, QueryCostError) -- cost for response extensions, error when over limit
+        """
+        try:
+            cost, depth = self.analyze(schema, document_ast, operation_name, variables)
+        except QueryCostError as error:
+            return {"maximum": self.max_cost, "maxDepth": self.max_depth}, error
+        info = {"requested": cost, "depth": depth, "maximum": self.max_cost, "maxDepth": self.max_depth}
+        if self.max_depth is not None and depth > self.max_depth:
+            return info, QueryCostError("查询深度 %d 超过上限 %d" % (depth, self.max_depth))
+        if self.max_cost is not None and cost > self.max_cost:
+            return info, QueryCostError("查询代价 %d 超过上限 %d" % (cost, self.max_cost))
+        return info, None
+
+    def _selection_cost(self, context, selection_set, parent_type, list_size, is_root):
+        cost = depth = 0
+        for field, field_parent in self._fields(context, selection_set, parent_type):
+            field_cost, field_depth = self._field_cost(context, field, field_parent, list_size, is_root)
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+    def _fields(self, context, selection_set, parent_type):
+        schema, fragments, _ = context
+        if selection_set is None:
+            return
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                yield selection, parent_type
+            else:
+                if isinstance(selection, ast.FragmentSpread):
+                    fragment = fragments.get(selection.name.value)
+                    if fragment is None:
+                        continue
+                    type_condition, sub = fragment.type_condition, fragment.selection_set
+                else:
+                    type_condition, sub = selection.type_condition, selection.selection_set
+                fragment_type = schema.get_type(type_condition.name.value) if type_condition else parent_type
+                for item in self._fields(context, sub, fragment_type or parent_type):
+                    yield item
+
+    def _field_cost(self, context, field, parent_type, list_size, is_root):
+        name = field.name.value
+        if name.startswith("__") or not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)):
+            return 0, 0
+        field_def = parent_type.fields.get(name)
+        if field_def is None:
+            return 0, 0
+        field_type = get_nullable_type(field_def.type)
+        named_type = get_named_type(field_type)
+        if not isinstance(named_type, (GraphQLObjectType, GraphQLInterfaceType)):
+            return 0, 0
+        if is_connection(named_type):
+            size = self._page_size(context, field)
+            if size is None:
+                size = self.default_list_size if is_root else self.default_fanout
+            cost, depth = self._selection_cost(context, field.selection_set, named_type, size, False)
+            return 1 + cost, depth + 1
+        page = self._page_size(context, field, field_def)
+        if isinstance(field_type, GraphQLList) and name != "edges":
+            size = self._ids_size(context, field)
+            if size is None:
+                size = page if page is not None else list_size
+            if size is not None:
+                # 按 ids、分页参数或者分页对象取的列表，每一项和连接的节点一样算
+                cost, depth = self._selection_cost(context, field.selection_set, named_type, None, False)
+                return 1 + size * (1 + cost), depth + 1
+        multiplier = 1
+        if isinstance(field_type, GraphQLList):
+            # edges 用连接的分页大小，其他列表用 fan out
+            multiplier = list_size if list_size is not None else self.default_fanout
+        child_list_size = list_size if name == "edges" else page
+        cost, depth = self._selection_cost(context, field.selection_set, named_type, child_list_size, False)
+        if list_size is not None and name == "edges":
+            return multiplier * cost, depth
+        if list_size is not None and name == "node":
+            return 1 + cost, depth
+        return 1 + multiplier * cost, depth + 1
+
+    def _page_size(self, context, field, field_def=None):
+        _, _, variables = context
+        for argument in field.arguments or []:
+            if argument.name.value in PAGE_ARGUMENTS:
+                value = self._value(argument.value, variables)
+                if isinstance(value, int):
+                    if value < 0:
+                        # 负数会让代价变成负的，抵消其他字段
+                        raise QueryCostError("分页参数 %s 不能为负数: %d" % (argument.name.value, value))
+                    return value
+        if field_def is not None:
+            for name in PAGE_ARGUMENTS:
+                if name in field_def.args and isinstance(field_def.args[name].default_value, int):
+                    return field_def.args[name].default_value
+        return None
+
+    def _ids_size(self, context, field):
+        _, _, variables = context
+        for argument in field.arguments or []:
+            if argument.name.value == "ids":
+                if isinstance(argument.value, ast.ListValue):
+                    return len(argument.value.values)
+                value = self._value(argument.value, variables)
+                if isinstance(value, (list, tuple)):
+                    return len(value)
+        return None
+
+    def _value(self, value, variables):
+        if isinstance(value, ast.Variable):
+            return variables.get(value.name.value)
+        if isinstance(value, ast.IntValue):
+            return int(value.value)
+        return getattr(value, "value", None)
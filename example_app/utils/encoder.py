@@ -0,0 +1,216 @@
+"""response encoding of /graphql: json backend, compression and streaming
+
+    GRAPHQL_JSON_BACKEND=orjson     orjson (optional, pip install orjson), the default when installed
+    GRAPHQL_JSON_BACKEND=json       standard library
+
+both write utf8 without escaping, datetime, date and time as iso format and Decimal as
+a string of its exact digits ("12.30", like the graphene Decimal scalar), a json number
+would be read back as a float by most clients. bodies of at least GRAPHQL_COMPRESS_MIN_BYTES are compressed with br (optional,
+pip install brotli) or gzip, whichever the client prefers in `Accept-Encoding`.
+
+results of operations with a cost (`extensions.cost.requested`) of at least
+GRAPHQL_STREAM_MIN_COST are streamed: lists and objects of the first levels are encoded
+one item at a time and sent (compressed) in chunks of about GRAPHQL_STREAM_CHUNK_BYTES,
+the whole body is never in memory. streamed responses have no Content-Length.
+"""
+import datetime
+import decimal
+import json
+import zlib
+
+from flask import Response
+
+try:
+    import orjson  # 可选依赖，pip install orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli  # 可选依赖，pip install brotli
+except ImportError:
+    brotli = None
+
+
+def json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        # 转 float 会丢精度
+        return str(value)
+    raise TypeError("can not encode %r" % value)
+
+
+class StdlibJSON(object):
+    name = "json"
+
+    def __init__(self):
+        # 非默认参数的 json.dumps 每次都新建 encoder
+        self._compact = json.JSONEncoder(
+            default=json_default, ensure_ascii=False, separators=(",", ":")
+        ).encode
+        self._pretty = json.JSONEncoder(
+            default=json_default, ensure_ascii=False, indent=2, separators=(",", ": ")
+        ).encode
+
+    def dumps(self, value, pretty=False):
+        return (self._pretty if pretty else self._compact)(value).encode("utf8")
+
+
+class OrJSON(object):
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson 没有安装，pip install orjson")
+        self._fallback = StdlibJSON()
+
+    def dumps(self, value, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(value, default=json_default, option=option)
+        except orjson.JSONEncodeError:
+            # 超过 64 位的整数等 orjson 不支持的值
+            return self._fallback.dumps(value, pretty)
+
+
+# name -> json backend
+json_backends = {"json": StdlibJSON, "orjson": OrJSON}
+
+# Content-Encoding -> level, fast levels for dynamic responses (gzip 6 is twice as slow for 1% less)
+COMPRESSION_LEVELS = {"br": 4, "gzip": 5}
+
+
+def compressor(encoding, level):
+    """
+    Returns:
+        (function, function) -- compress a chunk, flush the rest
+    """
+    if encoding == "br":
+        stream = brotli.Compressor(quality=level)
+        return stream.process, stream.finish
+    stream = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return stream.compress, stream.flush
+
+
+class ResponseEncoder(object):
+    """
+    Arguments:
+        backend {str} -- name in json_backends, orjson when installed by default
+        compress_min_bytes {int} -- smallest body to compress, None to never compress
+        stream_min_cost {int} -- smallest operation cost to stream, None to never stream
+        chunk_bytes {int} -- size of streamed chunks
+        stream_depth {int} -- levels of objects and lists encoded item by item when streaming
+        levels {dict} -- compression level by encoding, COMPRESSION_LEVELS by default
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        compress_min_bytes=1024,
+        stream_min_cost=None,
+        chunk_bytes=64 * 1024,
+        stream_depth=5,
+        levels=None,
+    ):
+        if backend is None:
+            backend = "orjson" if orjson is not None else "json"
+        if backend not in json_backends:
+            raise ValueError("不支持的 json 库 %s，支持: %s" % (backend, ", ".join(json_backends)))
+        self.json = json_backends[backend]()
+        self.compress_min_bytes = compress_min_bytes
+        self.stream_min_cost = stream_min_cost
+        self.chunk_bytes = chunk_bytes
+        self.stream_depth = stream_depth
+        self.levels = dict(COMPRESSION_LEVELS, **(levels or {}))
+        self.encodings = [e for e in ("br", "gzip") if e != "br" or brotli is not None]
+
+    def dumps(self, value, pretty=False):
+        """json bytes"""
+        return self.json.dumps(value, pretty)
+
+    def iterencode(self, value, depth=None):
+        """json bytes in pieces, objects and lists down to depth are split by item"""
+        if depth is None:
+            depth = self.stream_depth
+        if depth and isinstance(value, dict) and value:
+            separator = b"{"
+            for key, item in value.items():
+                yield separator + self.dumps(key if isinstance(key, str) else str(key)) + b":"
+                for piece in self.iterencode(item, depth - 1):
+                    yield piece
+                separator = b","
+            yield b"}"
+        elif depth and isinstance(value, (list, tuple)) and value:
+            separator = b"["
+            for item in value:
+                yield separator
+                for piece in self.iterencode(item, depth - 1):
+                    yield piece
+                separator = b","
+            yield b"]"
+        else:
+            yield self.dumps(value)
+
+    def chunked(self, pieces, chunk_bytes=None):
+        """join pieces to chunks of about chunk_bytes (self.chunk_bytes by default)"""
+        if chunk_bytes is None:
+            chunk_bytes = self.chunk_bytes
+        parts, size = [], 0
+        for piece in pieces:
+            parts.append(piece)
+            size += len(piece)
+            if size >= chunk_bytes:
+                yield b"".join(parts)
+                parts, size = [], 0
+        if parts:
+            yield b"".join(parts)
+
+    def streams(self, cost):
+        return self.stream_min_cost is not None and cost is not None and cost >= self.stream_min_cost
+
+    def negotiate(self, accept_encodings, size=None):
+        """best encoding of Accept-Encoding for a body of size (None when unknown)
+
+        Arguments:
+            accept_encodings {Accept} -- request.accept_encodings
+        """
+        if self.compress_min_bytes is None:
+            return None
+        if size is not None and size < self.compress_min_bytes:
+            return None
+        best, quality = None, 0
+        for encoding in self.encodings:
+            if accept_encodings[encoding] > quality:
+                best, quality = encoding, accept_encodings[encoding]
+        return best
+
+    def response(self, body, status=200, accept_encodings=None, content_type="application/json", **kwargs):
+        """Response of json bytes, compressed when accepted"""
+        encoding = self.negotiate(accept_encodings, len(body)) if accept_encodings is not None else None
+        if encoding is not None:
+            compress, flush = compressor(encoding, self.levels[encoding])
+            body = compress(body) + flush()
+        return self._response(body, status, encoding, content_type, **kwargs)
+
+    def stream_response(self, chunks, status=200, accept_encodings=None, content_type="application/json", **kwargs):
+        """Response of an iterator of bytes, compressed chunk by chunk when accepted"""
+        encoding = self.negotiate(accept_encodings) if accept_encodings is not None else None
+        if encoding is not None:
+            chunks = self._compressed(chunks, encoding)
+        return self._response(chunks, status, encoding, content_type, **kwargs)
+
+    def _compressed(self, chunks, encoding):
+        compress, flush = compressor(encoding, self.levels[encoding])
+        for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield flush()
+
+    def _response(self, body, status, encoding, content_type, **kwargs):
+        response = Response(body, status=status, content_type=content_type, **kwargs)
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        if self.compress_min_bytes is not None:
+            # 同一个地址按客户端返回不同编码，缓存要区分
+            response.vary.add("Accept-Encoding")
+        return response
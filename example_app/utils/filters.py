@@ -0,0 +1,210 @@
+"""filter compiler
+
+filters document, same as filter_query:
+
+    [{key: "title", op: "starts", val: "a"},          # AND
+     [{key: "id", op: "<", val: 3}, {...}],           # OR
+     [[{...}, {...}], {...}]]                         # nested list switch AND/OR
+
+compile_filters(model, filters) returns a FilterPlan, plans are cached by the
+shape of the document (keys and ops, not values), values are bound with
+bindparam so one plan is reused for every request of the same shape.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import and_, or_, not_, bindparam
+from sqlalchemy.inspection import inspect as sqlalchemyinspect
+
+from .search import search_indexes, search_terms
+
+
+class FilterError(ValueError):
+    """invalid filters document"""
+
+
+def _like(template):
+    return lambda v: template % v
+
+
+def _match(column, param):
+    """column matches fts5 expression, the model needs a search_index with the column"""
+    index = search_indexes.get(column.class_)
+    if index is None or column.key not in index.columns:
+        raise FilterError("%s.%s 没有全文索引" % (column.class_.__name__, column.key))
+    return index.condition(param, column.key)
+
+
+def _search_terms(value):
+    terms = search_terms(str(value))
+    if not terms:
+        raise FilterError("搜索内容不能为空")
+    return terms
+
+
+# op -> (build condition from column and bindparam, convert value, value is list)
+OPERATORS = {
+    "==": (lambda c, p: c == p, None, False),
+    "!=": (lambda c, p: c != p, None, False),
+    "<=": (lambda c, p: c <= p, None, False),
+    ">=": (lambda c, p: c >= p, None, False),
+    ">": (lambda c, p: c > p, None, False),
+    "<": (lambda c, p: c < p, None, False),
+    "starts": (lambda c, p: c.ilike(p), _like("%s%%"), False),
+    "ends": (lambda c, p: c.ilike(p), _like("%%%s"), False),
+    "contains": (lambda c, p: c.contains(p), None, False),
+    "in": (lambda c, p: c.in_(p), None, True),
+    "notin": (lambda c, p: not_(c.in_(p)), None, True),
+    # 全文索引: search 是普通词语，match 是 fts5 查询语法
+    "search": (_match, _search_terms, False),
+    "match": (_match, None, False),
+}
+
+
+def filter_shape(filters):
+    """shape of filters document, values removed"""
+    if isinstance(filters, dict):
+        key, op = filters.get("key"), filters.get("op")
+        if not isinstance(key, str) or not isinstance(op, str):
+            raise FilterError("过滤条件缺少 key 或 op: %r" % (filters,))
+        return (key, op)
+    if isinstance(filters, (list, tuple)):
+        return tuple(filter_shape(f) for f in filters)
+    raise FilterError("过滤条件格式错误: %r" % (filters,))
+
+
+def filter_values(filters):
+    """values of filters document, in the same order as the plan params"""
+    if isinstance(filters, dict):
+        return [filters.get("val")]
+    values = []
+    for f in filters:
+        values.extend(filter_values(f))
+    return values
+
+
+def resolve_column(model, path):
+    """`name` or relationship path `roles.name`
+
+    Returns:
+        (column, wrap) -- wrap(condition) puts the condition in relationship any()/has()
+    """
+    names = path.split(".")
+    wraps = []
+    current = model
+    for name in names[:-1]:
+        relationship = sqlalchemyinspect(current).relationships.get(name)
+        if relationship is None:
+            raise FilterError("%s 没有关系 %s" % (current.__name__, name))
+        attr = getattr(current, name)
+        wraps.append(attr.any if relationship.uselist else attr.has)
+        current = relationship.mapper.entity
+    column = sqlalchemyinspect(current).column_attrs.get(names[-1])
+    if column is None:
+        raise FilterError("%s 没有字段 %s" % (current.__name__, names[-1]))
+
+    def wrap(condition):
+        for w in reversed(wraps):
+            condition = w(condition)
+        return condition
+
+    return getattr(current, names[-1]), wrap
+
+
+# model -> attribute keys that can be filtered (allow_filters), other models have no limit
+filter_columns = {}
+
+
+def allow_filters(model, *keys):
+    """only keys of model can be filtered, `search`/`match` use their full text index"""
+    filter_columns[model] = frozenset(keys)
+    # 缓存的计划是按之前的字段检查的
+    plan_cache.clear()
+
+
+class FilterPlan(object):
+    """compiled filters, apply(query, filters) binds the values"""
+
+    def __init__(self, model, filters):
+        self.model = model
+        self.params = []
+        self.conditions = [self._compile(f, and_level=True) for f in filters]
+
+    def _compile(self, _filter, and_level):
+        if isinstance(_filter, (list, tuple)):
+            conditions = [self._compile(f, not and_level) for f in _filter]
+            # 列表内的条件与外层相反: AND 里是 OR，OR 里是 AND
+            return or_(*conditions) if and_level else and_(*conditions)
+        if not isinstance(_filter, dict):
+            raise FilterError("过滤条件格式错误: %r" % (_filter,))
+        key, op = _filter.get("key"), _filter.get("op")
+        if not key:
+            raise FilterError("过滤条件缺少 key: %r" % (_filter,))
+        if op not in OPERATORS:
+            raise FilterError("不支持的操作 %s，支持: %s" % (op, ", ".join(OPERATORS)))
+        build, convert, is_list = OPERATORS[op]
+        column, wrap = resolve_column(self.model, key)
+        allowed = filter_columns.get(column.class_)
+        if allowed is not None and column.key not in allowed and op not in ("search", "match"):
+            raise FilterError(
+                "%s.%s 不能过滤，可以过滤: %s"
+                % (column.class_.__name__, column.key, ", ".join(sorted(allowed)))
+            )
+        name = "filter_%d" % len(self.params)
+        self.params.append((name, convert, is_list, key, op))
+        return wrap(build(column, bindparam(name, expanding=is_list)))
+
+    def bind(self, filters):
+        """filters values to params dict"""
+        params = {}
+        for (name, convert, is_list, key, op), value in zip(self.params, filter_values(filters)):
+            if value is None:
+                raise FilterError("过滤条件 %s %s 缺少 val" % (key, op))
+            if is_list and not isinstance(value, (list, tuple)):
+                raise FilterError("过滤条件 %s %s 的 val 必须是列表" % (key, op))
+            params[name] = convert(value) if convert else value
+        return params
+
+    def apply(self, query, filters):
+        if not self.conditions:
+            return query
+        return query.filter(*self.conditions).params(**self.bind(filters))
+
+
+class FilterPlanCache(object):
+    """LRU of FilterPlan by (model, shape)"""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model, filters):
+        key = (model, filter_shape(filters))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        plan = FilterPlan(model, filters)
+        with self._lock:
+            self._plans[key] = plan
+            if len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+
+plan_cache = FilterPlanCache()
+
+
+def compile_filters(model, filters):
+    """cached FilterPlan for filters document"""
+    if isinstance(filters, dict):
+        filters = [filters]
+    if not isinstance(filters, (list, tuple)):
+        raise FilterError("过滤条件必须是列表: %r" % (filters,))
+    return plan_cache.get(model, filters)
@@ -0,0 +1,346 @@
+"""index advisor for filters and sort of list fields
+
+    flask graphql-indexes --usage http://localhost:5000/graphql/stats --migration
+
+list fields count their query shapes while serving (`index_usage`, model, filter keys and
+ops, sort columns, no values; results from the result cache do not reach the database and
+are not counted), `/graphql/stats` returns them as `index_usage`. the advisor
+takes the most frequent shapes, runs `EXPLAIN QUERY PLAN` (sqlite) of the query with
+placeholder values and proposes an index when the table is scanned or sorted in a temp
+b-tree:
+
+    equality columns (==, in), then sort columns and primary key (keyset paging) in the
+    directions of the sort, or a range column (<, >, ...) when sorted by primary key only
+
+on sqlite every proposal is created in a transaction that is rolled back to check the
+plan uses it. proposals are written as a migration of the `migrate` extension, add the
+printed `db.Index` to the model too, `flask db migrate` would drop it otherwise.
+"""
+import datetime
+import threading
+from collections import Counter, namedtuple
+
+import sqlalchemy
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from .filters import FilterError, compile_filters, filter_shape, resolve_column
+
+EQUALITY_OPS = ("==", "in")
+RANGE_OPS = ("<", ">", "<=", ">=")
+
+
+class IndexUsage(object):
+    """counts of list queries by shape, at most max_shapes shapes"""
+
+    def __init__(self, max_shapes=1000):
+        self.max_shapes = max_shapes
+        self.dropped = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, model, filters, sort, count=1):
+        """
+        Arguments:
+            filters {list} -- filters document, only keys and ops are kept
+            sort {list} -- [(attribute key, descending)]
+        """
+        if isinstance(filters, dict):
+            filters = [filters]
+        try:
+            shape = filter_shape(filters or [])
+        except FilterError:
+            return
+        key = (model.__name__, shape, tuple((k, bool(desc)) for k, desc in sort))
+        with self._lock:
+            if key in self._counts or len(self._counts) < self.max_shapes:
+                self._counts[key] += count
+            else:
+                self.dropped += count
+
+    def shapes(self, top=None):
+        """most frequent shapes, json serializable"""
+        with self._lock:
+            common = self._counts.most_common(top)
+        return [
+            {
+                "model": model,
+                "filters": _shape_document(shape),
+                "sort": [[key, desc] for key, desc in sort],
+                "count": count,
+            }
+            for (model, shape, sort), count in common
+        ]
+
+    def load(self, shapes, models):
+        """add counts of `shapes()` output, from another process"""
+        models = dict((model.__name__, model) for model in models)
+        for item in shapes:
+            model = models.get(item["model"])
+            if model is not None:
+                self.record(model, item["filters"], item["sort"], item["count"])
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self.dropped = 0
+
+
+index_usage = IndexUsage()
+
+
+def _shape_document(shape):
+    """filter_shape back to a filters document without values"""
+    if len(shape) == 2 and all(isinstance(s, str) for s in shape):
+        return {"key": shape[0], "op": shape[1]}
+    return [_shape_document(s) for s in shape]
+
+
+# python type of column -> value
+PLACEHOLDERS = {
+    str: "",
+    datetime.datetime: datetime.datetime(2000, 1, 1),
+    datetime.date: datetime.date(2000, 1, 1),
+    bool: False,
+}
+
+
+def _placeholders(model, filters):
+    """filters document with a value of the column type for every filter, plans do not depend on it"""
+    if not isinstance(filters, dict):
+        return [_placeholders(model, f) for f in filters]
+    column, _ = resolve_column(model, filters["key"])
+    try:
+        value = PLACEHOLDERS.get(column.type.python_type, 0)
+    except NotImplementedError:
+        value = 0
+    if filters["op"] in ("search", "match"):
+        value = "placeholder"
+    return dict(filters, val=[value] if filters["op"] in ("in", "notin") else value)
+
+
+class ExplainQueryPlan(Executable, ClauseElement):
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(ExplainQueryPlan)
+def _explain_query_plan(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+def explain(session, model, query):
+    """sqlite plan of query, list of detail lines, None on other databases"""
+    mapper = sqlalchemy.inspect(model)
+    if session.get_bind(mapper=mapper).dialect.name != "sqlite":
+        return None
+    return [row[-1] for row in session.execute(ExplainQueryPlan(query.statement), mapper=mapper)]
+
+
+def needs_index(plan, table):
+    """table scanned or rows sorted in a temp b-tree"""
+    for line in plan:
+        words = line.split()
+        if words[:1] == ["SCAN"] and table in words and "USING" not in words:
+            return True
+        if "TEMP B-TREE" in line:
+            return True
+    return False
+
+
+def shape_query(model, filters, sort, limit=20):
+    """query of a list field with this shape, values are placeholders"""
+    query = model.query
+    if filters:
+        filters = _placeholders(model, filters)
+        query = compile_filters(model, filters).apply(query, filters)
+    columns = [getattr(model, key) for key, _ in sort]
+    query = query.order_by(*[c.desc() if desc else c.asc() for c, (_, desc) in zip(columns, sort)])
+    return query.limit(limit)
+
+
+class Proposal(namedtuple("Proposal", "model columns descending")):
+    """index of column names, descending is a bool of every column"""
+
+    @property
+    def table(self):
+        return self.model.__table__.name
+
+    @property
+    def name(self):
+        names = [c + "_desc" if desc else c for c, desc in zip(self.columns, self.descending)]
+        return "ix_%s_%s" % (self.table, "_".join(names))
+
+    def expressions(self, quote=lambda name: name):
+        return [quote(c) + " DESC" if desc else quote(c) for c, desc in zip(self.columns, self.descending)]
+
+    def model_index(self):
+        """line for __table_args__ of the model"""
+        columns = [
+            'db.text("%s DESC")' % c if desc else '"%s"' % c for c, desc in zip(self.columns, self.descending)
+        ]
+        return 'db.Index("%s", %s)' % (self.name, ", ".join(columns))
+
+
+def propose(model, filters, sort):
+    """indexes for the shape, root model first then related models of `a.b` keys"""
+    equal, ranges, related = [], [], []
+    for item in filters or []:
+        # OR 组里的条件用不上一个组合索引
+        if not isinstance(item, dict):
+            continue
+        key, op = item["key"], item["op"]
+        if "." in key:
+            target, column = _related_column(model, key)
+            if target is not None and (op in EQUALITY_OPS or op in RANGE_OPS):
+                related.append(Proposal(target, tuple(_column_names(target, [column])), (False,)))
+            continue
+        if op in EQUALITY_OPS and key not in equal:
+            equal.append(key)
+        elif op in RANGE_OPS and key not in ranges:
+            ranges.append(key)
+    mapper = sqlalchemy.inspect(model)
+    primary = [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+    order = [(key, desc) for key, desc in sort if key not in equal]
+    if [key for key, _ in order if key not in primary]:
+        # 索引可以倒着读，第一个排序字段总是升序
+        flip = order[0][1]
+        columns = equal + [key for key, _ in order]
+        descending = [False] * len(equal) + [desc != flip for _, desc in order]
+    else:
+        columns = equal + ranges[:1]
+        descending = [False] * len(columns)
+    if not columns or columns == primary:
+        return related
+    return [Proposal(model, tuple(_column_names(model, columns)), tuple(descending))] + related
+
+
+def _related_column(model, path):
+    names = path.split(".")
+    current = model
+    for name in names[:-1]:
+        relationship = sqlalchemy.inspect(current).relationships.get(name)
+        if relationship is None:
+            return None, None
+        current = relationship.mapper.entity
+    if names[-1] not in sqlalchemy.inspect(current).column_attrs:
+        return None, None
+    return current, names[-1]
+
+
+def _column_names(model, keys):
+    mapper = sqlalchemy.inspect(model)
+    return [mapper.column_attrs[key].columns[0].name for key in keys]
+
+
+def existing_indexes(bind, table):
+    """column name lists of indexes, primary key and unique constraints, in database and models"""
+    inspector = sqlalchemy.inspect(bind)
+    found = [tuple(c.name for c in table.primary_key.columns)]
+    found.extend(tuple(c.name for c in index.columns) for index in table.indexes)
+    if bind.has_table(table.name):
+        found.append(tuple(inspector.get_pk_constraint(table.name)["constrained_columns"]))
+        found.extend(tuple(i["column_names"]) for i in inspector.get_indexes(table.name))
+        found.extend(tuple(u["column_names"]) for u in inspector.get_unique_constraints(table.name))
+    return found
+
+
+def is_covered(proposal, indexes):
+    if any(proposal.descending):
+        # 数据库没有返回索引的方向，用查询计划判断
+        return False
+    return any(index[: len(proposal.columns)] == proposal.columns for index in indexes)
+
+
+def try_index(session, proposal, query):
+    """plan of query with the proposed index, created in a transaction that is rolled back"""
+    bind = session.get_bind(mapper=sqlalchemy.inspect(proposal.model))
+    if bind.dialect.name != "sqlite":
+        return None
+    quote = bind.dialect.identifier_preparer.quote
+    with bind.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(
+                "CREATE INDEX %s ON %s (%s)"
+                % (quote(proposal.name), quote(proposal.table), ", ".join(proposal.expressions(quote)))
+            )
+            statement = ExplainQueryPlan(query.statement)
+            return [row[-1] for row in connection.execute(statement)]
+        finally:
+            transaction.rollback()
+
+
+Advice = namedtuple("Advice", "model filters sort count plan proposals")
+
+
+def advise(session, shapes, models, min_count=1, verify=True):
+    """
+    Arguments:
+        shapes {list} -- IndexUsage.shapes()
+        models {list} -- models of the schema
+
+    Returns:
+        list -- Advice of every shape, proposals are (Proposal, plan with the index or None)
+    """
+    models = dict((model.__name__, model) for model in models)
+    advices = []
+    for item in shapes:
+        model = models.get(item["model"])
+        if model is None or item["count"] < min_count:
+            continue
+        sort = [tuple(s) for s in item["sort"]]
+        query = shape_query(model, item["filters"], sort)
+        plan = explain(session, model, query)
+        proposals = []
+        if plan is None or needs_index(plan, model.__table__.name):
+            for proposal in propose(model, item["filters"], sort):
+                bind = session.get_bind(mapper=sqlalchemy.inspect(proposal.model))
+                if is_covered(proposal, existing_indexes(bind, proposal.model.__table__)):
+                    continue
+                after = try_index(session, proposal, query) if verify else None
+                if after is not None and after == plan:
+                    # 查询计划没有用到这个索引
+                    continue
+                proposals.append((proposal, after))
+        advices.append(Advice(model, item["filters"], sort, item["count"], plan, proposals))
+    return advices
+
+
+def indexed_columns(model):
+    """attribute keys of columns that lead an index, primary key or unique constraint"""
+    table = model.__table__
+    leading = set(c.name for c in table.primary_key.columns)
+    for index in table.indexes:
+        leading.add(list(index.columns)[0].name)
+    for constraint in table.constraints:
+        if isinstance(constraint, sqlalchemy.UniqueConstraint) and constraint.columns:
+            leading.add(list(constraint.columns)[0].name)
+    mapper = sqlalchemy.inspect(model)
+    return frozenset(key for key, prop in mapper.column_attrs.items() if prop.columns[0].name in leading)
+
+
+def write_migration(migrate, proposals, message="graphql indexes"):
+    """migration creating the proposals, in the directory of the migrate extension
+
+    Returns:
+        alembic Script
+    """
+    from alembic import command
+    from alembic.operations import ops
+
+    config = migrate.get_config()
+    # 运行 env.py，process_revision_directives 才会生效
+    config.set_main_option("revision_environment", "true")
+
+    def directives(context, revision, scripts):
+        script = scripts[0]
+        script.upgrade_ops.ops[:] = [
+            ops.CreateIndexOp(p.name, p.table, [sqlalchemy.text(e) if " " in e else e for e in p.expressions()])
+            for p in proposals
+        ]
+        script.downgrade_ops.ops[:] = [
+            ops.DropIndexOp(p.name, table_name=p.table) for p in reversed(proposals)
+        ]
+
+    return command.revision(config, message=message, process_revision_directives=directives)
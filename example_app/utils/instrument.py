@@ -0,0 +1,180 @@
+"""per request instrumentation: resolver timings, sql statements and N+1 detection
+
+    instrumentation = Instrumentation()
+    instrumentation.init_app(app)
+    GraphQLView.as_view(..., middleware=[instrumentation.middleware])
+
+statements are attributed to the field path being resolved, statements of batched
+DataLoaders run between resolvers and are attributed to "(batched)".
+
+the trace and the field path are context variables, they follow the work of an async
+request (aio.py) into the threads it runs in.
+"""
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from promise import is_thenable
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("example_app.graphql")
+
+BATCHED = "(batched)"
+
+# 正在解析的字段路径
+current_path = ContextVar("graphql_trace_path", default=None)
+
+
+def field_path(path):
+    """userList.edges.0.node.roles -> userList.edges.node.roles"""
+    return ".".join(str(p) for p in path if not isinstance(p, int))
+
+
+def statement_shape(statement):
+    """same statement with different IN (...) length is the same shape"""
+    return re.sub(r"\((?:\?, )*\?\)", "(?)", " ".join(statement.split()))
+
+
+class RequestTrace(object):
+    def __init__(self):
+        self.start = time.time()
+        self.duration = None
+        self.operation = None
+        self.resolvers = OrderedDict()  # path -> [count, seconds]
+        self.statements = []  # (path, statement, seconds)
+
+    def add_resolver(self, path, seconds):
+        entry = self.resolvers.setdefault(path, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add_statement(self, statement, seconds):
+        self.statements.append((current_path.get() or BATCHED, statement, seconds))
+
+    def n_plus_one(self, threshold):
+        shapes = OrderedDict()
+        for path, statement, _ in self.statements:
+            entry = shapes.setdefault(statement_shape(statement), [0, set()])
+            entry[0] += 1
+            entry[1].add(path)
+        return [
+            {"statement": shape, "count": count, "paths": sorted(paths)}
+            for shape, (count, paths) in shapes.items()
+            if count > threshold
+        ]
+
+    def summary(self, slowest=5, n_plus_one_threshold=5):
+        sql_seconds = sum(seconds for _, _, seconds in self.statements)
+        slow = sorted(self.statements, key=lambda s: s[2], reverse=True)[:slowest]
+        duration = self.duration if self.duration is not None else time.time() - self.start
+        return {
+            "duration_ms": round(duration * 1000, 3),
+            "sql_count": len(self.statements),
+            "sql_ms": round(sql_seconds * 1000, 3),
+            "slowest": [
+                {"path": path, "statement": statement, "ms": round(seconds * 1000, 3)}
+                for path, statement, seconds in slow
+            ],
+            "resolvers": [
+                {"path": path, "count": count, "ms": round(seconds * 1000, 3)}
+                for path, (count, seconds) in self.resolvers.items()
+            ],
+            "n_plus_one": self.n_plus_one(n_plus_one_threshold),
+        }
+
+
+class TraceMiddleware(object):
+    """graphene middleware, time every resolver by field path"""
+
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+
+    def resolve(self, next, root, info, **args):
+        trace = self.instrumentation.current()
+        if trace is None:
+            return next(root, info, **args)
+        path = field_path(info.path)
+        token = current_path.set(path)
+        start = time.time()
+        try:
+            result = next(root, info, **args)
+        finally:
+            current_path.reset(token)
+        if is_thenable(result):
+
+            def done(value):
+                trace.add_resolver(path, time.time() - start)
+                return value
+
+            def failed(error):
+                trace.add_resolver(path, time.time() - start)
+                raise error
+
+            return result.then(done, failed)
+        trace.add_resolver(path, time.time() - start)
+        return result
+
+
+class Instrumentation(object):
+    def __init__(self, app=None):
+        self._trace = ContextVar("graphql_trace", default=None)
+        self.middleware = TraceMiddleware(self)
+        self.n_plus_one_threshold = 5
+        self.slowest = 5
+        self.debug_header = "X-GraphQL-Debug"
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.n_plus_one_threshold = app.config.setdefault("GRAPHQL_TRACE_N_PLUS_ONE", 5)
+        self.slowest = app.config.setdefault("GRAPHQL_TRACE_SLOWEST", 5)
+        self.debug_header = app.config.setdefault("GRAPHQL_TRACE_HEADER", "X-GraphQL-Debug")
+        if not event.contains(Engine, "before_cursor_execute", self._before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def current(self):
+        return self._trace.get()
+
+    def start(self):
+        trace = RequestTrace()
+        self._trace.set(trace)
+        return trace
+
+    def finish(self):
+        trace = self.current()
+        self._trace.set(None)
+        if trace is not None:
+            trace.duration = time.time() - trace.start
+        return trace
+
+    def summary(self, trace):
+        return trace.summary(self.slowest, self.n_plus_one_threshold)
+
+    def log(self, trace, **fields):
+        summary = self.summary(trace)
+        line = OrderedDict(fields)
+        line["operation"] = trace.operation
+        for key in ("duration_ms", "sql_count", "sql_ms"):
+            line[key] = summary[key]
+        line["n_plus_one"] = [
+            {"statement": n["statement"][:200], "count": n["count"], "paths": n["paths"]}
+            for n in summary["n_plus_one"]
+        ]
+        if line["n_plus_one"]:
+            logger.warning(json.dumps(line, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(line, ensure_ascii=False))
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current() is not None:
+            conn.info.setdefault("query_start", []).append(time.time())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        trace = self.current()
+        if trace is not None and conn.info.get("query_start"):
+            trace.add_statement(statement, time.time() - conn.info["query_start"].pop())
@@ -0,0 +1,211 @@
+from collections import defaultdict
+
+from graphene.relay import Node
+from graphql_relay import from_global_id
+from promise import Promise
+from promise.dataloader import DataLoader
+from sqlalchemy.inspection import inspect as sqlalchemyinspect
+from sqlalchemy.orm.attributes import set_committed_value
+from example_app.extensions import db
+from .aio import in_thread
+
+
+def get_request_state(context):
+    """per request state, stored on graphql context
+
+    Arguments:
+        context {object} -- info.context, flask request or dict
+
+    Returns:
+        dict -- state shared by every resolver of one execution
+    """
+    if context is None:
+        # 没有 context 时无法在一次请求内共享，每次返回新的
+        return {}
+    if isinstance(context, dict):
+        return context.setdefault("graphql_state", {})
+    state = getattr(context, "graphql_state", None)
+    if state is None:
+        state = {}
+        setattr(context, "graphql_state", state)
+    return state
+
+
+def get_loader(context, loader_class, *args):
+    """get or create a loader for this request"""
+    loaders = get_request_state(context).setdefault("loaders", {})
+    key = (loader_class,) + args
+    if key not in loaders:
+        loaders[key] = loader_class(*args)
+    return loaders[key]
+
+
+def model_for_table(table):
+    """find the mapped model of a table"""
+    for model in db.Model._decl_class_registry.values():
+        if getattr(model, "__table__", None) is table:
+            return model
+    return None
+
+
+class RelationshipLoader(DataLoader):
+    """load one relationship for many parents with one `IN (...)` query
+
+    keys are the parent instances, relationship is loaded like
+        SELECT parent.id, target.* FROM parent JOIN ... WHERE parent.id IN (...)
+    """
+
+    def __init__(self, model, key):
+        super(RelationshipLoader, self).__init__()
+        self.model = model
+        self.key = key
+        self.uselist = sqlalchemyinspect(model).relationships[key].uselist
+
+    def batch_load_fn(self, parents):
+        return in_thread(self.load_parents, parents)
+
+    def load_parents(self, parents):
+        pk = sqlalchemyinspect(self.model).primary_key[0]
+        ids = [sqlalchemyinspect(parent).identity[0] for parent in parents]
+        target = sqlalchemyinspect(self.model).relationships[self.key].mapper.entity
+        query = (
+            db.session.query(pk, target)
+            .join(getattr(self.model, self.key))
+            .filter(pk.in_(set(ids)))
+            .order_by(*sqlalchemyinspect(target).primary_key)
+        )
+        grouped = defaultdict(list)
+        for parent_id, obj in query:
+            grouped[parent_id].append(obj)
+        results = []
+        for parent, parent_id in zip(parents, ids):
+            value = grouped.get(parent_id, [])
+            if not self.uselist:
+                value = value[0] if value else None
+            # 写回实例，后面再访问这个属性不会再查询
+            set_committed_value(parent, self.key, value)
+            results.append(value)
+        return results
+
+
+class ModelLoader(DataLoader):
+    """load model rows by primary key with one `IN (...)` query
+
+    one loader per model and request (get_loader) is the identity map of the request:
+    a primary key is loaded once, by node fields, `nodes`, foreign keys or mutations.
+    ids are coerced to the primary key type, "3" from a global id and 3 from a
+    foreign key are the same row.
+    """
+
+    def __init__(self, model):
+        super(ModelLoader, self).__init__()
+        self.model = model
+        self.pk = sqlalchemyinspect(model).primary_key[0]
+        try:
+            self.python_type = self.pk.type.python_type
+        except NotImplementedError:
+            self.python_type = None
+        self.identities = {}
+
+    def coerce(self, _id):
+        """id as primary key type, None when it can not be"""
+        if _id is None or self.python_type is None or isinstance(_id, self.python_type):
+            return _id
+        try:
+            return self.python_type(_id)
+        except (TypeError, ValueError):
+            return None
+
+    def load(self, key=None):
+        key = self.coerce(key)
+        if key is None:
+            return Promise.resolve(None)
+        return super(ModelLoader, self).load(key)
+
+    def get(self, _id):
+        """load now without batching, for code that can not wait for a promise"""
+        key = self.coerce(_id)
+        if key is None:
+            return None
+        if key not in self.identities:
+            self.identities[key] = db.session.query(self.model).filter(self.pk == key).first()
+            self.prime(key, self.identities[key])
+        return self.identities[key]
+
+    def forget(self, _id, deleted=True):
+        """row is deleted, later lookups return None
+
+        Arguments:
+            deleted {bool} -- False when the row is updated without the session (bulk update),
+                later lookups read it again
+        """
+        key = self.coerce(_id)
+        self.clear(key)
+        if deleted:
+            self.identities[key] = None
+            self.prime(key, None)
+            return
+        self.identities.pop(key, None)
+        mapper = sqlalchemyinspect(self.model)
+        obj = db.session.identity_map.get(mapper.identity_key_from_primary_key([key]))
+        if obj is not None:
+            # bulk_update_mappings 不更新 session 里已经加载的对象
+            db.session.expire(obj)
+
+    def batch_load_fn(self, ids):
+        return in_thread(self.load_ids, ids)
+
+    def load_ids(self, ids):
+        missing = set(_id for _id in ids if _id not in self.identities)
+        if missing:
+            for obj in db.session.query(self.model).filter(self.pk.in_(missing)).all():
+                self.identities[sqlalchemyinspect(obj).identity[0]] = obj
+        return [self.identities.get(_id) for _id in ids]
+
+
+def relationship_resolver(model, key):
+    """resolver for relationship `key`, batched per request"""
+
+    def resolver(root, info, **args):
+        state = sqlalchemyinspect(root)
+        if key in state.dict or state.identity is None or len(state.identity) != 1:
+            # 已加载或者未入库/复合主键，直接读属性
+            return getattr(root, key)
+        return get_loader(info.context, RelationshipLoader, model, key).load(root)
+
+    return resolver
+
+
+def get_instance(context, model, _id):
+    """row by primary key from the identity map of the request, queried once"""
+    return get_loader(context, ModelLoader, model).get(_id)
+
+
+def resolve_nodes(root, info, ids):
+    """`nodes(ids: [...])`, one IN query per type, in the order of ids, None for missing ids"""
+    nodes = []
+    for global_id in ids:
+        try:
+            type_name, _id = from_global_id(global_id)
+            graphene_type = info.schema.get_type(type_name).graphene_type
+        except Exception:
+            nodes.append(None)
+            continue
+        model = getattr(getattr(graphene_type, "_meta", None), "model", None)
+        if model is None or Node not in graphene_type._meta.interfaces:
+            nodes.append(None)
+            continue
+        nodes.append(get_loader(info.context, ModelLoader, model).load(_id))
+    return Promise.all(nodes)
+
+
+def foreign_key_resolver(model, column_key):
+    """resolver for a foreign key column, returns the referenced row, batched per request"""
+
+    def resolver(root, info, **args):
+        value = getattr(root, column_key)
+        if value is None:
+            return None
+        return get_loader(info.context, ModelLoader, model).load(value)
+
+    return resolver
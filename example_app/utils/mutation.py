@@ -2,10 +2,10 @@
 from __future__ import absolute_import, unicode_literals, annotations
 
 from collections import OrderedDict
+from functools import partial
 
 import graphene
 import sqlalchemy
-from flask_sqlalchemy.model import DefaultMeta
 from graphene import relay
 from graphene.types.generic import GenericScalar
 from graphene.types.objecttype import ObjectTypeOptions
@@ -30,13 +30,16 @@ from graphene_sqlalchemy.types import (
 )
 from graphql_relay.node.node import from_global_id
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
-from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.sql import or_, not_
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.inspection import inspect as sqlalchemyinspect
 from example_app.extensions import db
 from sqlalchemy.orm.attributes import InstrumentedAttribute
-from .types import SQLAlchemyObjectTypes, SQLAlchemyInputObjectType
+from .types import SQLAlchemyObjectTypes, SQLAlchemyInputObjectType, module_models
+from .changes import record_deletes
+from .loader import ModelLoader, get_loader
+from .planner import field_selection
+from .transaction import commit_mutation, rollback_mutation
 
 __author__ = "golden"
 __date__ = "2019/8/2"
@@ -55,6 +58,77 @@ def input_to_dictionary(input):
     return dictionary
 
 
+def decode_ids(global_ids):
+    """decode global ids in one pass, invalid id is None"""
+    ids = []
+    for global_id in global_ids:
+        try:
+            ids.append(from_global_id(global_id)[1] or None)
+        except (TypeError, ValueError):
+            ids.append(None)
+    return ids
+
+
+def assign_many_to_many(session, obj, key, global_ids):
+    """set many to many relationship `key` of obj to global_ids, set based
+
+    one query for target ids, one for current rows of the secondary table,
+    then only insert the added rows and delete the removed rows
+
+    Returns:
+        list -- global ids not found, nothing changed when not empty
+    """
+    relationship = sqlalchemyinspect(type(obj)).relationships[key]
+    target_pk = relationship.mapper.primary_key[0]
+    ids = decode_ids(global_ids)
+    query_ids = [_id for _id in ids if _id]
+    with session.no_autoflush:
+        found = dict(
+            (str(row[0]), row[0])
+            for row in (session.query(target_pk).filter(target_pk.in_(query_ids)) if query_ids else [])
+        )
+    missing = [gid for gid, _id in zip(global_ids, ids) if str(_id) not in found]
+    if missing:
+        return missing
+    wanted = set(found[str(_id)] for _id in ids)
+    if sqlalchemyinspect(obj).identity is None:
+        session.flush()
+    (parent_col, parent_fk), = relationship.synchronize_pairs
+    (_, target_fk), = relationship.secondary_synchronize_pairs
+    parent_id = getattr(obj, relationship.parent.get_property_by_column(parent_col).key)
+    secondary = relationship.secondary
+    current = set(
+        row[0]
+        for row in session.execute(
+            sqlalchemy.select([target_fk]).where(parent_fk == parent_id)
+        )
+    )
+    added = wanted - current
+    removed = current - wanted
+    if added:
+        session.execute(
+            secondary.insert(),
+            [{parent_fk.name: parent_id, target_fk.name: _id} for _id in added],
+        )
+    if removed:
+        session.execute(
+            secondary.delete().where(parent_fk == parent_id).where(target_fk.in_(removed))
+        )
+    if added or removed:
+        # 集合在 session 里已过期，下次访问重新加载
+        session.expire(obj, [key])
+    return []
+
+
+def commit_hooks(cls, root, models, kwargs):
+    """on_before_commit and on_after_commit of a mutation class bound to its arguments"""
+    hooks = []
+    for name in ("on_before_commit", "on_after_commit"):
+        hook = getattr(cls, name, None)
+        hooks.append(partial(hook, root, models, **kwargs) if hook is not None else None)
+    return hooks
+
+
 class SQLAlchemyMutationOptions(ObjectTypeOptions):
     model = None  # type: Model
     create = False  # type: Boolean
@@ -123,17 +197,26 @@ class SQLAlchemyMutation(graphene.Mutation):
             model = meta.model()
             session.add(model)
         else:
-            model = session.query(meta.model).filter(meta.model.id == kwargs["id"]).first()
+            loader = get_loader(info.context, ModelLoader, meta.model)
+            model = loader.get(kwargs["id"])
             if not model:
                 return cls(output=None, ok=False, message="要操作的数据不存在")
         if meta.delete == True:
             session.delete(model)
+            loader.forget(kwargs["id"])
+            record_deletes(session, meta.model, [sqlalchemyinspect(model).identity[0]])
         else:
 
+            many_to_many = []
+
             def setModelAttributes(model, attrs):
                 relationships = model.__mapper__.relationships
                 for key, value in attrs.items():
-                    if key in relationships:
+                    if key in relationships and relationships[key].secondary is not None:
+                        # 多对多，值是 global id 列表
+                        if value is not None:
+                            many_to_many.append((model, key, value))
+                    elif key in relationships:
                         if getattr(model, key) is None:
                             # instantiate class of the same type as the relationship target
                             setattr(model, key, relationships[key].mapper.entity())
@@ -142,15 +225,15 @@ class SQLAlchemyMutation(graphene.Mutation):
                         setattr(model, key, value)
 
             setModelAttributes(model, kwargs["input"])
+            for obj, key, value in many_to_many:
+                missing = assign_many_to_many(session, obj, key, value)
+                if missing:
+                    rollback_mutation(info)
+                    return cls(output=None, ok=False, message="关联数据不存在: %s" % ", ".join(missing))
 
-        if getattr(cls, "on_before_commit", None) is not None:
-            cls.on_before_commit(self, model, **kwargs)
-        try:
-            session.commit()
-        except SQLAlchemyError as e:
-            return cls(output=None, ok=False, message="操作报错：%s" % e)
-        if getattr(cls, "on_after_commit", None) is not None:
-            cls.on_after_commit(self, model, **kwargs)
+        error = commit_mutation(info, [meta.model], *commit_hooks(cls, self, model, kwargs))
+        if error is not None:
+            return cls(output=None, ok=False, message=error)
         return cls(output=model, ok=True, message="操作成功")
 
     @classmethod
@@ -160,6 +243,244 @@ class SQLAlchemyMutation(graphene.Mutation):
         )
 
 
+class SQLAlchemyMutationResult(graphene.ObjectType):
+    """one item of a bulk mutation, same as SQLAlchemyMutation"""
+
+    class Meta:
+        abstract = True
+
+    ok = graphene.Boolean(description="成功？")
+    message = graphene.String(description="更多信息")
+
+
+_result_types = {}
+
+
+def mutation_result_type(model):
+    name = "%sMutationResult" % model.__name__
+    if name not in _result_types:
+        output = graphene.Field(lambda: SQLAlchemyObjectTypes().get(model), description="输出")
+        _result_types[name] = type(name, (SQLAlchemyMutationResult,), {"output": output})
+    return _result_types[name]
+
+
+def required_columns(model):
+    """columns must be set on insert"""
+    columns = []
+    for key, prop in sqlalchemyinspect(model).column_attrs.items():
+        column = prop.columns[0]
+        if column.nullable or column.default is not None or column.server_default is not None:
+            continue
+        if column.primary_key and column.autoincrement:
+            continue
+        columns.append(key)
+    return columns
+
+
+class SQLAlchemyBulkMutation(graphene.Mutation):
+    """bulk create/update/delete, one IN query to load rows, bulk insert/update, one commit
+
+        createUsers(inputs: [UserInput!]!)
+        updateUsers(inputs: [{id: ID!, input: UserInput!}]!)
+        deleteUsers(ids: [ID!]!)
+    """
+
+    @classmethod
+    def __init_subclass_with_meta__(
+        cls,
+        model=None,
+        create=False,
+        delete=False,
+        arguments=None,
+        only_fields=[],
+        exclude_fields=[],
+        **options
+    ):
+        meta = SQLAlchemyMutationOptions(cls)
+        meta.create = create
+        meta.model = model
+        meta.delete = delete
+        if arguments is None and not hasattr(cls, "Arguments"):
+            arguments = {}
+            if meta.delete is True:
+                arguments["ids"] = graphene.Argument(
+                    graphene.List(graphene.NonNull(graphene.ID)), required=True
+                )
+            else:
+                input_meta = type(
+                    "Meta",
+                    (object,),
+                    {"model": model, "exclude_fields": exclude_fields, "only_fields": only_fields},
+                )
+                item_type = input_type = type(
+                    cls.__name__ + "Input", (SQLAlchemyInputObjectType,), {"Meta": input_meta}
+                )
+                if meta.create is False:
+                    item_type = type(
+                        cls.__name__ + "Item",
+                        (graphene.InputObjectType,),
+                        {
+                            "id": graphene.ID(required=True),
+                            "input": graphene.InputField(input_type, required=True),
+                        },
+                    )
+                arguments["inputs"] = graphene.Argument(
+                    graphene.List(graphene.NonNull(item_type)), required=True
+                )
+        cls.results = graphene.List(lambda: mutation_result_type(model), description="每一项的结果")
+        cls.ok = graphene.Boolean(description="全部成功？")
+        cls.message = graphene.String(description="更多信息")
+        super(SQLAlchemyBulkMutation, cls).__init_subclass_with_meta__(
+            _meta=meta, arguments=arguments, **options
+        )
+
+    @classmethod
+    def mutate(cls, self, info, **kwargs):
+        session = db.session
+        meta = cls._meta
+        if meta.create is True:
+            outputs = "output" in field_selection(info).get("results", {})
+            models, results = cls.bulk_create(session, kwargs["inputs"], outputs)
+        elif meta.delete is True:
+            models, results = cls.bulk_delete(session, kwargs["ids"])
+            cls.forget(info, [sqlalchemyinspect(row).identity[0] for row in models], deleted=True)
+        else:
+            models, results = cls.bulk_update(session, kwargs["inputs"])
+            cls.forget(info, [_id for _id, ok, _ in results if ok], deleted=False)
+
+        error = commit_mutation(info, [meta.model], *commit_hooks(cls, self, models, kwargs))
+        if error is not None:
+            results = [(None, False, error) for _ in results]
+            return cls.result(results, error)
+        if meta.delete is not True:
+            results = cls.reload(session, results)
+        return cls.result(results)
+
+    @classmethod
+    def forget(cls, info, ids, deleted):
+        """node lookups of the request read the rows changed by bulk statements again"""
+        loader = get_loader(info.context, ModelLoader, cls._meta.model)
+        for _id in ids:
+            loader.forget(_id, deleted)
+
+    @classmethod
+    def result(cls, results, message=None):
+        result_type = mutation_result_type(cls._meta.model)
+        items = [result_type(output=obj, ok=ok, message=msg) for obj, ok, msg in results]
+        ok = all(item.ok for item in items)
+        if message is None:
+            message = "操作成功" if ok else "部分操作失败"
+        return cls(results=items, ok=ok, message=message)
+
+    @classmethod
+    def reload(cls, session, results):
+        """outputs after commit, one IN query"""
+        model = cls._meta.model
+        pk = sqlalchemyinspect(model).primary_key[0]
+        ids = [_id for _id, ok, _ in results if ok and _id is not None]
+        rows = session.query(model).filter(pk.in_(ids)).all() if ids else []
+        by_id = {str(sqlalchemyinspect(row).identity[0]): row for row in rows}
+        return [(by_id.get(str(_id)) if ok else None, ok, msg) for _id, ok, msg in results]
+
+    @classmethod
+    def check_input(cls, data):
+        relationships = sqlalchemyinspect(cls._meta.model).relationships
+        nested = [key for key in data if key in relationships]
+        if nested:
+            return "批量操作不支持关联字段: %s" % ", ".join(nested)
+        return None
+
+    @classmethod
+    def bulk_create(cls, session, inputs, outputs=True):
+        """
+        Arguments:
+            outputs {bool} -- `output` of results is selected, primary keys are read back
+        """
+        model = cls._meta.model
+        mapper = sqlalchemyinspect(model)
+        pk_key = mapper.get_property_by_column(mapper.primary_key[0]).key
+        required = required_columns(model)
+        mappings, results = [], []
+        for data in inputs:
+            data = input_to_dictionary(dict(data))
+            error = cls.check_input(data)
+            missing = [key for key in required if data.get(key) is None]
+            if error is None and missing:
+                error = "缺少字段: %s" % ", ".join(missing)
+            if error is not None:
+                results.append([None, False, error])
+                continue
+            mappings.append(data)
+            results.append([data, True, "操作成功"])
+        # return_defaults 时 sqlalchemy 1.3 一行一条 INSERT 才拿得到自增主键 (sqlite 没有 RETURNING)，
+        # 只在要输出时这样做，否则一条 executemany
+        session.bulk_insert_mappings(model, mappings, return_defaults=outputs)
+        # 用主键在提交后重新读取
+        for result in results:
+            if result[1]:
+                result[0] = result[0].get(pk_key) if outputs else None
+        return mappings, [tuple(result) for result in results]
+
+    @classmethod
+    def bulk_update(cls, session, items):
+        model = cls._meta.model
+        pk = sqlalchemyinspect(model).primary_key[0]
+        pk_key = sqlalchemyinspect(model).get_property_by_column(pk).key
+        ids = decode_ids([item["id"] for item in items])
+        found = set(
+            str(row[0]) for row in session.query(pk).filter(pk.in_([i for i in ids if i])).all()
+        )
+        mappings, results = [], []
+        for _id, item in zip(ids, items):
+            data = input_to_dictionary(dict(item["input"]))
+            error = cls.check_input(data)
+            if _id is None or str(_id) not in found:
+                error = "要操作的数据不存在"
+            if error is not None:
+                results.append((None, False, error))
+                continue
+            data[pk_key] = _id
+            mappings.append(data)
+            results.append((_id, True, "操作成功"))
+        session.bulk_update_mappings(model, mappings)
+        return mappings, results
+
+    @classmethod
+    def bulk_delete(cls, session, global_ids):
+        model = cls._meta.model
+        mapper = sqlalchemyinspect(model)
+        pk = mapper.primary_key[0]
+        ids = decode_ids(global_ids)
+        rows = session.query(model).filter(pk.in_([i for i in ids if i])).all()
+        by_id = {str(sqlalchemyinspect(row).identity[0]): row for row in rows}
+        for row in rows:
+            # 提交后还要输出被删除的数据
+            session.expunge(row)
+        found = list(by_id)
+        if found:
+            # 多对多的中间表
+            for relationship in mapper.relationships:
+                if relationship.secondary is None:
+                    continue
+                for _, column in relationship.synchronize_pairs:
+                    session.execute(relationship.secondary.delete().where(column.in_(found)))
+            session.query(model).filter(pk.in_(found)).delete(synchronize_session=False)
+            record_deletes(session, model, [sqlalchemyinspect(row).identity[0] for row in rows])
+        results = [
+            (by_id[str(_id)], True, "操作成功")
+            if _id is not None and str(_id) in by_id
+            else (None, False, "要操作的数据不存在")
+            for _id in ids
+        ]
+        return rows, results
+
+    @classmethod
+    def Field(cls, *args, **kwargs):
+        return graphene.Field(
+            cls._meta.output, args=cls._meta.arguments, resolver=cls._meta.resolver
+        )
+
+
 def model_create(model):
     name = "%sCreateMutation" % model.__name__.capitalize()
     if globals().get(name):
@@ -183,6 +504,24 @@ def model_delete(model):
     return mutation
 
 
+def model_bulk_create(model):
+    name = "%sBulkCreateMutation" % model.__name__.capitalize()
+    meta = type("Meta", (object,), {"model": model, "create": True, "delete": False})
+    return type(name, (SQLAlchemyBulkMutation,), {"Meta": meta})
+
+
+def model_bulk_update(model):
+    name = "%sBulkUpdateMutation" % model.__name__.capitalize()
+    meta = type("Meta", (object,), {"model": model, "create": False, "delete": False})
+    return type(name, (SQLAlchemyBulkMutation,), {"Meta": meta})
+
+
+def model_bulk_delete(model):
+    name = "%sBulkDeleteMutation" % model.__name__.capitalize()
+    meta = type("Meta", (object,), {"model": model, "create": False, "delete": True})
+    return type(name, (SQLAlchemyBulkMutation,), {"Meta": meta})
+
+
 class MutationObjectType(graphene.ObjectType):
     @classmethod
     def __init_subclass_with_meta__(cls, model_mudule, include_object=[], _meta=None, **options):
@@ -199,15 +538,20 @@ class MutationObjectType(graphene.ObjectType):
             name = "%s%s" % (action, obj._meta.model.__name__)
             include_object_names.append(name)
             fields[name] = obj.Field()
-        for model_name in dir(model_mudule):
-            model_obj = getattr(model_mudule, model_name)
-            if isinstance(model_obj, DefaultMeta):
-                if "create%s" % model_name not in include_object_names:
-                    fields.update({"create%s" % model_name: model_create(model_obj).Field()})
-                if "update%s" % model_name not in include_object_names:
-                    fields.update({"update%s" % model_name: model_update(model_obj).Field()})
-                if "delete%s" % model_name not in include_object_names:
-                    fields.update({"delete%s" % model_name: model_delete(model_obj).Field()})
+        for model_name, model_obj in module_models(model_mudule):
+            if "create%s" % model_name not in include_object_names:
+                fields.update({"create%s" % model_name: model_create(model_obj).Field()})
+            if "update%s" % model_name not in include_object_names:
+                fields.update({"update%s" % model_name: model_update(model_obj).Field()})
+            if "delete%s" % model_name not in include_object_names:
+                fields.update({"delete%s" % model_name: model_delete(model_obj).Field()})
+            # 批量
+            if "create%ss" % model_name not in include_object_names:
+                fields.update({"create%ss" % model_name: model_bulk_create(model_obj).Field()})
+            if "update%ss" % model_name not in include_object_names:
+                fields.update({"update%ss" % model_name: model_bulk_update(model_obj).Field()})
+            if "delete%ss" % model_name not in include_object_names:
+                fields.update({"delete%ss" % model_name: model_bulk_delete(model_obj).Field()})
         if _meta.fields:
             _meta.fields.update(fields)
         else:
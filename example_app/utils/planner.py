@@ -0,0 +1,106 @@
+"""query planner, read graphql selection set and load only what is asked
+
+    userList { edges { node { name roles { edges { node { name } } } } } }
+
+    -> query.options(load_only("id", "name"), selectinload(User.roles).load_only("id", "name"))
+"""
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import ast
+from sqlalchemy.inspection import inspect as sqlalchemyinspect
+from sqlalchemy.orm import load_only, selectinload, joinedload
+
+
+def selection_tree(info, selection_set, type_names=None, tree=None):
+    """graphql selection set to {field name: sub tree}, fragments are merged
+
+    Arguments:
+        info {ResolveInfo} -- for fragments
+        selection_set {SelectionSet} -- ast selection set
+        type_names {set} -- skip fragments on other types, None keeps all
+    """
+    if tree is None:
+        tree = {}
+    if selection_set is None:
+        return tree
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            name = selection.name.value
+            if name.startswith("__"):
+                continue
+            sub = tree.setdefault(name, {})
+            selection_tree(info, selection.selection_set, None, sub)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = info.fragments[selection.name.value]
+            if _fragment_matches(fragment.type_condition, type_names):
+                selection_tree(info, fragment.selection_set, type_names, tree)
+        elif isinstance(selection, ast.InlineFragment):
+            if _fragment_matches(selection.type_condition, type_names):
+                selection_tree(info, selection.selection_set, type_names, tree)
+    return tree
+
+
+def _fragment_matches(type_condition, type_names):
+    return type_condition is None or type_names is None or type_condition.name.value in type_names
+
+
+def field_selection(info, type_names=None):
+    """selection tree of the field being resolved"""
+    tree = {}
+    for field in info.field_asts:
+        selection_tree(info, field.selection_set, type_names, tree)
+    return tree
+
+
+def node_selection(tree):
+    """selection of connection `edges { node { ... } }`"""
+    return tree.get("edges", {}).get("node", {})
+
+
+def plan_options(model, tree, base=None, required=()):
+    """loader options for model from selection tree
+
+    columns: load_only(selected columns + primary keys + foreign keys + required)
+    relationships: selectinload for list, joinedload for one
+    when a selected field is not a column or relationship (hybrid property), all columns are loaded
+    """
+    mapper = sqlalchemyinspect(model)
+    columns = set(required)
+    columns.update(mapper.get_property_by_column(c).key for c in mapper.primary_key)
+    columns.update(
+        key for key, prop in mapper.column_attrs.items() if any(c.foreign_keys for c in prop.columns)
+    )
+    options = []
+    projectable = True
+    for name, sub in tree.items():
+        key = to_snake_case(name)
+        if key in ("id", "db_id"):
+            continue
+        if key in mapper.column_attrs:
+            columns.add(key)
+        elif key in mapper.relationships:
+            relationship = mapper.relationships[key]
+            loader = "selectinload" if relationship.uselist else "joinedload"
+            attr = getattr(model, key)
+            child = getattr(base, loader)(attr) if base is not None else (
+                selectinload(attr) if relationship.uselist else joinedload(attr)
+            )
+            sub = node_selection(sub) if "edges" in sub else sub
+            options.extend(plan_options(relationship.mapper.entity, sub, child))
+        elif key + "_id" in mapper.column_attrs:
+            # 外键字段，例如 author -> author_id，已经在 columns 里
+            continue
+        else:
+            projectable = False
+    if projectable:
+        options.append(base.load_only(*columns) if base is not None else load_only(*columns))
+    elif base is not None:
+        options.append(base)
+    return options
+
+
+def plan_query(query, model, tree, required=()):
+    """apply load_only / eager loading of selection tree to query"""
+    options = plan_options(model, tree, required=required)
+    if options:
+        query = query.options(*options)
+    return query
@@ -1,12 +1,29 @@
-from sqlalchemy import or_, not_
+import json
+import datetime
+from base64 import b64encode, b64decode
+from flask import current_app
+from sqlalchemy import or_, and_, tuple_, func, false
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql import operators
+from sqlalchemy.inspection import inspect as sqlalchemyinspect
 import graphene
+from graphene.relay.connection import PageInfo
+from graphql_relay.connection.arrayconnection import connection_from_list_slice, get_offset_with_default
 from graphene_sqlalchemy.types import sort_argument_for_object_type
 from graphene_sqlalchemy import SQLAlchemyConnectionField
 from graphene.types.generic import GenericScalar
-from .types import SQLAlchemyObjectTypes
+from .types import SQLAlchemyObjectTypes, module_models
+from .cache import count_cache, normalize_key
+from .aggregate import model_aggregate
+from .changes import model_changes
+from .filters import compile_filters
+from .indexes import index_usage
+from .loader import resolve_nodes
+from .search import search_indexes, search_terms
+from .planner import plan_query, field_selection, node_selection
+from .rows import row_columns, select_rows
 from graphene.types.objecttype import ObjectTypeOptions
 from collections import OrderedDict
-from flask_sqlalchemy.model import DefaultMeta
 
 
 def filter_query(query, model, filters):
@@ -15,55 +32,123 @@ def filter_query(query, model, filters):
     Arguments:
         query {query} -- sqlalchemyquery
         model {model} -- model
-        filters {list} -- filter list,like [{key: a,val:a,op:aa}]
+        filters {list} -- filter list,like [{key: a,val:a,op:aa}], key can be relationship path like roles.name
     
     Returns:
         query -- sqlalchemy query
     """
-    for _filter in filters:
-        conditions = []
-        if isinstance(_filter, (list,)):
-            for __filter in _filter:
-                conditions = construct_conditions(conditions, __filter, model)
-            condition = or_(*conditions)
-            query = query.filter(condition)
-        if isinstance(_filter, (dict,)):
-            conditions = construct_conditions(conditions, _filter, model)
-            query = query.filter(*conditions)
-    return query
-
-
-def construct_conditions(conditions, _filter, model):
+    if isinstance(filters, dict):
+        filters = [filters]
+    return compile_filters(model, filters).apply(query, filters)
+
+
+KEYSET_CURSOR_PREFIX = "keyset:"
+
+
+def _cursor_default(value):
+    if isinstance(value, datetime.datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$d": value.isoformat()}
+    raise TypeError("can not encode %r in cursor" % value)
+
+
+def _cursor_object_hook(obj):
+    if "$dt" in obj:
+        return datetime.datetime.fromisoformat(obj["$dt"])
+    if "$d" in obj:
+        return datetime.date.fromisoformat(obj["$d"])
+    return obj
+
+
+def encode_keyset_cursor(values):
+    """encode sort key values to relay cursor"""
+    data = json.dumps(values, default=_cursor_default, separators=(",", ":"))
+    return b64encode((KEYSET_CURSOR_PREFIX + data).encode("utf8")).decode("ascii")
+
+
+def decode_keyset_cursor(cursor):
+    """decode relay cursor to sort key values"""
+    try:
+        data = b64decode(cursor).decode("utf8")
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("无效的游标: %s" % cursor)
+    if not data.startswith(KEYSET_CURSOR_PREFIX):
+        raise ValueError("无效的游标: %s" % cursor)
+    return json.loads(data[len(KEYSET_CURSOR_PREFIX):], object_hook=_cursor_object_hook)
+
+
+def keyset_columns(model, sort):
+    """sort argument to [(column, attribute name, descending)], primary key as tiebreaker"""
+    if sort is None:
+        sort = []
+    elif not isinstance(sort, (list, tuple)):
+        sort = [sort]
+    mapper = sqlalchemyinspect(model)
+    columns = []
+    for item in sort:
+        expression = getattr(item, "value", item)
+        column = getattr(expression, "element", expression)
+        desc = getattr(expression, "modifier", None) is operators.desc_op
+        columns.append((column, mapper.get_property_by_column(column).key, desc))
+    for column in mapper.primary_key:
+        if not any(c is column for c, _, _ in columns):
+            columns.append((column, mapper.get_property_by_column(column).key, False))
+    return columns
+
+
+def _nullable(column):
+    return getattr(column, "nullable", False)
+
+
+def keyset_order(columns, backward=False, nulls=True):
+    """order by of the sort key, NULL is the smallest value
+
+    Arguments:
+        nulls {bool} -- add NULLS FIRST/LAST, sqlite and mysql already sort NULL first
     """
+    order = []
+    for column, _, desc in columns:
+        descending = desc != backward
+        clause = column.desc() if descending else column.asc()
+        if nulls and _nullable(column):
+            clause = clause.nullslast() if descending else clause.nullsfirst()
+        order.append(clause)
+    return order
+
+
+def _after(column, value, smaller):
+    """column after value in the order, NULL is the smallest value"""
+    if smaller:
+        if value is None:
+            return false()
+        return or_(column < value, column.is_(None)) if _nullable(column) else column < value
+    return column.isnot(None) if value is None else column > value
+
+
+def keyset_condition(columns, values, backward=False):
+    """rows after (or before when backward) the sort key values
+
+    same direction without nullable columns: (a, b) > (x, y)
+    otherwise: a > x OR (a = x AND b < y), NULL is the smallest value (keyset_order)
     """
-    c = getattr(model, _filter.get("key"))
-    v = _filter.get("val")
-    op = _filter.get("op")
-    if not c or not op or not v:
-        pass
-    if op == "==":
-        conditions.append(c == v)
-    if op == "!=":
-        conditions.append(c != v)
-    if op == "<=":
-        conditions.append(c <= v)
-    if op == ">=":
-        conditions.append(c >= v)
-    if op == ">":
-        conditions.append(c > v)
-    if op == "<":
-        conditions.append(c < v)
-    if op == "starts":
-        conditions.append(c.ilike(v + "%"))
-    if op == "ends":
-        conditions.append(c.ilike("%" + v))
-    if op == "contains":
-        conditions.append(c.contains(v))
-    if op == "in":
-        conditions.append(c.in_(v))
-    if op == "notin":
-        conditions.append(not_(c.in_(v)))
-    return conditions
+    directions = set(desc != backward for _, _, desc in columns)
+    if len(directions) == 1 and not any(_nullable(c) for c, _, _ in columns):
+        left = tuple_(*[c for c, _, _ in columns])
+        right = tuple_(*values)
+        return left < right if directions.pop() else left > right
+    conditions = []
+    for i, (column, _, desc) in enumerate(columns):
+        equal = [c.is_(None) if v is None else c == v for (c, _, _), v in zip(columns[:i], values[:i])]
+        conditions.append(and_(*(equal + [_after(column, values[i], desc != backward)])))
+    return or_(*conditions)
+
+
+def check_page_args(args):
+    """negative page arguments are rejected, sqlite reads LIMIT -1 as no limit"""
+    for name in ("first", "last", "limit", "offset"):
+        if args.get(name) is not None and args[name] < 0:
+            raise ValueError("分页参数 %s 不能为负数: %d" % (name, args[name]))
 
 
 class CustomConnectionField(SQLAlchemyConnectionField):
@@ -88,17 +173,199 @@ class CustomConnectionField(SQLAlchemyConnectionField):
             del kwargs["offset"]
         super(CustomConnectionField, self).__init__(connection, *args, **kwargs)
 
+    @staticmethod
+    def is_keyset(args):
+        """keyset paging by default, `offset` asks for offset paging"""
+        return "offset" not in args
+
     @classmethod
     def get_query(cls, model, info, **args):
-        query = super(CustomConnectionField, cls).get_query(model, info, **args)
-        if args.get("filters"):
-            query = filter_query(query, model, args["filters"])
+        query = cls.filtered_query(model, info, **args)
+        if cls.is_keyset(args):
+            return query
         if "limit" in args:
             query = query.limit(args["limit"])
         if "offset" in args:
             query = query.offset(args["offset"])
         return query
 
+    @classmethod
+    def filtered_query(cls, model, info, **args):
+        """query with sort, filters and loader options, before paging"""
+        query = super(CustomConnectionField, cls).get_query(model, info, **args)
+        if args.get("filters"):
+            query = filter_query(query, model, args["filters"])
+        columns = keyset_columns(model, args.get("sort"))
+        index_usage.record(model, args.get("filters"), [(key, desc) for _, key, desc in columns])
+        # 只加载查询的字段，排序字段用于游标
+        required = [key for _, key, _ in columns]
+        return plan_query(query, model, node_selection(field_selection(info)), required)
+
+    @classmethod
+    def fetch(cls, query, model, info, args):
+        """rows of the page, read only records (rows.py) when the nodes select only columns"""
+        if info.operation.operation == "query" and current_app.config.get("GRAPHQL_ROW_PATH", True):
+            required = [key for _, key, _ in keyset_columns(model, args.get("sort"))]
+            keys = row_columns(model, node_selection(field_selection(info)), required)
+            if keys is not None:
+                return select_rows(query, model, keys)
+        return query.all()
+
+    @classmethod
+    def resolve_connection(cls, connection_type, model, info, args, resolved):
+        check_page_args(args)
+        if resolved is not None:
+            return super(CustomConnectionField, cls).resolve_connection(
+                connection_type, model, info, args, resolved
+            )
+        if not cls.is_keyset(args):
+            connection = cls.resolve_offset_connection(connection_type, model, info, args)
+        else:
+            connection = cls.resolve_keyset_connection(connection_type, model, info, args)
+        # totalCount 用
+        connection.model = model
+        connection.filters = args.get("filters")
+        return connection
+
+    @classmethod
+    def resolve_offset_connection(cls, connection_type, model, info, args):
+        query = cls.get_query(model, info, **args)
+        if "last" in args or "before" in args:
+            # 从末尾取需要总数
+            return super(CustomConnectionField, cls).resolve_connection(
+                connection_type, model, info, args, query
+            )
+        # 直接取这一页，不 count (totalCount 选择时才算)，多取一行判断 hasNextPage
+        # after 游标是偏移，接在 offset 之后
+        start = get_offset_with_default(args.get("after"), -1) + 1
+        page = query.offset(args.get("offset", 0) + start) if start else query
+        size = args.get("limit", args.get("first"))
+        rows = cls.fetch(page if size is None else page.limit(size + 1), model, info, args)
+        has_next = size is not None and len(rows) > size
+        if has_next:
+            rows = rows[:size]
+        connection = connection_from_list_slice(
+            rows,
+            args,
+            slice_start=start,
+            list_length=start + len(rows),
+            list_slice_length=len(rows),
+            connection_type=connection_type,
+            pageinfo_type=PageInfo,
+            edge_type=connection_type.Edge,
+        )
+        connection.page_info.has_next_page = has_next
+        connection.page_info.has_previous_page = args.get("offset", 0) + start > 0
+        connection.iterable = query
+        connection.length = len(rows)
+        return connection
+
+    @classmethod
+    def resolve_keyset_connection(cls, connection_type, model, info, args):
+        query = cls.get_query(model, info, **args)
+        columns = keyset_columns(model, args.get("sort"))
+        backward = "last" in args or "before" in args
+        cursor = args.get("before") if backward else args.get("after")
+        page = query
+        if cursor:
+            values = decode_keyset_cursor(cursor)
+            if len(values) != len(columns):
+                raise ValueError("游标与排序不匹配: %s" % cursor)
+            page = page.filter(keyset_condition(columns, values, backward))
+        dialect = query.session.get_bind(mapper=sqlalchemyinspect(model)).dialect.name
+        page = page.order_by(None).order_by(
+            *keyset_order(columns, backward, nulls=dialect not in ("sqlite", "mysql"))
+        )
+        size = args.get("last") if backward else args.get("first", args.get("limit"))
+        if size is not None:
+            page = page.limit(size + 1)
+        rows = cls.fetch(page, model, info, args)
+        has_more = size is not None and len(rows) > size
+        if has_more:
+            rows = rows[:size]
+        if backward:
+            rows.reverse()
+        edges = [
+            connection_type.Edge(
+                node=row,
+                cursor=encode_keyset_cursor([getattr(row, key) for _, key, _ in columns]),
+            )
+            for row in rows
+        ]
+        connection = connection_type(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_more if backward else bool(cursor),
+                has_next_page=bool(cursor) if backward else has_more,
+            ),
+        )
+        connection.iterable = query
+        connection.length = len(rows)
+        return connection
+
+
+class SearchConnectionField(CustomConnectionField):
+    """rows matching `query` in the full text index of the model, best first
+
+    paged by `limit`/`offset` (or `first`/`after`), keyset cursors can not follow the rank
+    """
+
+    @staticmethod
+    def is_keyset(args):
+        return False
+
+    @classmethod
+    def filtered_query(cls, model, info, query=None, match=False, **args):
+        rows = super(SearchConnectionField, cls).filtered_query(model, info, **args)
+        expression = query if match else search_terms(query or "")
+        if not expression:
+            raise ValueError("搜索内容不能为空")
+        return search_indexes[model].ranked(rows, expression)
+
+    @classmethod
+    def resolve_connection(cls, connection_type, model, info, args, resolved):
+        connection = super(SearchConnectionField, cls).resolve_connection(
+            connection_type, model, info, args, resolved
+        )
+        # totalCount 缓存的键要区分搜索内容
+        connection.filters = {
+            "search": args.get("query"),
+            "match": args.get("match", False),
+            "filters": args.get("filters"),
+        }
+        return connection
+
+
+def _count_query(query, model):
+    query = query.limit(None).offset(None).order_by(None)
+    if model is None:
+        return query, None
+    return query, sqlalchemyinspect(model).primary_key[0]
+
+
+def exact_count(query, model=None):
+    """SELECT count(pk) FROM table WHERE ..., no subquery"""
+    query, pk = _count_query(query, model)
+    if pk is None:
+        return query.count()
+    return query.with_entities(func.count(pk)).scalar()
+
+
+def capped_count(query, model, cap):
+    """count at most cap + 1 rows, SELECT count(*) FROM (SELECT pk ... LIMIT cap + 1)"""
+    query, pk = _count_query(query, model)
+    if pk is not None:
+        query = query.with_entities(pk)
+    subquery = query.limit(cap + 1).subquery()
+    return query.session.query(func.count()).select_from(subquery).scalar()
+
+
+class CountStrategy(graphene.Enum):
+    EXACT = "exact"
+    CACHED = "cached"
+
 
 class CustomConnection(graphene.relay.Connection):
     """
@@ -110,22 +377,74 @@ class CustomConnection(graphene.relay.Connection):
     class Meta:
         abstract = True
 
-    total_count = graphene.Int()
+    total_count = graphene.Int(
+        strategy=CountStrategy(default_value=CountStrategy.CACHED.value),
+        description="总数",
+    )
+    total_count_estimate = graphene.String(
+        cap=graphene.Int(default_value=10000),
+        description="估计总数，超过 cap 返回 'cap+'",
+    )
 
     @staticmethod
-    def resolve_total_count(root, info):
-        return root.iterable.limit(None).offset(None).count()
+    def resolve_total_count(root, info, strategy=CountStrategy.CACHED.value):
+        if not isinstance(root.iterable, Query):
+            return len(root.iterable)
+        if strategy == CountStrategy.CACHED.value and getattr(root, "model", None) is not None:
+            key = ("count", normalize_key(root.filters))
+            table = root.model.__table__.name
+            count = count_cache.get(table, key)
+            if count is None:
+                count = exact_count(root.iterable, root.model)
+                count_cache.set(table, key, count)
+            return count
+        return exact_count(root.iterable, getattr(root, "model", None))
+
+    @staticmethod
+    def resolve_total_count_estimate(root, info, cap=10000):
+        if not isinstance(root.iterable, Query):
+            count = len(root.iterable)
+        else:
+            model = getattr(root, "model", None)
+            key = ("estimate", cap, normalize_key(getattr(root, "filters", None)))
+            count = count_cache.get(model.__table__.name, key) if model is not None else None
+            if count is None:
+                count = capped_count(root.iterable, model, cap)
+                if model is not None:
+                    count_cache.set(model.__table__.name, key, count)
+        return "%d+" % cap if count > cap else str(count)
+
+
+# model -> connection type, list and search fields share it
+_connection_types = {}
+
+
+def connection_type(model):
+    if model not in _connection_types:
+        _connection_types[model] = CustomConnection.create_type(
+            model.__name__ + "Connection", node=SQLAlchemyObjectTypes().get(model)
+        )
+    return _connection_types[model]
 
 
 def model_connection(model):
-    connection = CustomConnection.create_type(
-        model.__name__ + "Connection", node=SQLAlchemyObjectTypes().get(model)
-    )
     return CustomConnectionField(
-        connection,
+        connection_type(model),
+        filters=GenericScalar(),
+        limit=graphene.types.Int(),
+        offset=graphene.types.Int(),
+    )
+
+
+def model_search(model):
+    return SearchConnectionField(
+        connection_type(model),
+        query=graphene.String(required=True, description="搜索的词语，match 为 true 时是 fts5 查询语法"),
+        match=graphene.Boolean(default_value=False),
         filters=GenericScalar(),
         limit=graphene.types.Int(),
         offset=graphene.types.Int(),
+        sort=None,
     )
 
 
@@ -138,17 +457,27 @@ class QueryObjectType(graphene.ObjectType):
             _meta = ObjectTypeOptions(cls)
         fields = OrderedDict()
         fields["node"] = graphene.relay.Node.Field()
-        for model_name in dir(model_mudule):
-            model_obj = getattr(model_mudule, model_name)
-            if isinstance(model_obj, DefaultMeta):
-                fields.update(
-                    {
-                        model_name.lower(): graphene.relay.Node.Field(
-                            SQLAlchemyObjectTypes().get(model_obj)
-                        ),
-                        "%s_list" % model_name.lower(): model_connection(model_obj),
-                    }
-                )
+        fields["nodes"] = graphene.Field(
+            graphene.List(graphene.relay.Node),
+            ids=graphene.List(graphene.NonNull(graphene.ID), required=True),
+            resolver=resolve_nodes,
+            description="按 ids 的顺序返回，不存在的是 null",
+        )
+        for model_name, model_obj in module_models(model_mudule):
+            fields.update(
+                {
+                    model_name.lower(): graphene.relay.Node.Field(
+                        SQLAlchemyObjectTypes().get(model_obj)
+                    ),
+                    "%s_list" % model_name.lower(): model_connection(model_obj),
+                    "%s_aggregate" % model_name.lower(): model_aggregate(model_obj),
+                }
+            )
+            changes = model_changes(model_obj)
+            if changes is not None:
+                fields["%s_changes" % model_name.lower()] = changes
+            if model_obj in search_indexes:
+                fields["%s_search" % model_name.lower()] = model_search(model_obj)
         if _meta.fields:
             _meta.fields.update(fields)
         else:
@@ -0,0 +1,421 @@
+"""result cache of query operations, for the whole response and for each root field
+
+    result_cache = ResultCache(LRUBackend(max_bytes=64 * 1024 * 1024), ttl=60)
+    CachedDocumentBackend(..., result_cache=result_cache)
+    invalidation_hooks.append(result_cache.invalidate)
+
+an entry depends on tables: tables of the models in its selection and tables read by
+the sql of its execution. every table has a version, invalidate bumps it, an entry
+stored with an older version is a miss. when only some root fields of an operation
+are cached, only the other root fields are executed.
+
+backends: LRUBackend (in process, bounded by bytes) or SharedBackend (redis like client,
+shared by processes, LocalClient is an in process stand-in).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from graphene.utils.str_converters import to_snake_case
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql.language.printer import print_ast
+from graphql.type.definition import get_named_type
+from promise import is_thenable
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.util import find_tables
+
+from .cache import normalize_key
+
+# 无法判断读了哪些表的语句，结果不缓存
+UNKNOWN_TABLE = "*"
+
+
+class TableRecorder(object):
+    """tables read by sql statements executed in this context (thread, or async request)"""
+
+    def __init__(self):
+        self._tables = ContextVar("tables_read", default=None)
+
+    def install(self):
+        if not event.contains(Engine, "before_cursor_execute", self._before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+
+    @contextmanager
+    def record(self):
+        tables = set()
+        token = self._tables.set(tables)
+        try:
+            yield tables
+        finally:
+            self._tables.reset(token)
+            previous = self._tables.get()
+            if previous is not None:
+                previous.update(tables)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        tables = self._tables.get()
+        if tables is None:
+            return
+        compiled = getattr(context, "compiled", None)
+        if compiled is None or compiled.statement is None:
+            tables.add(UNKNOWN_TABLE)
+            return
+        tables.update(t.name for t in find_tables(compiled.statement, include_crud=True))
+
+
+table_recorder = TableRecorder()
+
+
+class LRUBackend(object):
+    """in process LRU, bounded by bytes of the stored values"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._bytes -= len(self._entries.pop(key)[1])
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)[1])
+            self._entries[key] = (time.time() + ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def versions(self, tables):
+        with self._lock:
+            return [self._versions.get(table, 0) for table in tables]
+
+    def bump(self, tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SharedBackend(object):
+    """backend on a redis like client (get, set with ex, mget, incr), shared by processes"""
+
+    def __init__(self, client, prefix="graphql:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + "result:" + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + "result:" + key, value, ex=ttl)
+
+    def versions(self, tables):
+        if not tables:
+            return []
+        values = self.client.mget([self.prefix + "table:" + table for table in tables])
+        return [int(value or 0) for value in values]
+
+    def bump(self, tables):
+        for table in tables:
+            self.client.incr(self.prefix + "table:" + table)
+
+    def stats(self):
+        return {}
+
+
+class LocalClient(object):
+    """in process stand-in for the redis client of SharedBackend"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None or (entry[0] is not None and entry[0] < time.time()):
+                return None
+            return entry[1]
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (time.time() + ex if ex else None, value)
+
+    def mget(self, names):
+        return [self.get(name) for name in names]
+
+    def incr(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            value = int(entry[1]) + 1 if entry is not None else 1
+            self._data[name] = (None, value)
+            return value
+
+
+def _hash(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf8")).hexdigest()
+
+
+def _response_name(field):
+    return field.alias.value if field.alias else field.name.value
+
+
+def selection_tables(schema, graphql_type, selection_set, fragments, tables=None):
+    """tables of the models of types in selection set, and secondary tables of selected relationships"""
+    if tables is None:
+        tables = set()
+    named_type = get_named_type(graphql_type)
+    graphene_type = getattr(named_type, "graphene_type", None)
+    meta = getattr(graphene_type, "_meta", None)
+    model = getattr(meta, "model", None)
+    if model is None and getattr(meta, "node", None) is not None:
+        # 连接类型，只选了 totalCount 也依赖节点的表
+        model = getattr(meta.node._meta, "model", None)
+    if model is not None:
+        tables.add(model.__table__.name)
+    if selection_set is None:
+        return tables
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            field = getattr(named_type, "fields", {}).get(selection.name.value)
+            if field is None:
+                continue
+            if model is not None:
+                relationship = model.__mapper__.relationships.get(to_snake_case(selection.name.value))
+                if relationship is not None and relationship.secondary is not None:
+                    tables.add(relationship.secondary.name)
+            selection_tables(schema, field.type, selection.selection_set, fragments, tables)
+            continue
+        if isinstance(selection, ast.FragmentSpread):
+            fragment = fragments.get(selection.name.value)
+            if fragment is None:
+                continue
+            type_condition, sub = fragment.type_condition, fragment.selection_set
+        else:
+            type_condition, sub = selection.type_condition, selection.selection_set
+        fragment_type = schema.get_type(type_condition.name.value) if type_condition else None
+        selection_tables(schema, fragment_type or named_type, sub, fragments, tables)
+    return tables
+
+
+class PreparedOperation(object):
+    def __init__(self, schema, operation, fragments, fragments_text):
+        self.operation = operation
+        self.text = print_ast(operation) + fragments_text
+        root_type = schema.get_query_type()
+        selections = operation.selection_set.selections
+        names = [_response_name(s) for s in selections if isinstance(s, ast.Field)]
+        # 根字段都是没有指令、不重名的字段时，才能按字段缓存
+        self.splittable = (
+            len(names) == len(selections)
+            and len(set(names)) == len(names)
+            and not any(s.directives for s in selections)
+        )
+        self.fields = []
+        for selection in selections:
+            if not isinstance(selection, ast.Field):
+                continue
+            field = root_type.fields.get(selection.name.value)
+            tables = set()
+            if field is not None:
+                selection_tables(schema, field.type, selection.selection_set, fragments, tables)
+            self.fields.append((selection, _response_name(selection), print_ast(selection) + fragments_text, tables))
+        self.tables = set().union(*[tables for _, _, _, tables in self.fields]) if self.fields else set()
+
+
+class CachePlan(object):
+    """cache keys and tables of a document, built once and cached with the document"""
+
+    def __init__(self, schema, document_ast):
+        self.schema = schema
+        self.document_ast = document_ast
+        self.fragments = OrderedDict()
+        self.operations = OrderedDict()
+        for definition in document_ast.definitions:
+            if isinstance(definition, ast.FragmentDefinition):
+                self.fragments[definition.name.value] = definition
+            elif isinstance(definition, ast.OperationDefinition):
+                self.operations[definition.name.value if definition.name else None] = definition
+        self.fragments_text = "".join(print_ast(f) for _, f in sorted(self.fragments.items()))
+        self._prepared = {}
+
+    def prepare(self, operation_name):
+        """PreparedOperation of query operation, None for mutations or unknown operation"""
+        if operation_name not in self._prepared:
+            if operation_name is None and len(self.operations) == 1:
+                operation = list(self.operations.values())[0]
+            else:
+                operation = self.operations.get(operation_name)
+            prepared = None
+            if operation is not None and operation.operation == "query":
+                prepared = PreparedOperation(self.schema, operation, self.fragments, self.fragments_text)
+            self._prepared[operation_name] = prepared
+        return self._prepared[operation_name]
+
+    def pruned(self, prepared, fields):
+        """document with only these root fields"""
+        operation = prepared.operation
+        return ast.Document(
+            definitions=[
+                ast.OperationDefinition(
+                    operation=operation.operation,
+                    selection_set=ast.SelectionSet(selections=fields),
+                    name=operation.name,
+                    variable_definitions=operation.variable_definitions,
+                    directives=operation.directives,
+                )
+            ]
+            + list(self.fragments.values())
+        )
+
+
+class ResultCache(object):
+    def __init__(self, backend, ttl=60, recorder=table_recorder):
+        self.backend = backend
+        self.ttl = ttl
+        self.recorder = recorder
+        self.recorder.install()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Returns:
+            (data, tables) or None
+        """
+        raw = self.backend.get(key)
+        if raw is not None:
+            entry = json.loads(raw.decode("utf8"), object_pairs_hook=OrderedDict)
+            tables = list(entry["versions"])
+            if self.backend.versions(tables) == [entry["versions"][table] for table in tables]:
+                self.hits += 1
+                return entry["data"], set(tables)
+        self.misses += 1
+        return None
+
+    def set(self, key, data, versions):
+        entry = {"versions": versions, "data": data}
+        self.backend.set(key, json.dumps(entry, ensure_ascii=False).encode("utf8"), self.ttl)
+        self.stores += 1
+
+    def invalidate(self, *tables):
+        self.backend.bump(tables)
+        self.invalidations += 1
+
+    def plan(self, schema, document_ast):
+        return CachePlan(schema, document_ast)
+
+    def execute(self, plan, run, operation_name=None, variables=None):
+        """execute with cache
+
+        Arguments:
+            plan {CachePlan} -- of the document
+            run {callable} -- run(document_ast) -> ExecutionResult or a promise of it
+
+        Returns:
+            ExecutionResult, a promise when run returns one
+        """
+        prepared = plan.prepare(operation_name)
+        if prepared is None:
+            return run(plan.document_ast)
+        variables_key = normalize_key(variables or {})
+        # 只有一个根字段时，字段缓存就是整个响应
+        response_key = None
+        if not (prepared.splittable and len(prepared.fields) == 1):
+            response_key = _hash("response", prepared.text, variables_key)
+            cached = self.get(response_key)
+            if cached is not None:
+                return ExecutionResult(data=cached[0])
+
+        cached_fields = OrderedDict()
+        if prepared.splittable:
+            for field, name, text, _ in prepared.fields:
+                hit = self.get(_hash("field", text, variables_key))
+                if hit is not None:
+                    cached_fields[name] = hit
+        missing = [f for f in prepared.fields if f[1] not in cached_fields]
+        versions = self._versions(set().union(*[f[3] for f in missing]) if missing else set())
+        read_tables = set()
+
+        def finish(result):
+            if result is not None and (result.data is None or result.invalid):
+                return result
+            if prepared.splittable:
+                data = OrderedDict()
+                for field, name, _, _ in prepared.fields:
+                    if name in cached_fields:
+                        data[name] = cached_fields[name][0]
+                    elif name in result.data:
+                        data[name] = result.data[name]
+            else:
+                data = result.data
+            if result is not None and (result.errors or UNKNOWN_TABLE in read_tables):
+                return ExecutionResult(data=data, errors=result.errors)
+            # 执行前读的版本，执行中有提交时缓存的结果直接过期
+            versions.update(self._versions(read_tables - set(versions)))
+            if prepared.splittable:
+                for field, name, text, tables in missing:
+                    if name in data:
+                        field_versions = dict((t, versions[t]) for t in tables | read_tables)
+                        self.set(_hash("field", text, variables_key), data[name], field_versions)
+            if response_key is not None:
+                for _, tables in cached_fields.values():
+                    versions.update(self._versions(tables - set(versions)))
+                if not prepared.splittable:
+                    versions.update(self._versions(prepared.tables - set(versions)))
+                self.set(response_key, data, versions)
+            return ExecutionResult(data=data)
+
+        if not missing and prepared.splittable:
+            return finish(None)
+        document = plan.document_ast
+        if cached_fields:
+            document = plan.pruned(prepared, [f[0] for f in missing])
+        with self.recorder.record() as read_tables:
+            result = run(document)
+        if is_thenable(result):
+            # 异步执行（aio.py），之后的语句在复制的 context 里记录到同一个 read_tables
+            return result.then(finish)
+        return finish(result)
+
+    def _versions(self, tables):
+        tables = sorted(tables)
+        return dict(zip(tables, self.backend.versions(tables)))
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "hit_rate": float(self.hits) / total if total else 0.0,
+        }
+        stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,86 @@
+"""read only rows for list fields, without ORM instances
+
+    articleList(first: 1000) { edges { node { id title updateTime } } }
+
+    -> SELECT article.id, article.title, article.update_time FROM article ... (no identity map)
+
+when the nodes of a list select only columns (no relationships, foreign key objects or
+hybrid properties) the page is read with a core select of those columns, every row becomes
+a record: a tuple with the columns as properties, built without python code per row.
+records are not in the session and can not be changed, the generated output types resolve
+their columns like attributes of the model.
+"""
+from functools import partial
+from operator import itemgetter
+
+import sqlalchemy
+from graphene.utils.str_converters import to_snake_case
+
+
+class Record(object):
+    """read only row of a model, columns not selected are missing (None in graphql)"""
+
+    __slots__ = ()
+    __model__ = None
+    __primary_key__ = ()
+
+    def primary_key(self):
+        keys = [getattr(self, key) for key in self.__primary_key__]
+        return tuple(keys) if len(keys) > 1 else keys[0]
+
+
+# (model, columns) -> record class
+_record_classes = {}
+
+
+def record_class(model, keys):
+    """`<Model>Record` tuple of keys, every key is a property"""
+    cache_key = (model, tuple(keys))
+    if cache_key not in _record_classes:
+        mapper = sqlalchemy.inspect(model)
+        namespace = {key: property(itemgetter(i)) for i, key in enumerate(keys)}
+        namespace.update(
+            __slots__=(),
+            __model__=model,
+            __primary_key__=tuple(mapper.get_property_by_column(c).key for c in mapper.primary_key),
+        )
+        if hasattr(model, "db_id") and "id" in keys:
+            namespace["db_id"] = namespace["id"]
+        _record_classes[cache_key] = type(model.__name__ + "Record", (Record, tuple), namespace)
+    return _record_classes[cache_key]
+
+
+def row_columns(model, tree, required=()):
+    """column attributes to read for the node selection tree, None when it needs instances
+
+    Arguments:
+        tree {dict} -- selection of the node, from planner.node_selection
+        required {list} -- attributes needed anyway, like sort keys of the cursor
+
+    Returns:
+        list -- attribute keys, primary keys first then sorted
+    """
+    mapper = sqlalchemy.inspect(model)
+    keys = [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+    columns = set()
+    for name in list(tree) + list(required):
+        key = to_snake_case(name)
+        if key in ("id", "db_id"):
+            continue
+        if key not in mapper.column_attrs:
+            # 关联、外键对象、hybrid property 要用模型实例
+            return None
+        columns.add(key)
+    # 排序后同样的字段共用一个 record 类
+    return keys + sorted(columns - set(keys))
+
+
+def select_rows(query, model, keys):
+    """rows of query as records with only keys set, read with a core select
+
+    filters, joins, order and limit of query are kept, the session is only used for the
+    connection (the same bind as the query, replicas included)
+    """
+    statement = query.with_entities(*[getattr(model, key) for key in keys]).statement
+    result = query.session.execute(statement, mapper=sqlalchemy.inspect(model))
+    return list(map(partial(tuple.__new__, record_class(model, keys)), result.fetchall()))
@@ -0,0 +1,148 @@
+"""sqlite fts5 full text index, opt-in per model
+
+    search_index(Article, "title", "description", "tags", "text")
+
+creates `article_fts`, an external content fts5 table over the columns (the text is not
+stored twice), kept in sync by triggers on insert, update and delete of `article`, so
+session commits, bulk mutations and core inserts all update it. rows written before the
+index existed are added by `rebuild` (`flask search-index`).
+
+filters get the ops `search` (plain words, all must match) and `match` (fts5 query
+syntax), `<model>Search(query: "...")` is a connection ranked by bm25.
+"""
+import logging
+
+from sqlalchemy import event, func, literal, literal_column, select
+from sqlalchemy.inspection import inspect as sqlalchemyinspect
+from sqlalchemy.sql import column, table
+
+logger = logging.getLogger(__name__)
+
+# model -> SearchIndex
+search_indexes = {}
+
+
+def search_terms(text):
+    """plain words to fts5 query, every word is quoted so no syntax is needed"""
+    return " ".join('"%s"' % word.replace('"', '""') for word in text.split())
+
+
+class SearchIndex(object):
+    def __init__(self, model, columns, tokenize="unicode61 remove_diacritics 2", weights=None):
+        self.model = model
+        self.columns = list(columns)
+        self.tokenize = tokenize
+        self.weights = weights
+        self.content = model.__table__.name
+        self.name = "%s_fts" % self.content
+        self.primary_key = sqlalchemyinspect(model).primary_key[0]
+        self.table = table(self.name, column("rowid"), column("rank"), *[column(c) for c in self.columns])
+
+    def ddl(self):
+        """statements creating the fts table and its triggers"""
+        columns = ", ".join(self.columns)
+        new = ", ".join("new.%s" % c for c in self.columns)
+        old = ", ".join("old.%s" % c for c in self.columns)
+        values = {
+            "name": self.name,
+            "content": self.content,
+            "pk": self.primary_key.name,
+            "columns": columns,
+            "new": new,
+            "old": old,
+        }
+        delete = (
+            "INSERT INTO %(name)s(%(name)s, rowid, %(columns)s) VALUES ('delete', old.%(pk)s, %(old)s);"
+            % values
+        )
+        insert = "INSERT INTO %(name)s(rowid, %(columns)s) VALUES (new.%(pk)s, %(new)s);" % values
+        return [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %(name)s USING fts5(%(columns)s, "
+            "content='%(content)s', content_rowid='%(pk)s', tokenize='%(tokenize)s')"
+            % dict(values, tokenize=self.tokenize),
+            "CREATE TRIGGER IF NOT EXISTS %(name)s_ai AFTER INSERT ON %(content)s BEGIN " % values
+            + insert
+            + " END",
+            "CREATE TRIGGER IF NOT EXISTS %(name)s_ad AFTER DELETE ON %(content)s BEGIN " % values
+            + delete
+            + " END",
+            # 只有索引的字段变化时才更新
+            "CREATE TRIGGER IF NOT EXISTS %(name)s_au AFTER UPDATE OF %(columns)s ON %(content)s BEGIN "
+            % values
+            + delete
+            + " "
+            + insert
+            + " END",
+        ]
+
+    def create(self, connection):
+        for statement in self.ddl():
+            connection.execute(statement)
+
+    def drop(self, connection):
+        connection.execute("DROP TABLE IF EXISTS %s" % self.name)
+
+    def rebuild(self, connection):
+        """index all rows of the content table again, for rows written before the index
+
+        Returns:
+            int -- indexed rows
+        """
+        self.create(connection)
+        connection.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (self.name, self.name))
+        return connection.execute("SELECT count(*) FROM %s" % self.content).scalar()
+
+    def matches(self, expression):
+        return literal_column(self.name).op("MATCH")(expression)
+
+    def condition(self, expression, column_name=None):
+        """primary key in rows matching the fts5 expression, optional only in one column"""
+        if column_name is not None:
+            expression = literal("{%s} : (" % column_name) + expression + literal(")")
+        return self.primary_key.in_(select([self.table.c.rowid]).where(self.matches(expression)))
+
+    def rank(self):
+        if self.weights:
+            return func.bm25(literal_column(self.name), *self.weights)
+        return self.table.c.rank
+
+    def ranked(self, query, expression):
+        """query joined to matching rows, best first"""
+        return (
+            query.join(self.table, self.table.c.rowid == self.primary_key)
+            .filter(self.matches(expression))
+            .order_by(None)
+            .order_by(self.rank(), self.primary_key)
+        )
+
+
+def search_index(model, *columns, **options):
+    """create an fts5 index for model columns with the table (sqlite only)
+
+    Arguments:
+        model {Model} -- sqlalchemy model
+        columns {str} -- column names to index
+
+    Keyword Arguments:
+        tokenize {str} -- fts5 tokenizer, `trigram` matches any substring like LIKE '%..%'
+        weights {list} -- bm25 weight of each column, default all 1
+
+    Returns:
+        SearchIndex
+    """
+    index = SearchIndex(model, columns, **options)
+    search_indexes[model] = index
+
+    def after_create(target, connection, **kw):
+        if connection.dialect.name == "sqlite":
+            index.create(connection)
+        else:
+            logger.warning("%s: full text index needs sqlite, not %s", index.name, connection.dialect.name)
+
+    def before_drop(target, connection, **kw):
+        if connection.dialect.name == "sqlite":
+            index.drop(connection)
+
+    event.listen(model.__table__, "after_create", after_create)
+    event.listen(model.__table__, "before_drop", before_drop)
+    return index
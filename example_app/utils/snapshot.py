@@ -0,0 +1,122 @@
+"""schema snapshot: SDL and type map, written at build time and read by workers
+
+    flask graphql-schema schema.json
+
+graphql-core builds field maps of types lazily on first use, prewarm builds them all before
+the first request (and before fork, so workers share them). the snapshot is a consistency
+check, not a startup speedup: only when GRAPHQL_SCHEMA_SNAPSHOT is set the built schema is
+printed, hashed and compared to it, a worker started with a stale snapshot is reported.
+"""
+import hashlib
+import json
+import logging
+import time
+
+from graphql.type import (
+    GraphQLEnumType,
+    GraphQLInputObjectType,
+    GraphQLInterfaceType,
+    GraphQLObjectType,
+    GraphQLScalarType,
+    GraphQLUnionType,
+)
+
+KINDS = (
+    (GraphQLObjectType, "OBJECT"),
+    (GraphQLInterfaceType, "INTERFACE"),
+    (GraphQLUnionType, "UNION"),
+    (GraphQLEnumType, "ENUM"),
+    (GraphQLInputObjectType, "INPUT_OBJECT"),
+    (GraphQLScalarType, "SCALAR"),
+)
+
+logger = logging.getLogger("example_app.graphql")
+
+
+def type_map(schema):
+    """{type name: {"kind": ..., "fields": [...]}} of all types, builds lazy field maps"""
+    types = {}
+    for name, graphql_type in sorted(schema.get_type_map().items()):
+        if name.startswith("__"):
+            continue
+        entry = {"kind": next(kind for cls, kind in KINDS if isinstance(graphql_type, cls))}
+        if isinstance(graphql_type, (GraphQLObjectType, GraphQLInterfaceType, GraphQLInputObjectType)):
+            entry["fields"] = {field_name: str(field.type) for field_name, field in graphql_type.fields.items()}
+        if isinstance(graphql_type, GraphQLObjectType):
+            entry["interfaces"] = [interface.name for interface in graphql_type.interfaces]
+        elif isinstance(graphql_type, GraphQLUnionType):
+            entry["types"] = [t.name for t in graphql_type.types]
+        elif isinstance(graphql_type, GraphQLEnumType):
+            entry["values"] = [value.name for value in graphql_type.values]
+        types[name] = entry
+    return types
+
+
+def schema_snapshot(schema):
+    """
+    Returns:
+        dict -- {"hash": sha256 of sdl, "sdl": ..., "types": type_map}
+    """
+    sdl = str(schema)
+    return {
+        "hash": hashlib.sha256(sdl.encode("utf8")).hexdigest(),
+        "sdl": sdl,
+        "types": type_map(schema),
+    }
+
+
+def write_snapshot(schema, path):
+    snapshot = schema_snapshot(schema)
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=2, ensure_ascii=False, sort_keys=True)
+    return snapshot
+
+
+def read_snapshot(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_field_maps(schema):
+    """build the lazy field maps of all types
+
+    Returns:
+        int -- number of types
+    """
+    graphql_types = schema.get_type_map().values()
+    # 读属性就会构建
+    for graphql_type in graphql_types:
+        if isinstance(graphql_type, (GraphQLObjectType, GraphQLInterfaceType, GraphQLInputObjectType)):
+            graphql_type.fields
+        if isinstance(graphql_type, GraphQLObjectType):
+            graphql_type.interfaces
+        elif isinstance(graphql_type, GraphQLUnionType):
+            graphql_type.types
+    return len(graphql_types)
+
+
+def prewarm(schema, snapshot=None):
+    """build all lazy field maps of schema
+
+    Arguments:
+        schema {Schema} -- graphene schema
+        snapshot {dict} -- from read_snapshot, optional, the schema is compared to it
+
+    Returns:
+        bool -- False when the schema does not match snapshot
+    """
+    start = time.time()
+    count = build_field_maps(schema)
+    logger.info("schema prewarmed in %.1fms, %d types", (time.time() - start) * 1000, count)
+    if snapshot is None:
+        return True
+    current = schema_snapshot(schema)
+    if snapshot.get("hash") != current["hash"]:
+        changed = sorted(
+            name
+            for name in set(snapshot.get("types", {})) | set(current["types"])
+            if snapshot.get("types", {}).get(name) != current["types"].get(name)
+        )
+        logger.warning("schema snapshot is stale, changed types: %s", ", ".join(changed[:20]))
+        return False
+    return True
@@ -0,0 +1,162 @@
+"""request scoped unit of work for mutations (opt-in, GRAPHQL_UNIT_OF_WORK)
+
+    mutation {
+        a: createArticle(input: {...}) { ok }
+        b: updateUser(id: "...", input: {...}) { ok }
+    }
+
+every root mutation field of the request runs in a savepoint of one transaction. a field
+that raises, calls rollback_mutation or fails to flush is rolled back to its savepoint,
+the others are committed together when the request ends: on_before_commit hooks in field
+order, one commit, cache invalidation, on_after_commit hooks in field order. when that
+commit fails nothing is written and the response has the error.
+
+mutations call commit_mutation / rollback_mutation instead of session.commit / rollback,
+without a unit of work they commit at once like before.
+"""
+from graphql.error import GraphQLError
+from promise import Promise, is_thenable
+from sqlalchemy.exc import SQLAlchemyError
+
+from example_app.extensions import db
+from .cache import invalidate_model
+from .loader import get_request_state
+
+
+def begin_unit_of_work(context):
+    unit = UnitOfWork()
+    get_request_state(context)["unit_of_work"] = unit
+    return unit
+
+
+def get_unit_of_work(context):
+    return get_request_state(context).get("unit_of_work")
+
+
+def commit_mutation(info, models, before=None, after=None):
+    """commit a mutation, at the end of the request with a unit of work
+
+    Arguments:
+        models {list} -- changed models, their caches are invalidated after commit
+        before {callable} -- called before commit, like on_before_commit
+        after {callable} -- called after commit, like on_after_commit
+
+    Returns:
+        str -- error message when the commit failed, else None
+    """
+    unit = get_unit_of_work(info.context)
+    if unit is not None and unit.savepoint is not None:
+        unit.field.append((models, before, after))
+        return None
+    return _commit([(models, before, after)])
+
+
+def rollback_mutation(info):
+    """undo the changes of this mutation field"""
+    unit = get_unit_of_work(info.context)
+    if unit is not None and unit.savepoint is not None:
+        unit.rollback_field()
+    else:
+        db.session.rollback()
+
+
+def _commit(pending):
+    try:
+        for _, before, _ in pending:
+            if before is not None:
+                before()
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return "操作报错：%s" % e
+    models = []
+    for changed, _, _ in pending:
+        models.extend(m for m in changed if m not in models)
+    invalidate_model(*models)
+    for _, _, after in pending:
+        if after is not None:
+            after()
+    return None
+
+
+class UnitOfWork(object):
+    def __init__(self):
+        self.savepoint = None
+        self.field = None  # 当前字段的 (models, before, after)
+        self.pending = []
+        self.fields = 0
+
+    def resolve(self, next, root, info, **args):
+        """run a root mutation field in a savepoint"""
+        self.fields += 1
+        self.savepoint = db.session.begin_nested()
+        self.field = []
+        try:
+            result = next(root, info, **args)
+            if is_thenable(result):
+                # 变更要在释放 savepoint 之前完成
+                result = Promise.resolve(result).get()
+            if not self.savepoint.is_active:
+                # 字段里 flush 失败或者 rollback_mutation 过
+                self.rollback_field()
+                return result
+            try:
+                # 释放 savepoint 时 flush，约束错误在这里出现
+                self.savepoint.commit()
+            except SQLAlchemyError as e:
+                self.rollback_field()
+                return type(result)(ok=False, message="操作报错：%s" % e)
+            self.pending.extend(self.field)
+            return result
+        except Exception:
+            self.rollback_field()
+            raise
+        finally:
+            self.savepoint = None
+            self.field = None
+
+    def rollback_field(self):
+        # flush 失败后 savepoint 不再 active，仍然要回滚，只有已经关闭的跳过
+        if self.savepoint.session is not None:
+            self.savepoint.rollback()
+        self.field = []
+
+    def commit(self):
+        """commit the fields at the end of the request
+
+        Returns:
+            str -- error message when the commit failed, else None
+        """
+        if not self.fields:
+            return None
+        pending, self.pending = self.pending, []
+        return _commit(pending)
+
+    def finish(self, results):
+        """commit and add the error to results (ExecutionResult) when it failed"""
+        error = self.commit()
+        if error is None:
+            return
+        for result in results:
+            if result is not None:
+                # 什么都没有写入，字段的 ok 不再有效
+                result.data = None
+                result.errors = list(result.errors or []) + [GraphQLError(error)]
+
+
+class UnitOfWorkMiddleware(object):
+    """graphene middleware, root mutation fields run in the unit of work of the request
+
+    must be inside db.routing_middleware (before it in the middleware list), the
+    savepoint is opened after the session is routed to the primary
+    """
+
+    def resolve(self, next, root, info, **args):
+        if len(info.path) == 1 and info.operation.operation == "mutation":
+            unit = get_unit_of_work(info.context)
+            if unit is not None:
+                return unit.resolve(next, root, info, **args)
+        return next(root, info, **args)
+
+
+unit_of_work_middleware = UnitOfWorkMiddleware()
@@ -1,24 +1,58 @@
 from graphql_relay.node.node import from_global_id
-from graphene_sqlalchemy.types import (
-    sort_argument_for_object_type,
-    default_connection_field_factory,
-    get_global_registry,
-    construct_fields,
-    SQLAlchemyObjectType,
-)
-from graphene_sqlalchemy.converter import Dynamic
+from collections import OrderedDict
+from graphene_sqlalchemy.types import SQLAlchemyObjectType
+from graphene_sqlalchemy.fields import UnsortedSQLAlchemyConnectionField
 import sqlalchemy
-from graphene.types.utils import yank_fields_from_attrs
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import interfaces
+from flask_sqlalchemy.model import DefaultMeta
 import graphene
+from .loader import (
+    ModelLoader,
+    foreign_key_resolver,
+    get_loader,
+    model_for_table,
+    relationship_resolver,
+)
+from .rows import Record
 
 
 class SQLAlchemyInputObjectType(graphene.InputObjectType):
+    """input type of model, fields are shared with the output type of the model"""
+
     @classmethod
     def __init_subclass_with_meta__(
         cls, model=None, registry=None, only_fields=[], exclude_fields=[], **options
     ):
-        if not registry:
-            registry = get_global_registry()
+        autoexclude, foreign_keys = input_columns(model)
+        # many to many relationships are lists of global ids
+        for key, relationship in sqlalchemy.inspect(model).relationships.items():
+            if relationship.secondary is not None and not hasattr(cls, key):
+                if (only_fields and key not in only_fields) or key in exclude_fields:
+                    continue
+                setattr(cls, key, graphene.List(graphene.ID, description="Global Id list"))
+        # Add all of the fields to the input type
+        for key, value in model_attr_fields(model).items():
+            if (only_fields and key not in only_fields) or key in exclude_fields or key in autoexclude:
+                continue
+            if not hasattr(cls, key):
+                if key in foreign_keys:
+                    value = graphene.ID(description="Global Id")
+                setattr(cls, key, value)
+
+        super(SQLAlchemyInputObjectType, cls).__init_subclass_with_meta__(**options)
+
+
+_input_columns = {}
+
+
+def input_columns(model):
+    """
+    Returns:
+        (list, list) -- columns not in input (auto increment primary key, server default timestamp),
+        foreign key columns (input as global id)
+    """
+    if model not in _input_columns:
         autoexclude = []
         foreign_keys = []
         # always pull ids out to a separate argument
@@ -31,31 +65,104 @@ class SQLAlchemyInputObjectType(graphene.InputObjectType):
                 and col.server_default is not None
             ):
                 autoexclude.append(col.name)
-        sqla_fields = yank_fields_from_attrs(
-            construct_fields(
-                obj_type=SQLAlchemyObjectTypes().get(model),
-                model=model,
-                registry=registry,
-                only_fields=tuple(only_fields),
-                exclude_fields=tuple(exclude_fields + autoexclude),
-                connection_field_factory=default_connection_field_factory,
-            ),
-            _as=graphene.Field,
-        )
-        # Add all of the fields to the input type
-        for key, value in sqla_fields.items():
-            if not (isinstance(value, Dynamic) or hasattr(cls, key)):
-                if key in foreign_keys:
-                    value = graphene.ID(description="Global Id")
-                setattr(cls, key, value)
+        _input_columns[model] = (autoexclude, foreign_keys)
+    return _input_columns[model]
 
-        super(SQLAlchemyInputObjectType, cls).__init_subclass_with_meta__(**options)
+
+_attr_fields = {}
+
+
+def model_attr_fields(model):
+    """fields of columns and hybrid properties, constructed once by the output type"""
+    if model not in _attr_fields:
+        SQLAlchemyObjectTypes().get(model)
+    return _attr_fields[model]
 
 
 class DatabaseId(graphene.Interface):
     db_id = graphene.Int()
 
 
+class BatchedConnectionField(UnsortedSQLAlchemyConnectionField):
+    """relationship connection, resolved by RelationshipLoader"""
+
+    def __init__(self, type, relationship, *args, **kwargs):
+        self.relationship = relationship
+        super(BatchedConnectionField, self).__init__(type, *args, **kwargs)
+
+    def get_resolver(self, parent_resolver):
+        resolver = relationship_resolver(self.relationship.parent.entity, self.relationship.key)
+        return super(BatchedConnectionField, self).get_resolver(resolver)
+
+
+def batched_connection_field_factory(relationship, registry, **field_kwargs):
+    model_type = registry.get_type_for_model(relationship.mapper.entity)
+    return BatchedConnectionField(model_type, relationship, **field_kwargs)
+
+
+class BatchedObjectType(SQLAlchemyObjectType):
+    """SQLAlchemyObjectType, relationships and foreign keys are loaded with DataLoader
+
+        relationship `roles` -> RelationshipLoader
+        foreign key `author_id` -> field `author` by ModelLoader
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def __init_subclass_with_meta__(cls, model=None, **options):
+        options.setdefault("connection_field_factory", batched_connection_field_factory)
+        super(BatchedObjectType, cls).__init_subclass_with_meta__(model=model, **options)
+        inspected = sqlalchemy.inspect(model)
+        attr_names = set(inspected.column_attrs.keys()) | set(inspected.composites.keys())
+        attr_names.update(
+            key for key, attr in inspected.all_orm_descriptors.items() if isinstance(attr, hybrid_property)
+        )
+        # input types reuse these instead of construct_fields again
+        _attr_fields[model] = OrderedDict(
+            (key, field) for key, field in cls._meta.fields.items() if key in attr_names
+        )
+        for key, relationship in inspected.relationships.items():
+            if key in cls._meta.fields and (
+                relationship.direction == interfaces.MANYTOONE or not relationship.uselist
+            ):
+                cls._meta.fields[key] = graphene.Dynamic(
+                    _batched_field(relationship.mapper.entity, relationship_resolver(model, key))
+                )
+        for key, column in inspected.columns.items():
+            if len(column.foreign_keys) != 1 or not key.endswith("_id"):
+                continue
+            name = key[:-3]
+            if hasattr(model, name) or name in cls._meta.fields:
+                continue
+            target = model_for_table(list(column.foreign_keys)[0].column.table)
+            if target is not None:
+                cls._meta.fields[name] = graphene.Dynamic(
+                    _batched_field(target, foreign_key_resolver(target, key))
+                )
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        if isinstance(root, Record):
+            return root.__model__ is cls._meta.model
+        return super(BatchedObjectType, cls).is_type_of(root, info)
+
+    def resolve_id(self, info):
+        if isinstance(self, Record):
+            return self.primary_key()
+        return SQLAlchemyObjectType.resolve_id(self, info)
+
+    @classmethod
+    def get_node(cls, info, id):
+        """node by primary key, batched and loaded once per request by ModelLoader"""
+        return get_loader(info.context, ModelLoader, cls._meta.model).load(id)
+
+
+def _batched_field(target, resolver):
+    return lambda: graphene.Field(SQLAlchemyObjectTypes().get(target), resolver=resolver)
+
+
 class SQLAlchemyObjectTypes(object):
     """SQLAlchemyObjectType 不能创建多次，要不然会报错，这个类解决这个问题, 这个类是单例模式"""
 
@@ -74,8 +181,22 @@ class SQLAlchemyObjectTypes(object):
         else:
             if hasattr(model, "id"):
                 model.db_id = model.id
-            t = SQLAlchemyObjectType.create_type(
+            t = BatchedObjectType.create_type(
                 name, model=model, interfaces=(graphene.relay.Node, DatabaseId)
             )
             self.all_types[name] = t
             return t
+
+
+_module_models = {}
+
+
+def module_models(module):
+    """(name, model) of flask-sqlalchemy models in module, dir() is walked once per module"""
+    if module not in _module_models:
+        _module_models[module] = [
+            (name, getattr(module, name))
+            for name in dir(module)
+            if isinstance(getattr(module, name), DefaultMeta)
+        ]
+    return _module_models[module]
@@ -0,0 +1,209 @@
+import json
+
+from flask import current_app, request
+from flask_graphql import GraphQLView
+from graphql_server import HttpQueryError, encode_execution_results, run_http_query
+from promise import is_thenable
+
+from .aio import AsyncExecutor
+from .backend import query_hash
+from .encoder import ResponseEncoder
+from .transaction import begin_unit_of_work, get_unit_of_work
+
+
+class CustomGraphQLView(GraphQLView):
+    """GraphQLView with Automatic Persisted Queries
+
+        {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "..."}}}
+
+    without query, the query is read from backend cache by hash,
+    with query, the hash must match and the query is cached
+
+    with instrumentation every request is traced and logged,
+    the trace is added to response `extensions` when the debug header is sent
+
+    dispatch_async is the same request executed on an event loop (asgi.py)
+
+    with GRAPHQL_UNIT_OF_WORK the mutations of a request are committed together at the end
+    (transaction.py)
+
+    responses are written by `encoder` (encoder.py): orjson when installed, compressed when
+    the client accepts it, streamed in chunks for operations of a high cost
+    """
+
+    instrumentation = None
+    encoder = ResponseEncoder()
+
+    def get_middleware(self):
+        middleware = list(self.middleware or [])
+        if self.instrumentation is not None:
+            middleware.append(self.instrumentation.middleware)
+        return middleware or None
+
+    def dispatch_request(self):
+        trace = self.instrumentation.start() if self.instrumentation is not None else None
+        try:
+            try:
+                results, *options = self.run_query(executor=self.get_executor())
+                self.commit_unit_of_work(results)
+                response = self.respond(results, *options)
+            except HttpQueryError as e:
+                response = self.error_response(e)
+        finally:
+            if trace is not None:
+                self.instrumentation.finish()
+        if trace is not None:
+            self.log(trace, response)
+        return response
+
+    async def dispatch_async(self, async_request):
+        """dispatch_request on the event loop, executed by aio.AsyncExecutor
+
+        Arguments:
+            async_request {AsyncRequest} -- request of the current asgi task
+        """
+        with async_request.active():
+            trace = self.instrumentation.start() if self.instrumentation is not None else None
+            try:
+                try:
+                    with async_request.contexts():
+                        results, *options = self.run_query(
+                            executor=AsyncExecutor(async_request), return_promise=True
+                        )
+                    results = [(await result) if is_thenable(result) else result for result in results]
+                    await async_request.offload_in(
+                        async_request.scope, self.commit_unit_of_work, results
+                    )
+                    with async_request.contexts():
+                        response = self.respond(results, *options)
+                except HttpQueryError as e:
+                    with async_request.contexts():
+                        response = self.error_response(e)
+            finally:
+                if trace is not None:
+                    self.instrumentation.finish()
+            if trace is not None:
+                with async_request.contexts():
+                    self.log(trace, response)
+        return response
+
+    def run_query(self, **execute_options):
+        """
+        Returns:
+            (list, list, bool, bool, bool) -- execution results (promises with return_promise),
+                params, is batch, pretty, show graphiql
+        """
+        request_method = request.method.lower()
+        data = self.parse_body()
+        show_graphiql = request_method == "get" and self.should_display_graphiql()
+        pretty = self.pretty or show_graphiql or request.args.get("pretty")
+        if execute_options.get("executor") is None:
+            execute_options.pop("executor", None)
+        context = self.get_context()
+        if current_app.config.get("GRAPHQL_UNIT_OF_WORK"):
+            begin_unit_of_work(context)
+        execution_results, all_params = run_http_query(
+            self.schema,
+            request_method,
+            data,
+            query_data=request.args,
+            batch_enabled=self.batch,
+            catch=show_graphiql,
+            backend=self.get_backend(),
+            root=self.get_root_value(),
+            context=context,
+            middleware=self.get_middleware(),
+            **execute_options
+        )
+        return execution_results, all_params, isinstance(data, list), pretty, show_graphiql
+
+    def commit_unit_of_work(self, execution_results):
+        unit = get_unit_of_work(self.get_context())
+        if unit is not None:
+            unit.finish(execution_results)
+
+    def respond(self, execution_results, all_params, is_batch, pretty, show_graphiql):
+        result, status_code = encode_execution_results(
+            execution_results,
+            is_batch=is_batch,
+            format_error=self.format_error,
+            encode=self.add_trace,
+        )
+        if show_graphiql:
+            return self.render_graphiql(
+                params=all_params[0], result=self.encoder.dumps(result, pretty).decode("utf8")
+            )
+        if not pretty and self.encoder.streams(requested_cost(result)):
+            chunks = self.encoder.chunked(self.encoder.iterencode(result))
+            return self.encoder.stream_response(chunks, status_code, request.accept_encodings)
+        return self.encoder.response(self.encoder.dumps(result, pretty), status_code, request.accept_encodings)
+
+    def error_response(self, error):
+        return self.encoder.response(
+            self.encode({"errors": [self.format_error(error)]}),
+            error.status_code,
+            request.accept_encodings,
+            headers=error.headers,
+        )
+
+    def log(self, trace, response):
+        status = getattr(response, "status_code", 200)
+        self.instrumentation.log(trace, method=request.method, path=request.path, status=status)
+
+    def add_trace(self, data):
+        trace = self.instrumentation.current() if self.instrumentation is not None else None
+        if (
+            trace is not None
+            and isinstance(data, dict)
+            and request.headers.get(self.instrumentation.debug_header)
+        ):
+            data.setdefault("extensions", {})["trace"] = self.instrumentation.summary(trace)
+        return data
+
+    def encode(self, data, pretty=False):
+        return self.encoder.dumps(self.add_trace(data), pretty)
+
+    def parse_body(self):
+        data = super(CustomGraphQLView, self).parse_body()
+        if request.method.lower() == "get":
+            data = request.args.to_dict()
+        if isinstance(data, list):
+            return [self.persisted_query(entry) for entry in data]
+        trace = self.instrumentation.current() if self.instrumentation is not None else None
+        if trace is not None:
+            trace.operation = data.get("operationName")
+        return self.persisted_query(data)
+
+    def persisted_query(self, data):
+        extensions = data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpQueryError(400, "extensions is invalid JSON.")
+        persisted = (extensions or {}).get("persistedQuery")
+        if not persisted:
+            return data
+        sha256 = persisted.get("sha256Hash")
+        if not sha256:
+            raise HttpQueryError(400, "persistedQuery must have sha256Hash.")
+        data = data.to_dict() if hasattr(data, "to_dict") else dict(data)
+        if data.get("query"):
+            if query_hash(data["query"]) != sha256:
+                raise HttpQueryError(400, "provided sha does not match query")
+            return data
+        document = self.backend.get(sha256) if self.backend is not None else None
+        if document is None:
+            raise HttpQueryError(200, "PersistedQueryNotFound")
+        data["query"] = document.document_string
+        return data
+
+
+def requested_cost(result):
+    """cost of the operations in a response, batches add up"""
+    results = result if isinstance(result, (list, tuple)) else [result]
+    costs = [
+        ((r or {}).get("extensions") or {}).get("cost", {}).get("requested") for r in results
+    ]
+    costs = [cost for cost in costs if cost is not None]
+    return sum(costs) if costs else None
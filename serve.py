@@ -0,0 +1,5 @@
+from example_app.serve import main
+
+
+if __name__ == "__main__":
+    main()
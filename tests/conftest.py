@@ -0,0 +1,46 @@
+"""fixtures: the app on a new in-memory sqlite database for every test
+
+    pip install pytest
+    python -m pytest tests
+"""
+import pytest
+
+from example_app import app as app_module
+from example_app.extensions import db
+from example_app.utils.cache import count_cache
+
+
+@pytest.fixture
+def app():
+    app = app_module.app
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    result_cache, app_module.backend.result_cache = app_module.backend.result_cache, None
+    app_module.backend.clear()
+    # totalCount 的缓存按表名，每个测试都是新数据库
+    count_cache.clear()
+    with app.app_context():
+        # 内存数据库用 StaticPool，dispose 后的新连接是一个空数据库
+        db.get_engine(app).dispose()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.get_engine(app).dispose()
+    app_module.backend.result_cache = result_cache
+    app_module.backend.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def execute(client):
+    """post a query to /graphql, the json response"""
+
+    def execute(query, variables=None):
+        response = client.post("/graphql", json={"query": query, "variables": variables})
+        db.session.remove()
+        return response.get_json()
+
+    return execute
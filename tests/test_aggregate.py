@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.scheme import schema
+
+
+@pytest.fixture
+def articles(app):
+    db.session.add(User(id=1, name="a", password="p"))
+    db.session.add(User(id=2, name="b", password="p"))
+    for i, author_id in enumerate([1, 1, 1, 2, 2], 1):
+        db.session.add(
+            Article(
+                id=i,
+                title="t%d" % i,
+                text="x",
+                author_id=author_id,
+                create_time=datetime.datetime(2020, 1, i),
+            )
+        )
+    db.session.commit()
+    db.session.remove()
+
+
+def aggregate(execute, arguments, selection):
+    result = execute("{ articleAggregate%s { %s } }" % (arguments, selection))
+    assert "errors" not in result, result
+    return result["data"]["articleAggregate"]
+
+
+def test_count_by_group(execute, articles):
+    assert aggregate(execute, "(groupBy: [AUTHOR_ID])", "group { authorId } count") == [
+        {"group": {"authorId": 1}, "count": 3},
+        {"group": {"authorId": 2}, "count": 2},
+    ]
+    assert aggregate(execute, "", "count") == [{"count": 5}]
+
+
+def test_min_max_with_filters_and_limit(execute, articles):
+    rows = aggregate(
+        execute,
+        '(groupBy: [AUTHOR_ID], filters: [{key: "id", op: ">", val: 1}], limit: 1)',
+        "group { authorId } count min { id createTime } max { createTime }",
+    )
+    assert rows == [
+        {
+            "group": {"authorId": 1},
+            "count": 2,
+            "min": {"id": 2, "createTime": "2020-01-02T00:00:00"},
+            "max": {"createTime": "2020-01-03T00:00:00"},
+        }
+    ]
+
+
+def test_only_selected_aggregates_are_computed(app, execute, articles):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_engine(app), "before_cursor_execute", listener)
+    try:
+        aggregate(execute, "(groupBy: [AUTHOR_ID])", "max { id }")
+    finally:
+        event.remove(db.get_engine(app), "before_cursor_execute", listener)
+    assert len(statements) == 1
+    assert "max(article.id)" in statements[0]
+    assert "count(" not in statements[0] and "min(" not in statements[0]
+
+
+def test_negative_limit_is_rejected(app, articles):
+    # 直接执行，不经过代价检查
+    result = schema.execute("{ articleAggregate(limit: -1) { count } }", context_value={})
+    assert "limit 不能为负数" in str(result.errors[0])
@@ -0,0 +1,61 @@
+import json
+
+from example_app import app as app_module
+from example_app.scheme import schema
+from example_app.utils.backend import CachedDocumentBackend, query_hash
+
+QUERY = "{ roleList { edges { node { name } } } }"
+
+
+def persisted(sha256):
+    return {"persistedQuery": {"version": 1, "sha256Hash": sha256}}
+
+
+def test_repeated_query_is_a_hit(execute):
+    before = app_module.backend.stats()
+    execute(QUERY)
+    execute(QUERY)
+    after = app_module.backend.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_validation_errors_are_cached(execute):
+    before = app_module.backend.stats()
+    first = execute("{ nope }")
+    second = execute("{ nope }")
+    assert first == second
+    assert 'Cannot query field "nope"' in first["errors"][0]["message"]
+    assert app_module.backend.stats()["hits"] - before["hits"] == 1
+
+
+def test_persisted_query(client):
+    sha256 = query_hash(QUERY)
+    response = client.post("/graphql", json={"extensions": persisted(sha256)})
+    assert response.get_json()["errors"][0]["message"] == "PersistedQueryNotFound"
+    response = client.post("/graphql", json={"query": QUERY, "extensions": persisted(sha256)})
+    assert response.get_json()["data"] == {"roleList": {"edges": []}}
+    response = client.get("/graphql", query_string={"extensions": json.dumps(persisted(sha256))})
+    assert response.get_json()["data"] == {"roleList": {"edges": []}}
+
+
+def test_persisted_query_hash_must_match(client):
+    response = client.post("/graphql", json={"query": QUERY, "extensions": persisted("0" * 64)})
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["message"] == "provided sha does not match query"
+
+
+def test_documents_are_evicted_by_entries_and_bytes():
+    queries = ["{ roleList { edges { node { id } } } }", "{ userList { edges { node { id } } } }", QUERY]
+    backend = CachedDocumentBackend(max_entries=2)
+    assert backend.prewarm(schema, queries) == 3
+    assert backend.get(query_hash(queries[0])) is None
+    assert backend.stats()["entries"] == 2
+    backend = CachedDocumentBackend(max_bytes=len(QUERY) + 10)
+    backend.prewarm(schema, queries)
+    assert backend.stats()["entries"] == 1
+    assert backend.get(query_hash(QUERY)).document_string == QUERY
+    # 大于上限的不缓存
+    backend = CachedDocumentBackend(max_bytes=10)
+    backend.prewarm(schema, [QUERY])
+    assert backend.stats()["entries"] == 0
@@ -0,0 +1,52 @@
+import json
+
+import sqlalchemy
+
+from benchmarks.dataset import generate
+from benchmarks.suite import CATALOG, main, percentile
+
+
+def dump(path):
+    engine = sqlalchemy.create_engine("sqlite:///" + path)
+    with engine.connect() as connection:
+        rows = [
+            connection.execute("SELECT * FROM %s ORDER BY 1, 2" % table).fetchall()
+            for table in ("user", "role", "user_role", "article")
+        ]
+    engine.dispose()
+    return rows
+
+
+def test_dataset_is_reproducible(tmp_path):
+    sizes = dict(users=20, roles=5, articles=50)
+    paths = [str(tmp_path / name) for name in ("a.db", "b.db", "c.db")]
+    for path, seed in zip(paths, (1, 1, 2)):
+        engine = sqlalchemy.create_engine("sqlite:///" + path)
+        result = generate(engine, seed=seed, **sizes)
+        engine.dispose()
+    assert result["users"] == 20 and result["articles"] == 50
+    assert dump(paths[0]) == dump(paths[1])
+    assert dump(paths[0]) != dump(paths[2])
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3], 90) == 3
+    assert percentile([], 50) is None
+
+
+def test_suite_runs_every_operation(app, tmp_path, capsys):
+    output = str(tmp_path / "results.json")
+    main(
+        [
+            "--users", "20", "--roles", "5", "--articles", "50",
+            "--iterations", "2", "--warmup", "1", "--memory-iterations", "1",
+            "--transport", "schema", "--output", output,
+        ]
+    )
+    results = json.load(open(output))["results"]
+    assert [r["name"] for r in results] == [name for name, _, _ in CATALOG]
+    assert [r for r in results if r["errors"]] == []
+    assert all(r["sql_statements"] >= 1 for r in results)
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+from graphene.relay import Node
+from sqlalchemy import func
+
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.utils.changes import prune_tombstones, tombstone
+
+CHANGES = 'query($since: DateTime) { articleChanges(since: $since) { deleted } }'
+
+
+@pytest.fixture
+def tombstones(app):
+    """tombstones of article 1 deleted 40 days ago and article 2 deleted now"""
+    now = db.session.query(func.now()).scalar()
+    db.session.execute(
+        tombstone.insert(),
+        [
+            {"table_name": "article", "row_id": 1, "deleted_at": now - datetime.timedelta(days=40)},
+            {"table_name": "article", "row_id": 2, "deleted_at": now},
+        ],
+    )
+    db.session.commit()
+    return now
+
+
+def remaining():
+    return [row_id for row_id, in db.session.query(tombstone.c.row_id).order_by(tombstone.c.row_id)]
+
+
+def test_prune_tombstones(tombstones):
+    assert prune_tombstones(db.session, 30 * 24 * 3600) == 1
+    db.session.commit()
+    assert remaining() == [2]
+
+
+def test_prune_command(app, tombstones):
+    result = app.test_cli_runner().invoke(args=["graphql-prune-tombstones"])
+    assert "1 tombstones older than 2592000 seconds deleted" in result.output
+    assert remaining() == [2]
+    result = app.test_cli_runner().invoke(args=["graphql-prune-tombstones", "--older-than", "3600"])
+    assert "0 tombstones older than 3600 seconds deleted" in result.output
+
+
+def test_delete_mutation_adds_tombstone(execute, app):
+    db.session.add(User(id=1, name="u", password="p"))
+    db.session.add(Article(id=5, title="t", text="x", author_id=1))
+    db.session.commit()
+    result = execute('mutation { deleteArticle(id: "%s") { ok } }' % Node.to_global_id("ArticleOutputType", 5))
+    assert result["data"]["deleteArticle"]["ok"] is True
+    assert remaining() == [5]
+
+
+def test_since_older_than_retention_is_rejected(execute, tombstones):
+    since = (tombstones - datetime.timedelta(days=31)).isoformat()
+    result = execute(CHANGES, {"since": since})
+    assert "不传 since 重新同步" in result["errors"][0]["message"]
+    since = (tombstones - datetime.timedelta(days=29)).isoformat()
+    assert "errors" not in execute(CHANGES, {"since": since})
+
+
+def test_no_retention_keeps_tombstones(app, execute, tombstones, monkeypatch):
+    monkeypatch.setitem(app.config, "GRAPHQL_TOMBSTONE_RETENTION", None)
+    since = (tombstones - datetime.timedelta(days=50)).isoformat()
+    assert "errors" not in execute(CHANGES, {"since": since})
+    result = app.test_cli_runner().invoke(args=["graphql-prune-tombstones"])
+    assert result.exit_code != 0
+    assert remaining() == [1, 2]
@@ -0,0 +1,57 @@
+import pytest
+from graphql import parse
+
+from example_app.scheme import schema
+from example_app.utils.cost import QueryCostAnalyzer
+
+
+def cost(query, variables=None):
+    return QueryCostAnalyzer().analyze(schema, parse(query), variables=variables)[0]
+
+
+def test_connection_costs_page_size():
+    assert cost("{ articleList(first: 50) { edges { node { id } } } }") == 51
+
+
+def test_nodes_cost_number_of_ids():
+    ids = ", ".join('"id%d"' % i for i in range(500))
+    assert cost("{ nodes(ids: [%s]) { id } }" % ids) == 501
+    assert cost("query($ids: [ID!]!) { nodes(ids: $ids) { id } }", {"ids": ["a"] * 300}) == 301
+
+
+def test_changes_cost_first():
+    assert cost("{ articleChanges(first: 5000) { nodes { id } } }") == 1 + 1 + 5000
+    # first 的默认值 100
+    assert cost("{ articleChanges { nodes { id } } }") == 1 + 1 + 100
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "{ nodes(ids: [%s]) { id } }" % ", ".join('"id%d"' % i for i in range(20000)),
+        "{ articleChanges(first: 20000) { nodes { id } } }",
+    ],
+)
+def test_large_lists_are_rejected(execute, query):
+    result = execute(query)
+    assert "data" not in result or result["data"] is None
+    assert "查询代价" in result["errors"][0]["message"]
+
+
+@pytest.mark.parametrize(
+    "query, variables",
+    [
+        (
+            "{ a: articleList(first: -10000000) { edges { node { id } } } "
+            "b: userList(first: 5000) { edges { node { roles { edges { node { id } } } } } } }",
+            None,
+        ),
+        ("{ articleList(first: -5) { edges { node { id } } } }", None),
+        ("query($n: Int) { articleList(limit: $n) { edges { node { id } } } }", {"n": -1}),
+        ("{ articleChanges(first: -1) { nodes { id } } }", None),
+    ],
+)
+def test_negative_page_sizes_are_rejected(execute, query, variables):
+    result = execute(query, variables)
+    assert "data" not in result or result["data"] is None
+    assert "不能为负数" in result["errors"][0]["message"]
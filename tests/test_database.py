@@ -0,0 +1,70 @@
+import pytest
+import sqlalchemy
+from flask import g
+
+from example_app.database import PRIMARY_COOKIE, REPLICA_BIND
+from example_app.extensions import db
+
+ROLES = "{ roleList { edges { node { name } } } }"
+
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    """a replica database with one role "replica", the primary is empty"""
+    uri = "sqlite:///%s" % (tmp_path / "replica.db")
+    engine = sqlalchemy.create_engine(uri)
+    db.metadata.create_all(engine)
+    engine.execute("INSERT INTO role (id, name) VALUES (1, 'replica')")
+    engine.dispose()
+    monkeypatch.setitem(app.config, "SQLALCHEMY_REPLICA_URIS", [uri])
+    monkeypatch.setitem(app.config, "SQLALCHEMY_BINDS", {REPLICA_BIND % 0: uri})
+    yield
+    db.get_engine(app, bind=REPLICA_BIND % 0).dispose()
+
+
+def names(response):
+    return [edge["node"]["name"] for edge in response.get_json()["data"]["roleList"]["edges"]]
+
+
+def test_queries_read_replica_and_writers_read_primary(app, replica):
+    client = app.test_client()
+    assert names(client.post("/graphql", json={"query": ROLES})) == ["replica"]
+    response = client.post("/graphql", json={"query": 'mutation { createRole(input: {name: "primary"}) { ok } }'})
+    assert response.get_json()["data"]["createRole"]["ok"] is True
+    assert PRIMARY_COOKIE in response.headers["Set-Cookie"]
+    # 刚写过的客户端读主库，其他客户端读副本
+    assert names(client.post("/graphql", json={"query": ROLES})) == ["primary"]
+    # 测试的请求共用 fixture 的 app context，g 不会随请求清空
+    g.pop("primary_until", None)
+    assert names(app.test_client().post("/graphql", json={"query": ROLES})) == ["replica"]
+
+
+def test_without_replicas_everything_uses_the_primary(client):
+    client.post("/graphql", json={"query": 'mutation { createRole(input: {name: "primary"}) { ok } }'})
+    assert names(client.post("/graphql", json={"query": ROLES})) == ["primary"]
+
+
+@pytest.fixture
+def file_engine(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "SQLALCHEMY_DATABASE_URI", "sqlite:///%s" % (tmp_path / "primary.db"))
+    engine = db.get_engine(app)
+    yield engine
+    engine.dispose()
+
+
+def test_sqlite_pragmas(file_engine):
+    with file_engine.connect() as connection:
+        assert connection.execute("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.execute("PRAGMA synchronous").scalar() == 1
+        assert connection.execute("PRAGMA busy_timeout").scalar() == 5000
+    assert file_engine.pool.__class__.__name__ == "QueuePool"
+
+
+def test_connection_of_another_process_is_replaced(file_engine):
+    connection = file_engine.connect()
+    dbapi_connection = connection.connection.connection
+    connection.connection._connection_record.info["pid"] = -1
+    connection.close()
+    with file_engine.connect() as connection:
+        assert connection.connection.connection is not dbapi_connection
+        assert connection.execute("SELECT 1").scalar() == 1
@@ -0,0 +1,33 @@
+import datetime
+import decimal
+import gzip
+import json
+
+import pytest
+
+from example_app import app as app_module
+from example_app.utils.encoder import ResponseEncoder, json_backends, orjson
+
+BACKENDS = [name for name in json_backends if name != "orjson" or orjson is not None]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_decimal_keeps_its_digits(backend):
+    encoder = ResponseEncoder(backend=backend)
+    value = {"price": decimal.Decimal("12345678901234567.10"), "at": datetime.datetime(2020, 1, 2, 3, 4, 5)}
+    assert json.loads(encoder.dumps(value)) == {"price": "12345678901234567.10", "at": "2020-01-02T03:04:05"}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_streamed_encoding_is_the_same_json(backend):
+    encoder = ResponseEncoder(backend=backend, chunk_bytes=16)
+    value = {"data": {"list": {"edges": [{"node": {"id": i, "name": "名字"}} for i in range(20)]}}}
+    assert b"".join(encoder.chunked(encoder.iterencode(value))) == encoder.dumps(value)
+
+
+def test_large_response_is_gzipped(client, execute, monkeypatch):
+    monkeypatch.setattr(app_module.encoder, "compress_min_bytes", 10)
+    query = "{ roleList { totalCount } }"
+    response = client.post("/graphql", json={"query": query}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data)) == execute(query)
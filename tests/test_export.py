@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from example_app.extensions import db
+from example_app.models import Article, User
+
+
+@pytest.fixture
+def articles(app):
+    db.session.add(User(id=1, name="u", password="p"))
+    for i in range(1, 6):
+        db.session.add(Article(id=i, title="t%d" % i, text="x", author_id=1))
+    db.session.commit()
+    db.session.remove()
+
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_export_ndjson(client, articles):
+    response = client.get("/graphql/export/article?fields=id,title&filters=%s" % json.dumps([{"key": "id", "op": ">", "val": 3}]))
+    assert response.status_code == 200
+    assert lines(response) == [{"id": 4, "title": "t4"}, {"id": 5, "title": "t5"}]
+
+
+def test_export_csv_in_small_chunks(app, client, articles, monkeypatch):
+    monkeypatch.setitem(app.config, "GRAPHQL_EXPORT_CHUNK_BYTES", 8)
+    response = client.get("/graphql/export/article?fields=id,title&format=csv")
+    assert response.get_data(as_text=True).splitlines() == ["id,title"] + ["%d,t%d" % (i, i) for i in range(1, 6)]
+
+
+def test_export_limit_is_capped(app, client, articles, monkeypatch):
+    monkeypatch.setitem(app.config, "GRAPHQL_EXPORT_MAX_ROWS", 3)
+    assert len(lines(client.get("/graphql/export/article?fields=id"))) == 3
+    assert len(lines(client.get("/graphql/export/article?fields=id&limit=100"))) == 3
+    assert len(lines(client.get("/graphql/export/article?fields=id&limit=2"))) == 2
+    assert lines(client.get("/graphql/export/article?fields=id&limit=0")) == []
+
+
+@pytest.mark.parametrize("limit", ["-1", "abc", "1.5"])
+def test_invalid_limit_is_rejected(app, client, articles, limit):
+    response = client.get("/graphql/export/article?fields=id&limit=%s" % limit)
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["errors"][0]["message"]
+
+
+def test_invalid_limit_in_json_body_is_rejected(client, articles):
+    response = client.post("/graphql/export/article", json={"fields": ["id"], "limit": [1]})
+    assert response.status_code == 400
@@ -0,0 +1,73 @@
+import pytest
+
+from example_app.extensions import db
+from example_app.models import Article, Role, User
+from example_app.utils import filters as filters_module
+from example_app.utils.filters import FilterPlanCache, compile_filters
+
+QUERY = """
+query($filters: GenericScalar) {
+  articleList(filters: $filters) { edges { node { dbId } } }
+}
+"""
+
+
+@pytest.fixture
+def articles(app):
+    db.session.add(User(id=1, name="u", password="p", roles=[Role(name="admin")]))
+    for i, (title, tags) in enumerate([("t1", "a"), ("t2", "b"), ("x3", "a"), ("x4", None)], 1):
+        db.session.add(Article(id=i, title=title, tags=tags, text="x", author_id=1))
+    db.session.commit()
+    db.session.remove()
+
+
+def ids(execute, filters):
+    result = execute(QUERY, {"filters": filters})
+    assert "errors" not in result, result
+    return [edge["node"]["dbId"] for edge in result["data"]["articleList"]["edges"]]
+
+
+def test_filters_and_or(execute, articles):
+    assert ids(execute, [{"key": "title", "op": "starts", "val": "t"}]) == [1, 2]
+    assert ids(execute, [{"key": "title", "op": "starts", "val": "x"}, {"key": "tags", "op": "==", "val": "a"}]) == [3]
+    assert ids(execute, [[{"key": "id", "op": "<", "val": 2}, {"key": "tags", "op": "in", "val": ["b"]}]]) == [1, 2]
+
+
+def test_filters_relationship_path(execute, articles):
+    db.session.add(User(id=2, name="v", password="p", roles=[Role(name="guest")]))
+    db.session.commit()
+    query = "query($filters: GenericScalar) { userList(filters: $filters) { edges { node { dbId } } } }"
+    result = execute(query, {"filters": [{"key": "roles.name", "op": "==", "val": "admin"}]})
+    assert [edge["node"]["dbId"] for edge in result["data"]["userList"]["edges"]] == [1]
+
+
+def test_plans_are_shared_by_shape():
+    plan = compile_filters(Article, [{"key": "title", "op": "==", "val": "a"}])
+    assert compile_filters(Article, [{"key": "title", "op": "==", "val": "b"}]) is plan
+    assert compile_filters(Article, [{"key": "title", "op": "!=", "val": "a"}]) is not plan
+
+
+@pytest.mark.parametrize(
+    "filters, message",
+    [
+        ([{"key": "nope", "op": "==", "val": 1}], "Article 没有字段 nope"),
+        ([{"key": "nope.name", "op": "==", "val": 1}], "Article 没有关系 nope"),
+        ([{"key": "title", "op": "like", "val": "a"}], "不支持的操作 like"),
+        ([{"key": "title", "op": "=="}], "缺少 val"),
+        ([{"key": "id", "op": "in", "val": 1}], "必须是列表"),
+        ([{"op": "=="}], "缺少 key"),
+        ("title", "过滤条件必须是列表"),
+    ],
+)
+def test_invalid_filters_are_rejected(execute, articles, filters, message):
+    result = execute(QUERY, {"filters": filters})
+    assert result["data"]["articleList"] is None
+    assert message in result["errors"][0]["message"]
+
+
+def test_allow_filters(execute, articles, monkeypatch):
+    monkeypatch.setattr(filters_module, "plan_cache", FilterPlanCache())
+    monkeypatch.setitem(filters_module.filter_columns, Article, frozenset(["title"]))
+    assert ids(execute, [{"key": "title", "op": "==", "val": "t2"}]) == [2]
+    result = execute(QUERY, {"filters": [{"key": "tags", "op": "==", "val": "a"}]})
+    assert "Article.tags 不能过滤，可以过滤: title" in result["errors"][0]["message"]
@@ -0,0 +1,93 @@
+import pytest
+
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.utils.filters import allow_filters, filter_columns, plan_cache
+from example_app.utils.indexes import Proposal, advise, index_usage, indexed_columns, propose
+
+QUERY = """
+{ articleList(filters: [{key: "author_id", op: "==", val: 1}], sort: [TITLE_DESC]) {
+    edges { node { title } } } }
+"""
+SHAPE = {
+    "model": "Article",
+    "filters": [{"key": "author_id", "op": "=="}],
+    "sort": [["title", True], ["id", False]],
+}
+
+
+@pytest.fixture
+def usage(app):
+    index_usage.clear()
+    yield index_usage
+    index_usage.clear()
+
+
+def test_usage_is_recorded_without_values(client, execute, usage):
+    execute(QUERY)
+    execute(QUERY.replace("val: 1", "val: 2"))
+    assert usage.shapes() == [dict(SHAPE, count=2)]
+    assert client.get("/graphql/stats").get_json()["index_usage"] == [dict(SHAPE, count=2)]
+
+
+def test_usage_is_bounded(usage, monkeypatch):
+    monkeypatch.setattr(usage, "max_shapes", 1)
+    usage.record(Article, None, [("id", False)])
+    usage.record(Article, None, [("title", False), ("id", False)])
+    usage.record(Article, None, [("id", False)])
+    assert [s["count"] for s in usage.shapes()] == [2]
+    assert usage.dropped == 1
+
+
+def test_propose():
+    assert propose(Article, SHAPE["filters"], [("title", True), ("id", False)]) == [
+        Proposal(Article, ("author_id", "title", "id"), (False, False, True))
+    ]
+    # 只按主键排序时用范围条件的字段
+    assert propose(Article, [{"key": "create_time", "op": ">"}], [("id", False)]) == [
+        Proposal(Article, ("create_time",), (False,))
+    ]
+    # 已经有的 (update_time, id) 不算
+    assert propose(Article, None, [("id", False)]) == []
+
+
+def test_advise_verifies_the_plan(app):
+    advice, = advise(db.session, [dict(SHAPE, count=3)], [Article, User])
+    assert advice.count == 3 and any("SCAN" in line for line in advice.plan)
+    (proposal, after), = advice.proposals
+    assert proposal.name == "ix_article_author_id_title_id_desc"
+    assert any(proposal.name in line for line in after)
+    # 验证的索引在回滚的事务里，数据库里没有
+    assert proposal.name not in [i["name"] for i in db.inspect(db.engine).get_indexes("article")]
+
+
+def test_existing_index_is_not_proposed(app):
+    shape = {"model": "Article", "filters": [], "sort": [["update_time", False], ["id", False]], "count": 1}
+    advice, = advise(db.session, [shape], [Article])
+    assert advice.proposals == []
+
+
+def test_cli(app, execute, usage):
+    execute(QUERY)
+    result = app.test_cli_runner().invoke(args=["graphql-indexes"])
+    assert result.exit_code == 0, result.output
+    assert 'db.Index("ix_article_author_id_title_id_desc", "author_id", "title", db.text("id DESC"))' in result.output
+    usage.clear()
+    result = app.test_cli_runner().invoke(args=["graphql-indexes"])
+    assert result.exit_code != 0 and "没有使用记录" in result.output
+
+
+@pytest.fixture
+def indexed_only(app):
+    allow_filters(Article, *indexed_columns(Article))
+    yield
+    filter_columns.pop(Article, None)
+    plan_cache.clear()
+
+
+def test_filter_indexed_only(execute, indexed_only):
+    assert indexed_columns(Article) == frozenset(["id", "update_time"])
+    result = execute('{ articleList(filters: [{key: "title", op: "==", val: "t"}]) { edges { node { id } } } }')
+    assert "Article.title 不能过滤" in result["errors"][0]["message"]
+    result = execute('{ articleList(filters: [{key: "id", op: ">", val: 0}]) { edges { node { id } } } }')
+    assert "errors" not in result
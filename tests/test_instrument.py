@@ -0,0 +1,46 @@
+import json
+import logging
+
+from example_app.utils.instrument import RequestTrace, field_path, statement_shape
+
+QUERY = "query Roles { roleList { edges { node { name } } } }"
+
+
+def test_field_path_and_statement_shape():
+    assert field_path(["userList", "edges", 0, "node", "roles"]) == "userList.edges.node.roles"
+    assert statement_shape("SELECT a FROM t\n WHERE id IN (?, ?, ?)") == statement_shape(
+        "SELECT a FROM t WHERE id IN (?)"
+    )
+
+
+def test_repeated_statements_are_reported_as_n_plus_one():
+    trace = RequestTrace()
+    for i in range(6):
+        trace.add_statement("SELECT * FROM role WHERE id IN (%s)" % ", ".join(["?"] * (i + 1)), 0.001)
+    trace.add_statement("SELECT * FROM user", 0.001)
+    summary = trace.summary(slowest=2, n_plus_one_threshold=5)
+    assert summary["sql_count"] == 7
+    assert len(summary["slowest"]) == 2
+    assert summary["n_plus_one"] == [
+        {"statement": "SELECT * FROM role WHERE id IN (?)", "count": 6, "paths": ["(batched)"]}
+    ]
+    assert trace.summary(n_plus_one_threshold=6)["n_plus_one"] == []
+
+
+def test_trace_only_with_debug_header(client):
+    response = client.post("/graphql", json={"query": QUERY})
+    assert "trace" not in response.get_json().get("extensions", {})
+    response = client.post("/graphql", json={"query": QUERY}, headers={"X-GraphQL-Debug": "1"})
+    trace = response.get_json()["extensions"]["trace"]
+    assert trace["sql_count"] == 1
+    assert trace["slowest"][0]["path"] == "roleList"
+    assert "roleList" in [resolver["path"] for resolver in trace["resolvers"]]
+
+
+def test_every_request_is_logged(client, caplog):
+    with caplog.at_level(logging.INFO, logger="example_app.graphql"):
+        client.post("/graphql", json={"query": QUERY, "operationName": "Roles"})
+    lines = [json.loads(r.getMessage()) for r in caplog.records if r.getMessage().startswith("{")]
+    assert lines[-1]["operation"] == "Roles"
+    assert lines[-1]["sql_count"] == 1
+    assert lines[-1]["n_plus_one"] == []
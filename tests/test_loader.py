@@ -0,0 +1,70 @@
+import pytest
+from graphene.relay import Node
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Article, Role, User
+
+
+@pytest.fixture
+def statements(app):
+    found = []
+    engine = db.get_engine(app)
+    listener = lambda conn, cursor, statement, *args: found.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    yield found
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def add_users(count):
+    """users with two roles and one article each"""
+    roles = [Role(id=i, name="r%d" % i) for i in range(1, 4)]
+    for i in range(1, count + 1):
+        db.session.add(User(id=i, name="u%d" % i, password="p", roles=[roles[i % 3], roles[(i + 1) % 3]]))
+        db.session.add(Article(id=i, title="t%d" % i, text="x", author_id=i))
+    db.session.commit()
+    db.session.remove()
+
+
+USER_ROLES = "{ userList { edges { node { name roles { edges { node { name } } } } } } }"
+ROLE_USERS = "{ roleList { edges { node { name users { edges { node { name } } } } } } }"
+ARTICLE_AUTHORS = "{ articleList { edges { node { title author { name } } } } }"
+
+
+@pytest.mark.parametrize("query", [USER_ROLES, ROLE_USERS, ARTICLE_AUTHORS])
+def test_statements_do_not_grow_with_rows(app, execute, statements, query):
+    add_users(2)
+    del statements[:]
+    assert "errors" not in execute(query)
+    # 列表一条，关系一次批量加载
+    assert len(statements) == 2
+    db.session.query(User).delete()
+    db.session.query(Article).delete()
+    db.session.execute("delete from user_role")
+    db.session.query(Role).delete()
+    db.session.commit()
+    add_users(20)
+    del statements[:]
+    assert "errors" not in execute(query)
+    assert len(statements) == 2
+
+
+def test_relationships_are_resolved_per_parent(app, execute):
+    add_users(3)
+    users = execute(USER_ROLES)["data"]["userList"]["edges"]
+    assert [(u["node"]["name"], sorted(r["node"]["name"] for r in u["node"]["roles"]["edges"])) for u in users] == [
+        ("u1", ["r2", "r3"]),
+        ("u2", ["r1", "r3"]),
+        ("u3", ["r1", "r2"]),
+    ]
+    articles = execute(ARTICLE_AUTHORS)["data"]["articleList"]["edges"]
+    assert [(a["node"]["title"], a["node"]["author"]["name"]) for a in articles] == [("t1", "u1"), ("t2", "u2"), ("t3", "u3")]
+
+
+def test_node_is_loaded_once_per_request(app, execute, statements):
+    add_users(2)
+    _id = Node.to_global_id("UserOutputType", 1)
+    del statements[:]
+    result = execute('{ a: node(id: "%s") { id } b: node(id: "%s") { id } }' % (_id, _id))
+    assert result["data"]["a"] == result["data"]["b"] == {"id": _id}
+    assert len(statements) == 1
@@ -0,0 +1,70 @@
+import pytest
+from graphene.relay import Node
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Role, User, user_role
+
+UPDATE = 'mutation($id: ID!, $roles: [ID]) { updateUser(id: $id, input: {name: "u", password: "p", roles: $roles}) { ok message } }'
+
+
+@pytest.fixture
+def user_roles(app):
+    """user 1 with roles 1 and 2, role 3 not assigned"""
+    roles = [Role(id=i, name="r%d" % i) for i in (1, 2, 3)]
+    db.session.add(User(id=1, name="u", password="p", roles=roles[:2]))
+    db.session.add(roles[2])
+    db.session.commit()
+    db.session.remove()
+
+
+@pytest.fixture
+def secondary_statements(app):
+    found = []
+    engine = db.get_engine(app)
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if user_role.name in statement and not statement.startswith("SELECT"):
+            found.append((statement.split()[0], parameters))
+
+    event.listen(engine, "before_cursor_execute", listener)
+    yield found
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def role_ids():
+    return sorted(role_id for _, role_id in db.session.query(user_role.c.user_id, user_role.c.role_id))
+
+
+def update(execute, *roles):
+    variables = {
+        "id": Node.to_global_id("UserOutputType", 1),
+        "roles": [Node.to_global_id("RoleOutputType", role) for role in roles],
+    }
+    return execute(UPDATE, variables)["data"]["updateUser"]
+
+
+def test_only_changed_rows_are_written(execute, user_roles, secondary_statements):
+    assert update(execute, 2, 3)["ok"] is True
+    assert role_ids() == [2, 3]
+    assert [statement for statement, _ in secondary_statements] == ["INSERT", "DELETE"]
+    assert secondary_statements[0][1] == (1, 3)
+
+
+def test_same_roles_write_nothing(execute, user_roles, secondary_statements):
+    assert update(execute, 2, 1)["ok"] is True
+    assert role_ids() == [1, 2]
+    assert secondary_statements == []
+
+
+def test_empty_list_removes_all(execute, user_roles):
+    assert update(execute)["ok"] is True
+    assert role_ids() == []
+
+
+def test_missing_role_changes_nothing(execute, user_roles, secondary_statements):
+    result = update(execute, 3, 9)
+    assert result["ok"] is False
+    assert result["message"] == "关联数据不存在: %s" % Node.to_global_id("RoleOutputType", 9)
+    assert role_ids() == [1, 2]
+    assert secondary_statements == []
@@ -0,0 +1,81 @@
+import pytest
+from graphene.relay import Node
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Role
+
+
+@pytest.fixture
+def statements(app):
+    found = []
+    engine = db.get_engine(app)
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        found.append((statement.split()[0], executemany))
+
+    event.listen(engine, "before_cursor_execute", listener)
+    yield found
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def inputs(*names):
+    return "[%s]" % ", ".join('{name: "%s"}' % name for name in names)
+
+
+def test_bulk_create_is_one_executemany(execute, statements):
+    result = execute("mutation { createRoles(inputs: %s) { ok results { ok } } }" % inputs(*"abcde"))
+    assert result["data"]["createRoles"]["ok"] is True
+    assert [s for s in statements if s[0] == "INSERT"] == [("INSERT", True)]
+    assert sorted(r.name for r in Role.query) == list("abcde")
+
+
+def test_bulk_create_outputs_new_rows(execute, statements):
+    result = execute(
+        "mutation { createRoles(inputs: %s) { ok results { ok output { name dbId } } } }" % inputs("a", "b")
+    )
+    outputs = [item["output"] for item in result["data"]["createRoles"]["results"]]
+    assert [o["name"] for o in outputs] == ["a", "b"]
+    assert [o["dbId"] for o in outputs] == [r.id for r in Role.query.order_by(Role.id)]
+
+
+def test_bulk_create_reports_invalid_items(execute):
+    result = execute(
+        'mutation { createArticles(inputs: [{title: "t", text: "x"}]) { ok results { ok message } } }'
+    )
+    assert result["data"]["createArticles"]["ok"] is False
+    assert result["data"]["createArticles"]["results"] == [{"ok": False, "message": "缺少字段: author_id"}]
+
+
+@pytest.fixture
+def role_id(app):
+    role = Role(name="a")
+    db.session.add(role)
+    db.session.commit()
+    _id = Node.to_global_id("RoleOutputType", role.id)
+    db.session.remove()
+    return _id
+
+
+def test_bulk_delete_forgets_loaded_rows(execute, role_id):
+    result = execute(
+        'mutation { a: updateRole(id: "%s", input: {name: "b"}) { ok } '
+        'b: deleteRoles(ids: ["%s"]) { ok } '
+        'c: updateRole(id: "%s", input: {name: "c"}) { ok message } }' % (role_id, role_id, role_id)
+    )
+    assert result["data"]["b"]["ok"] is True
+    assert result["data"]["c"] == {"ok": False, "message": "要操作的数据不存在"}
+    assert Role.query.count() == 0
+
+
+@pytest.mark.parametrize("unit_of_work", [False, True])
+def test_bulk_update_reloads_loaded_rows(app, execute, role_id, monkeypatch, unit_of_work):
+    monkeypatch.setitem(app.config, "GRAPHQL_UNIT_OF_WORK", unit_of_work)
+    result = execute(
+        'mutation { a: updateRole(id: "%s", input: {name: "b"}) { ok } '
+        'b: updateRoles(inputs: [{id: "%s", input: {name: "c"}}]) { ok } '
+        'c: updateRole(id: "%s", input: {}) { ok output { name } } }' % (role_id, role_id, role_id)
+    )
+    assert result["data"]["b"]["ok"] is True
+    assert result["data"]["c"] == {"ok": True, "output": {"name": "c"}}
+    assert [r.name for r in Role.query] == ["c"]
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Article, User
+
+
+@pytest.fixture
+def selects(app, monkeypatch):
+    """SELECT statements, list pages load ORM instances (no row path)"""
+    monkeypatch.setitem(app.config, "GRAPHQL_ROW_PATH", False)
+    db.session.add(User(id=1, name="u", password="p"))
+    db.session.add(Article(id=1, title="t", description="d", text="x", author_id=1))
+    db.session.commit()
+    db.session.remove()
+    found = []
+    engine = db.get_engine(app)
+
+    def listener(conn, cursor, statement, *args):
+        if statement.startswith("SELECT"):
+            found.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    yield found
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def selected_columns(statement):
+    return statement[len("SELECT"):statement.index("FROM")]
+
+
+def test_only_selected_columns_are_loaded(execute, selects):
+    result = execute("{ articleList { edges { node { title } } } }")
+    assert result["data"]["articleList"]["edges"] == [{"node": {"title": "t"}}]
+    columns = selected_columns(selects[0])
+    assert "article.title" in columns and "article.id" in columns
+    assert "article.text" not in columns and "article.description" not in columns
+
+
+def test_fragments_are_merged(execute, selects):
+    result = execute(
+        "{ articleList { edges { node { ...a ... on ArticleOutputType { description } } } } } "
+        "fragment a on ArticleOutputType { text }"
+    )
+    assert result["data"]["articleList"]["edges"] == [{"node": {"text": "x", "description": "d"}}]
+    columns = selected_columns(selects[0])
+    assert "article.text" in columns and "article.description" in columns
+    assert "article.title" not in columns
+
+
+def test_sort_columns_are_loaded_for_cursors(execute, selects):
+    result = execute("{ articleList(sort: [TITLE_ASC]) { edges { cursor node { text } } } }")
+    assert result["data"]["articleList"]["edges"][0]["cursor"]
+    assert "article.title" in selected_columns(selects[0])
+
+
+def test_relationship_selection_loads_only_its_columns(execute, selects):
+    result = execute("{ userList { edges { node { name roles { edges { node { name } } } } } } }")
+    assert "errors" not in result
+    assert "user.password" not in selected_columns(selects[0])
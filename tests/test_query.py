@@ -0,0 +1,129 @@
+import pytest
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.scheme import schema
+
+PAGE = """
+query($sort: [ArticleOutputTypeSortEnum], $first: Int, $after: String, $last: Int, $before: String) {
+  articleList(sort: $sort, first: $first, after: $after, last: $last, before: $before) {
+    edges { cursor node { dbId description } }
+    pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+  }
+}
+"""
+DESCRIPTIONS = ["b", None, "a", "c", None, "a", "b", None]
+
+
+@pytest.fixture
+def articles(app):
+    db.session.add(User(id=1, name="u", password="p"))
+    for i, description in enumerate(DESCRIPTIONS, 1):
+        db.session.add(Article(id=i, title="t%d" % i, description=description, text="x", author_id=1))
+    db.session.commit()
+    db.session.remove()
+
+
+def expected(desc):
+    # NULL 最小，相同值按 dbId 升序
+    values = sorted(set(d for d in DESCRIPTIONS if d is not None), reverse=desc)
+    values = values + [None] if desc else [None] + values
+    return [i for value in values for i, d in enumerate(DESCRIPTIONS, 1) if d == value]
+
+
+def page(execute, **variables):
+    result = execute(PAGE, variables)
+    assert "errors" not in result, result
+    return result["data"]["articleList"]
+
+
+@pytest.mark.parametrize("sort", ["DESCRIPTION_ASC", "DESCRIPTION_DESC"])
+def test_keyset_pages_forward_over_null_values(execute, articles, sort):
+    ids, after = [], None
+    while True:
+        connection = page(execute, sort=[sort], first=3, after=after)
+        ids += [edge["node"]["dbId"] for edge in connection["edges"]]
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = connection["pageInfo"]["endCursor"]
+    assert ids == [edge["node"]["dbId"] for edge in page(execute, sort=[sort])["edges"]]
+    assert ids == expected(sort.endswith("DESC"))
+
+
+@pytest.mark.parametrize("sort", ["DESCRIPTION_ASC", "DESCRIPTION_DESC"])
+def test_keyset_pages_backward_over_null_values(execute, articles, sort):
+    ids, before = [], None
+    while True:
+        connection = page(execute, sort=[sort], last=3, before=before)
+        ids = [edge["node"]["dbId"] for edge in connection["edges"]] + ids
+        if not connection["pageInfo"]["hasPreviousPage"]:
+            break
+        before = connection["pageInfo"]["startCursor"]
+    assert ids == expected(sort.endswith("DESC"))
+
+
+def test_offset_page_has_next_page(execute, articles):
+    query = "{ articleList(limit: %d, offset: %d) { edges { node { dbId } } pageInfo { hasNextPage hasPreviousPage } } }"
+    connection = execute(query % (3, 3))["data"]["articleList"]
+    assert [edge["node"]["dbId"] for edge in connection["edges"]] == [4, 5, 6]
+    assert connection["pageInfo"] == {"hasNextPage": True, "hasPreviousPage": True}
+    connection = execute(query % (3, 5))["data"]["articleList"]
+    assert [edge["node"]["dbId"] for edge in connection["edges"]] == [6, 7, 8]
+    assert connection["pageInfo"] == {"hasNextPage": False, "hasPreviousPage": True}
+    connection = execute(query % (3, 0))["data"]["articleList"]
+    assert connection["pageInfo"] == {"hasNextPage": True, "hasPreviousPage": False}
+
+
+@pytest.mark.parametrize("argument", ["first", "last", "limit", "offset"])
+def test_negative_page_arguments_are_rejected(app, articles, argument):
+    # 直接执行，不经过代价检查
+    result = schema.execute("{ articleList(%s: -5) { edges { node { dbId } } } }" % argument, context_value={})
+    assert result.data["articleList"] is None
+    assert "分页参数 %s 不能为负数: -5" % argument in str(result.errors[0])
+
+
+@pytest.fixture
+def statements(app):
+    found = []
+    engine = db.get_engine(app)
+    listener = lambda conn, cursor, statement, *args: found.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    yield found
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+@pytest.mark.parametrize("arguments", ["offset: 5", "first: 2, offset: 2", "limit: 2, offset: 2"])
+def test_offset_page_counts_only_for_total_count(execute, articles, statements, arguments):
+    query = "{ articleList(%s) { %s edges { node { dbId } } pageInfo { hasNextPage } } }"
+    connection = execute(query % (arguments, ""))["data"]["articleList"]
+    assert not [s for s in statements if "count(" in s.lower()]
+    assert len(statements) == 1
+    if arguments == "offset: 5":
+        assert [edge["node"]["dbId"] for edge in connection["edges"]] == [6, 7, 8]
+        assert connection["pageInfo"]["hasNextPage"] is False
+    else:
+        assert [edge["node"]["dbId"] for edge in connection["edges"]] == [3, 4]
+        assert connection["pageInfo"]["hasNextPage"] is True
+    del statements[:]
+    connection = execute(query % (arguments, "totalCount"))["data"]["articleList"]
+    assert connection["totalCount"] == 8
+    assert len([s for s in statements if "count(" in s.lower()]) == 1
+
+
+def test_offset_pages_follow_after_cursors(execute, articles):
+    query = "query($after: String) { articleList(offset: 1, first: 3, after: $after) { edges { node { dbId } } pageInfo { endCursor hasNextPage hasPreviousPage } } }"
+    ids, after = [], None
+    for _ in range(5):
+        connection = execute(query, {"after": after})["data"]["articleList"]
+        ids += [edge["node"]["dbId"] for edge in connection["edges"]]
+        assert connection["pageInfo"]["hasPreviousPage"] is True
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = connection["pageInfo"]["endCursor"]
+    assert ids == list(range(2, 9))
+
+
+def test_offset_pages_from_the_end(execute, articles):
+    connection = execute("{ articleList(offset: 0, last: 2) { edges { node { dbId } } } }")["data"]["articleList"]
+    assert [edge["node"]["dbId"] for edge in connection["edges"]] == [7, 8]
@@ -0,0 +1,48 @@
+import pytest
+
+from example_app import app as app_module
+from example_app.utils.cache import invalidation_hooks
+from example_app.utils.result_cache import LRUBackend, ResultCache
+
+ROLES = "{ roleList { totalCount edges { node { name } } } }"
+
+
+@pytest.fixture
+def result_cache(app):
+    cache = ResultCache(LRUBackend(max_bytes=1024 * 1024), ttl=60)
+    app_module.backend.result_cache = cache
+    # 缓存的文档带着创建时的 result_cache
+    app_module.backend.clear()
+    invalidation_hooks.append(cache.invalidate)
+    yield cache
+    invalidation_hooks.remove(cache.invalidate)
+
+
+def names(result):
+    return [edge["node"]["name"] for edge in result["data"]["roleList"]["edges"]]
+
+
+def test_repeated_query_is_a_hit(result_cache, execute):
+    assert execute(ROLES) == execute(ROLES)
+    assert (result_cache.hits, result_cache.stores) == (1, 1)
+
+
+def test_mutation_invalidates_cached_list(result_cache, execute):
+    assert names(execute(ROLES)) == []
+    assert execute('mutation { createRole(input: {name: "a"}) { ok } }')["data"]["createRole"]["ok"]
+    assert names(execute(ROLES)) == ["a"]
+    assert execute('mutation { createRoles(inputs: [{name: "b"}]) { ok } }')["data"]["createRoles"]["ok"]
+    assert names(execute(ROLES)) == ["a", "b"]
+    assert result_cache.hits == 0
+
+
+def test_mutation_invalidates_with_unit_of_work(app, monkeypatch, result_cache, execute):
+    monkeypatch.setitem(app.config, "GRAPHQL_UNIT_OF_WORK", True)
+    execute(ROLES)
+    execute('mutation { a: createRole(input: {name: "a"}) { ok } b: createRole(input: {name: "b"}) { ok } }')
+    assert names(execute(ROLES)) == ["a", "b"]
+
+
+def test_result_cache_needs_a_shared_backend_by_default(app):
+    assert app.config["GRAPHQL_RESULT_CACHE"] is None
+    assert app.config["GRAPHQL_RESULT_CACHE_REDIS_URL"] or app_module.result_cache is None
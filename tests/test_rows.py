@@ -0,0 +1,66 @@
+import pytest
+
+from example_app.extensions import db
+from example_app.models import Article, Role, User
+from example_app.utils import query as query_module
+from example_app.utils.rows import Record, record_class, row_columns
+
+
+@pytest.fixture
+def fetched(app, monkeypatch):
+    """what every list page was read as, records or model instances"""
+    db.session.add(User(id=1, name="u", password="p"))
+    db.session.add(Role(id=1, name="r"))
+    for i in range(1, 4):
+        db.session.add(Article(id=i, title="t%d" % i, description="d", text="x", author_id=1))
+    db.session.commit()
+    db.session.remove()
+    found = []
+    fetch = query_module.CustomConnectionField.fetch.__func__
+
+    def spy(cls, *args):
+        rows = fetch(cls, *args)
+        found.extend(rows)
+        return rows
+
+    monkeypatch.setattr(query_module.CustomConnectionField, "fetch", classmethod(spy))
+    return found
+
+
+QUERY = "{ articleList(sort: [TITLE_DESC]) { edges { cursor node { id dbId title } } } }"
+
+
+def test_column_lists_read_records(execute, fetched):
+    result = execute(QUERY)
+    assert [e["node"]["title"] for e in result["data"]["articleList"]["edges"]] == ["t3", "t2", "t1"]
+    assert fetched and all(isinstance(row, Record) for row in fetched)
+    assert not any(isinstance(row, Article) for row in db.session.identity_map.values())
+
+
+def test_results_match_without_row_path(app, execute, fetched, monkeypatch):
+    with_rows = execute(QUERY)
+    monkeypatch.setitem(app.config, "GRAPHQL_ROW_PATH", False)
+    del fetched[:]
+    assert execute(QUERY) == with_rows
+    assert all(isinstance(row, Article) for row in fetched)
+
+
+def test_relationships_use_instances(execute, fetched):
+    result = execute("{ userList { edges { node { name roles { edges { node { name } } } } } } }")
+    assert "errors" not in result, result
+    assert any(isinstance(row, User) for row in fetched)
+
+
+def test_row_columns():
+    assert row_columns(Article, {"title": {}, "dbId": {}}, ["update_time"]) == ["id", "title", "update_time"]
+    assert row_columns(User, {"name": {}, "roles": {}}) is None
+    assert row_columns(User, {"roleNames": {}}) is None
+
+
+def test_record_class():
+    cls = record_class(Article, ["id", "title"])
+    assert record_class(Article, ["id", "title"]) is cls
+    record = tuple.__new__(cls, (7, "t"))
+    assert (record.id, record.db_id, record.title, record.primary_key()) == (7, 7, "t", 7)
+    with pytest.raises(AttributeError):
+        record.title = "x"
@@ -0,0 +1,72 @@
+import pytest
+
+from example_app.extensions import db
+from example_app.models import Article, User
+from example_app.utils.search import search_indexes, search_terms
+
+SEARCH = "query($q: String!, $match: Boolean) { articleSearch(query: $q, match: $match) { edges { node { dbId } } } }"
+FILTER = "query($filters: GenericScalar) { articleList(filters: $filters) { edges { node { dbId } } } }"
+
+
+@pytest.fixture
+def articles(app):
+    db.session.add(User(id=1, name="u", password="p"))
+    db.session.add(Article(id=1, title="cooking", text="graphql is mentioned in the text", author_id=1))
+    db.session.add(Article(id=2, title="graphql servers", text="about servers", author_id=1))
+    db.session.add(Article(id=3, title="flask", text="nothing here", tags="graphql", author_id=1))
+    db.session.commit()
+    db.session.remove()
+
+
+def ids(result, field):
+    assert "errors" not in result, result
+    return [edge["node"]["dbId"] for edge in result["data"][field]["edges"]]
+
+
+def test_search_terms_are_quoted():
+    assert search_terms('say "hi" now') == '"say" """hi""" "now"'
+
+
+def test_search_is_ranked_by_column_weight(execute, articles):
+    # title 10, tags 5, text 1
+    assert ids(execute(SEARCH, {"q": "graphql"}), "articleSearch") == [2, 3, 1]
+    assert ids(execute(SEARCH, {"q": "graphql servers"}), "articleSearch") == [2]
+    assert ids(execute(SEARCH, {"q": "graph*", "match": True}), "articleSearch") == [2, 3, 1]
+
+
+def test_index_follows_writes(app, execute, articles):
+    article = Article.query.get(2)
+    article.title = "renamed"
+    db.session.delete(Article.query.get(3))
+    db.session.commit()
+    assert ids(execute(SEARCH, {"q": "graphql"}), "articleSearch") == [1]
+    assert ids(execute(SEARCH, {"q": "renamed"}), "articleSearch") == [2]
+
+
+def test_search_filters(execute, articles):
+    assert ids(execute(FILTER, {"filters": [{"key": "title", "op": "search", "val": "graphql"}]}), "articleList") == [2]
+    assert ids(execute(FILTER, {"filters": [{"key": "text", "op": "match", "val": "ment*"}]}), "articleList") == [1]
+
+
+@pytest.mark.parametrize(
+    "query, variables, message",
+    [
+        (SEARCH, {"q": "  "}, "搜索内容不能为空"),
+        (FILTER, {"filters": [{"key": "title", "op": "search", "val": " "}]}, "搜索内容不能为空"),
+        (
+            "query($filters: GenericScalar) { userList(filters: $filters) { edges { node { id } } } }",
+            {"filters": [{"key": "name", "op": "search", "val": "u"}]},
+            "User.name 没有全文索引",
+        ),
+    ],
+)
+def test_invalid_searches_are_rejected(execute, articles, query, variables, message):
+    assert message in execute(query, variables)["errors"][0]["message"]
+
+
+def test_rebuild_indexes_existing_rows(app, articles):
+    index = search_indexes[Article]
+    with db.engine.begin() as connection:
+        index.drop(connection)
+        assert index.rebuild(connection) == 3
+    assert [a.id for a in Article.query.filter(index.condition(search_terms("servers")))] == [2]
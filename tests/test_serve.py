@@ -0,0 +1,42 @@
+import logging
+import multiprocessing
+
+import pytest
+
+pytest.importorskip("gunicorn")
+
+from example_app import serve  # noqa: E402
+from example_app.extensions import db  # noqa: E402
+from example_app.utils.result_cache import LRUBackend, ResultCache  # noqa: E402
+
+
+def test_options_from_config(app, monkeypatch):
+    monkeypatch.setitem(app.config, "GRAPHQL_WORKERS", 3)
+    monkeypatch.setitem(app.config, "GRAPHQL_WORKER_THREADS", 4)
+    options = serve.server_options(app)
+    config = serve.GraphQLServer(app, options).cfg
+    assert (config.workers, config.threads, config.graceful_timeout) == (3, 4, 30)
+    assert config.preload_app
+    monkeypatch.setitem(app.config, "GRAPHQL_WORKERS", 0)
+    assert serve.server_options(app)["workers"] == multiprocessing.cpu_count()
+
+
+@pytest.mark.parametrize("hook", ["pre_fork", "post_fork"])
+def test_fork_hooks_dispose_engines(app, hook):
+    engine = db.get_engine(app)
+    pool = engine.pool
+    serve.server_options(app)[hook](None, None)
+    assert engine.pool is not pool
+
+
+def test_local_result_cache_warns(monkeypatch, caplog):
+    monkeypatch.setattr(serve, "result_cache", ResultCache(LRUBackend(), ttl=60))
+    with caplog.at_level(logging.WARNING, logger=serve.__name__):
+        serve.check_result_cache(1)
+        assert not caplog.records
+        serve.check_result_cache(4)
+    assert "4 个进程之间不会互相失效" in caplog.records[0].getMessage()
+    caplog.clear()
+    monkeypatch.setattr(serve, "result_cache", None)
+    serve.check_result_cache(4)
+    assert not caplog.records
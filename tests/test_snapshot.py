@@ -0,0 +1,30 @@
+import logging
+
+from example_app.scheme import schema
+from example_app.utils import snapshot as snapshot_module
+from example_app.utils.snapshot import prewarm, read_snapshot, schema_snapshot, write_snapshot
+
+
+def test_prewarm_without_snapshot_does_not_print_the_schema(monkeypatch):
+    def fail(schema):
+        raise AssertionError("schema_snapshot 不应该被调用")
+
+    monkeypatch.setattr(snapshot_module, "schema_snapshot", fail)
+    assert prewarm(schema) is True
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "schema.json")
+    written = write_snapshot(schema, path)
+    assert read_snapshot(path) == written
+    assert written["types"]["ArticleOutputType"]["kind"] == "OBJECT"
+    assert prewarm(schema, read_snapshot(path)) is True
+
+
+def test_stale_snapshot_is_reported(caplog):
+    stale = schema_snapshot(schema)
+    stale["hash"] = "0"
+    stale["types"]["ArticleOutputType"] = {"kind": "OBJECT", "fields": {}}
+    with caplog.at_level(logging.WARNING, logger="example_app.graphql"):
+        assert prewarm(schema, stale) is False
+    assert "changed types: ArticleOutputType" in caplog.text
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import event
+
+from example_app.extensions import db
+from example_app.models import Article, Role
+
+THREE_ROLES = "mutation { %s }" % " ".join(
+    'r%d: createRole(input: {name: "r%d"}) { ok }' % (i, i) for i in range(3)
+)
+
+
+@pytest.fixture
+def commits(app):
+    found = []
+    engine = db.get_engine(app)
+    listener = lambda connection: found.append("COMMIT")
+    event.listen(engine, "commit", listener)
+    yield found
+    event.remove(engine, "commit", listener)
+
+
+@pytest.fixture
+def unit_of_work(app, monkeypatch):
+    monkeypatch.setitem(app.config, "GRAPHQL_UNIT_OF_WORK", True)
+
+
+def test_fields_commit_one_by_one_without_unit_of_work(execute, commits):
+    result = execute(THREE_ROLES)
+    assert [field["ok"] for field in result["data"].values()] == [True, True, True]
+    assert len(commits) == 3
+
+
+def test_fields_commit_once_with_unit_of_work(unit_of_work, execute, commits):
+    result = execute(THREE_ROLES)
+    assert [field["ok"] for field in result["data"].values()] == [True, True, True]
+    assert len(commits) == 1
+    assert sorted(r.name for r in Role.query) == ["r0", "r1", "r2"]
+
+
+def test_failed_flush_rolls_back_only_its_field(unit_of_work, execute):
+    # author_id 不能为空，释放 savepoint 时 flush 失败
+    result = execute(
+        'mutation { a: createArticle(input: {title: "t", text: "x"}) { ok message } '
+        'b: createRole(input: {name: "u2"}) { ok } }'
+    )
+    assert "errors" not in result
+    assert result["data"]["a"]["ok"] is False
+    assert "NOT NULL" in result["data"]["a"]["message"]
+    assert result["data"]["b"]["ok"] is True
+    assert [r.name for r in Role.query] == ["u2"]
+    assert Article.query.count() == 0
+
+
+def test_failed_field_between_good_fields(unit_of_work, execute):
+    result = execute(
+        'mutation { a: createRole(input: {name: "a"}) { ok } '
+        'b: createArticle(input: {title: "t", text: "x"}) { ok } '
+        'c: createRole(input: {name: "c"}) { ok } }'
+    )
+    assert [result["data"][k]["ok"] for k in "abc"] == [True, False, True]
+    assert sorted(r.name for r in Role.query) == ["a", "c"]